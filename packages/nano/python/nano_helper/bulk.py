@@ -0,0 +1,524 @@
+"""Bulk service actions.
+
+Note
+----
+`/nano/bulk-create` and `/nano/bulk-approve` apply changes to many
+services in chunks, one transaction per chunk, instead of one commit per
+service. A job with its items and progress is saved in the package state
+directory after every chunk, so a failed job is resumed with the `job`
+input and continues after the last committed chunk; the file is removed
+when the job is done. Changes are idempotent: existing services and
+approved services are skipped.
+
+`/nano/bulk-delete` plans its chunks when a job is created: services
+sharing a device, directly or through other services, form a lane, and
+lanes are cut into chunks. Lanes run in parallel, at most `max-parallel`
+at once, chunks of a lane one after another, so teardown transactions
+of different devices don't wait for each other and the job takes about
+as long as its slowest device. Completed chunks are saved, a resumed
+job runs the remaining ones.
+
+A chunk with services in commit-queue mode is committed through commit
+queues, see `commitqueue.apply_trans`.
+"""
+# pylint:disable=too-many-arguments, too-many-locals
+import json
+import re
+import threading
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from os import path, remove
+from typing import Any, Optional
+
+import ncs  # type: ignore
+from ncs.dp import Action  # type: ignore
+
+from .commitqueue import apply_trans, use_commit_queue
+from .nano_cb import service_devices
+from .state import state_path
+
+JOB_FILE = "bulk-{}.json"
+SERVICES_XPATH = "/nano:nano/nano:nano"
+DEVICES_XPATH = "/ncs:devices/ncs:device"
+SERVICE_KP_RE = re.compile(r"^/nano:nano/nano\{(?P<id>[^}]+)\}$")
+DEVICE_KP_RE = re.compile(r"^/ncs:devices/device\{(?P<name>[^}]+)\}$")
+
+
+def job_file(job_id: str) -> str:
+    """Return a path of a job file.
+
+    Parameters
+    ----------
+    job_id : str
+        job id
+
+    Returns
+    -------
+    str
+        file path in the package state directory
+    """
+    return state_path(JOB_FILE.format(job_id))
+
+
+def save_job(job: dict[str, Any]) -> None:
+    """Save a job.
+
+    Parameters
+    ----------
+    job : dict[str, Any]
+        job id, operation, items and the number of done items
+    """
+    with open(job_file(job["id"]), "w", encoding="utf-8") as fp:
+        json.dump(job, fp)
+
+
+def load_job(job_id: str, operation: str) -> dict[str, Any]:
+    """Load a job to resume it.
+
+    Parameters
+    ----------
+    job_id : str
+        job id
+    operation : str
+        expected operation, e.g. bulk-create
+
+    Returns
+    -------
+    dict[str, Any]
+        job id, operation, items and the number of done items
+
+    Raises
+    ------
+    ValueError
+        If the job doesn't exist or belongs to another operation
+    """
+    if not path.isfile(job_file(job_id)):
+        raise ValueError(f"Error: job '{job_id}' doesn't exist.")
+    with open(job_file(job_id), encoding="utf-8") as fp:
+        job = json.load(fp)
+    if job["operation"] != operation:
+        raise ValueError(f"Error: job '{job_id}' is a {job['operation']} job.")
+    return job
+
+
+def xpath_select(trans: ncs.maapi.Transaction, xpath: str, kp_re: re.Pattern) -> list[str]:
+    """Return keys of list entries matching an XPath expression.
+
+    Parameters
+    ----------
+    trans : ncs.maapi.Transaction
+        a transaction
+    xpath : str
+        XPath expression selecting list entries
+    kp_re : re.Pattern
+        regex extracting a key from an entry keypath
+
+    Returns
+    -------
+    list[str]
+        keys in document order
+    """
+    keys: list[str] = []
+
+    def collect(kp: ncs.HKeypathRef, _value: Any) -> int:
+        match = kp_re.match(str(kp))
+        if match:
+            keys.append(match.group(1))
+        return ncs.ITER_CONTINUE
+
+    trans.xpath_eval(xpath, collect, None, "/")
+    return keys
+
+
+def create_services(root: ncs.maagic.Root, items: list[list[str]]) -> int:
+    """Create services, existing services are skipped.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node of a write transaction
+    items : list[list[str]]
+        id, device and name server, the name server may be empty
+
+    Returns
+    -------
+    int
+        number of created services
+    """
+    services = root.nano__nano.nano
+    created = 0
+    for svc_id, device, name_server in items:
+        if svc_id in services:
+            continue
+        service = services.create(svc_id)
+        service.device = device
+        if name_server:
+            service.name_server = name_server
+        created += 1
+    return created
+
+
+def approve_services(root: ncs.maagic.Root, items: list[str]) -> int:
+    """Approve services, approved and deleted services are skipped.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node of a write transaction
+    items : list[str]
+        service ids
+
+    Returns
+    -------
+    int
+        number of approved services
+    """
+    services = root.nano__nano.nano
+    approved = 0
+    for svc_id in items:
+        if svc_id in services and not services[svc_id].approved:
+            services[svc_id].approved = True
+            approved += 1
+    return approved
+
+
+def delete_services(root: ncs.maagic.Root, items: list[str]) -> int:
+    """Delete services, deleted services are skipped.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node of a write transaction
+    items : list[str]
+        service ids
+
+    Returns
+    -------
+    int
+        number of deleted services
+    """
+    services = root.nano__nano.nano
+    deleted = 0
+    for svc_id in items:
+        if svc_id in services:
+            del services[svc_id]
+            deleted += 1
+    return deleted
+
+
+def chunk_queued(root: ncs.maagic.Root, items: list[Any]) -> bool:
+    """Check if a chunk is committed through commit queues.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node of a write transaction
+    items : list[Any]
+        service ids, or lists starting with a service id
+
+    Returns
+    -------
+    bool
+        True if any existing service of the chunk is in commit-queue mode
+    """
+    services = root.nano__nano.nano
+    svc_ids = [item[0] if isinstance(item, list) else item for item in items]
+    return any(use_commit_queue(root, services[svc_id]) for svc_id in svc_ids if svc_id in services)
+
+
+def apply_chunk(
+    trans: ncs.maapi.Transaction,
+    operation: Callable[[ncs.maagic.Root, list[Any]], int],
+    items: list[Any],
+) -> int:
+    """Apply an operation to a chunk and commit it.
+
+    Parameters
+    ----------
+    trans : ncs.maapi.Transaction
+        a write transaction
+    operation : Callable[[ncs.maagic.Root, list[Any]], int]
+        one of `OPERATIONS`
+    items : list[Any]
+        chunk items
+
+    Returns
+    -------
+    int
+        number of changed services
+    """
+    root = ncs.maagic.get_root(trans)
+    # deleted services are checked before, created services after the change
+    queued = chunk_queued(root, items)
+    changed = operation(root, items)
+    apply_trans(trans, queued or chunk_queued(root, items))
+    return changed
+
+
+OPERATIONS: dict[str, Callable[[ncs.maagic.Root, list[Any]], int]] = {
+    "bulk-create": create_services,
+    "bulk-approve": approve_services,
+    "bulk-delete": delete_services,
+}
+
+
+def plan_chunks(root: ncs.maagic.Root, items: list[str], chunk_size: int) -> list[list[Any]]:
+    """Split services into chunks of device lanes.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+    items : list[str]
+        service ids
+    chunk_size : int
+        services per chunk
+
+    Returns
+    -------
+    list[list[Any]]
+        lane number and service ids of chunks, the largest lane first;
+        services without devices share one lane
+    """
+    services = root.nano__nano.nano
+    parent: dict[str, str] = {}
+
+    def find(device: str) -> str:
+        while parent[device] != device:
+            parent[device] = parent[parent[device]]
+            device = parent[device]
+        return device
+
+    svc_devices = {}
+    for svc_id in dict.fromkeys(items):
+        devices = service_devices(root, services[svc_id]) if svc_id in services else []
+        svc_devices[svc_id] = devices or [""]
+        for device in svc_devices[svc_id]:
+            parent.setdefault(device, device)
+            parent[find(device)] = find(svc_devices[svc_id][0])
+    lanes: dict[str, list[str]] = {}
+    for svc_id, devices in svc_devices.items():
+        lanes.setdefault(find(devices[0]), []).append(svc_id)
+    chunks = []
+    for lane, svc_ids in enumerate(sorted(lanes.values(), key=len, reverse=True)):
+        for start in range(0, len(svc_ids), chunk_size):
+            chunks.append([lane, svc_ids[start : start + chunk_size]])
+    return chunks
+
+
+class BulkAction(Action):
+    """Create, approve or delete many services in chunked transactions."""
+
+    @Action.action
+    def cb_action(
+        self,
+        uinfo: ncs.UserInfo,
+        name: str,
+        kp: ncs.HKeypathRef,
+        a_input: ncs.maagic.ActionParams,
+        a_output: ncs.maagic.ActionParams,
+        trans: ncs.maapi.Transaction,
+    ) -> Any:
+        """Execute an action.
+
+        Parameters
+        ----------
+        uinfo : ncs.UserInfo
+            a UserInfo object
+        name : str
+            the tailf:action name
+        kp : ncs.HKeypathRef
+            the keypath of the action (HKeypathRef)
+        a_input : ncs.maagic.ActionParams
+            input node
+        a_output : ncs.maagic.ActionParams
+            output node
+        trans : ncs.maapi.Transaction
+            read only transaction, same as action transaction if
+            executed with an action context.
+
+        Returns
+        -------
+        Optional[Union[ncs.CONFD_OK, ncs.CONFD_ERR]]
+        """
+        try:
+            if a_input.job:
+                job = load_job(str(a_input.job), name)
+            else:
+                job = {
+                    "id": uuid.uuid4().hex[:8],
+                    "operation": name,
+                    "items": self.items(name, a_input, trans),
+                    "done": 0,
+                }
+                if name == "bulk-delete":
+                    root = ncs.maagic.get_root(trans)
+                    job["chunks"] = plan_chunks(root, job["items"], int(a_input.chunk_size))
+                    job["completed"] = []
+                save_job(job)
+        except ValueError as err:
+            a_output.result = False
+            a_output.msg = str(err)
+            return ncs.CONFD_OK
+
+        stream = ncs.maapi.Maapi() if uinfo.context == "cli" else None
+        stream_lock = threading.Lock()
+
+        def progress(msg: str) -> None:
+            self.log.info(f"{name} job {job['id']}: {msg}")
+            if stream is not None:
+                with stream_lock:
+                    stream.cli_write(uinfo.usid, f"{msg}\n")
+
+        if "chunks" in job:
+            error = self.run_lanes(job, uinfo.username, int(a_input.max_parallel), progress)
+        else:
+            error = self.run_job(job, uinfo.username, int(a_input.chunk_size), progress)
+        if stream is not None:
+            stream.close()
+        a_output.job = job["id"]
+        a_output.total = len(job["items"])
+        a_output.done = job["done"]
+        a_output.result = error is None
+        a_output.msg = error or "OK"
+        return ncs.CONFD_OK
+
+    def items(
+        self, name: str, a_input: ncs.maagic.ActionParams, trans: ncs.maapi.Transaction
+    ) -> list[Any]:
+        """Return items of a new job from an action input.
+
+        Parameters
+        ----------
+        name : str
+            the tailf:action name
+        a_input : ncs.maagic.ActionParams
+            input node
+        trans : ncs.maapi.Transaction
+            action transaction
+
+        Returns
+        -------
+        list[Any]
+            job items
+        """
+        if name == "bulk-create":
+            items = [
+                [str(svc.id), str(svc.device), str(svc.name_server or "")]
+                for svc in a_input.service
+            ]
+            if a_input.device_filter:
+                xpath = f"{DEVICES_XPATH}[{a_input.device_filter}]"
+                items.extend([dev, dev, ""] for dev in xpath_select(trans, xpath, DEVICE_KP_RE))
+            return items
+        # bulk-approve and bulk-delete
+        items = [str(svc_id) for svc_id in a_input.id]
+        if a_input.filter:
+            xpath = f"{SERVICES_XPATH}[{a_input.filter}]"
+            items.extend(xpath_select(trans, xpath, SERVICE_KP_RE))
+        return items
+
+    def run_job(
+        self,
+        job: dict[str, Any],
+        username: str,
+        chunk_size: int,
+        progress: Callable[[str], None],
+    ) -> Optional[str]:
+        """Apply remaining items of a job chunk by chunk.
+
+        Parameters
+        ----------
+        job : dict[str, Any]
+            job, its progress is updated and saved after every chunk
+        username : str
+            user for write transactions
+        chunk_size : int
+            items per transaction
+        progress : Callable[[str], None]
+            reports progress
+
+        Returns
+        -------
+        Optional[str]
+            an error message, None if all items are done
+        """
+        operation = OPERATIONS[job["operation"]]
+        items = job["items"]
+        while job["done"] < len(items):
+            chunk = items[job["done"] : job["done"] + chunk_size]
+            try:
+                with ncs.maapi.single_write_trans(username, "python") as t:
+                    changed = apply_chunk(t, operation, chunk)
+            except Exception as err:  # pylint:disable=broad-except
+                progress(f"failed after {job['done']}/{len(items)}: {err}")
+                return f"Error: {err}. Resume with job {job['id']}."
+            job["done"] += len(chunk)
+            save_job(job)
+            progress(f"{job['done']}/{len(items)} done, {changed} changed")
+        remove(job_file(job["id"]))
+        return None
+
+    def run_lanes(
+        self,
+        job: dict[str, Any],
+        username: str,
+        max_parallel: int,
+        progress: Callable[[str], None],
+    ) -> Optional[str]:
+        """Apply remaining chunks of a job, lanes in parallel.
+
+        Parameters
+        ----------
+        job : dict[str, Any]
+            job with planned `chunks`, its progress is updated and saved
+            after every chunk
+        username : str
+            user for write transactions
+        max_parallel : int
+            lanes in progress at once
+        progress : Callable[[str], None]
+            reports progress
+
+        Returns
+        -------
+        Optional[str]
+            an error message, None if all chunks are done
+        """
+        operation = OPERATIONS[job["operation"]]
+        total = len(job["items"])
+        lanes: dict[int, list[int]] = {}
+        for num, (lane, _) in enumerate(job["chunks"]):
+            if num not in job["completed"]:
+                lanes.setdefault(lane, []).append(num)
+        errors: list[str] = []
+        lock = threading.Lock()
+
+        def run_lane(chunks: list[int]) -> None:
+            for num in chunks:
+                if errors:
+                    # other lanes stop after their current chunk
+                    return
+                chunk = job["chunks"][num][1]
+                try:
+                    with ncs.maapi.single_write_trans(username, "python") as t:
+                        changed = apply_chunk(t, operation, chunk)
+                except Exception as err:  # pylint:disable=broad-except
+                    with lock:
+                        errors.append(str(err))
+                        progress(f"chunk {num} failed after {job['done']}/{total}: {err}")
+                    return
+                with lock:
+                    job["completed"].append(num)
+                    job["done"] += len(chunk)
+                    save_job(job)
+                    progress(f"{job['done']}/{total} done, {changed} changed")
+
+        workers = max(1, min(max_parallel, len(lanes)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nano-bulk") as pool:
+            list(pool.map(run_lane, lanes.values()))
+        if errors:
+            return f"Error: {errors[0]}. Resume with job {job['id']}."
+        remove(job_file(job["id"]))
+        return None
@@ -0,0 +1,486 @@
+"""Command output checks.
+
+Note
+----
+Checks are grouped in test suites per stage (`pre-test`, `post-test`)
+in `suites.json`. Each check names a command it needs, every distinct
+command runs once per device and stage, and its output is shared by
+all checks of the stage. Checks with `"enabled": false` are skipped,
+only the config register check is enabled by default.
+
+Well-known fields of `show version` are extracted by a precompiled line
+scanner which stops as soon as all required fields are found. Genie is
+still used for full parsing and as a fallback when the scanner can't
+find a field, but it runs in a process pool, so CPU-heavy parsing
+doesn't hold the GIL of the NSO Python VM.
+"""
+import json
+import multiprocessing
+import re
+import string
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from os import path
+from typing import Any, Optional
+
+from .loadtime import timed_import
+
+GENIE_WORKERS = 2
+GENIE_TIMEOUT = 60
+NETSIM_MARKER = "NETSIM"
+SHOW_VERSION = "version"
+SUITES_FILE = path.join(path.dirname(path.abspath(__file__)), "suites.json")
+# placeholders of `contains` checks, see `tests.run_stage`
+SERVICE_PARAMS = ("id", "device", "name_server")
+
+# field name: (line prefix to test before a regex, regex)
+SHOW_VERSION_FIELDS: dict[str, tuple[str, re.Pattern]] = {
+    "config_register": ("Configuration register", re.compile(r"^Configuration register is (\S+)")),
+    "version": ("Cisco IOS", re.compile(r"^Cisco IOS.*Version ([^\s,]+)")),
+    "uptime": ("", re.compile(r"^\S+ uptime is (.+)$")),
+    "image_file": ("System image file", re.compile(r'^System image file is "([^"]+)"')),
+}
+
+# field name: path in a Genie ShowVersion structure
+GENIE_FIELDS = {
+    "config_register": ("version", "curr_config_register"),
+    "version": ("version", "version"),
+    "uptime": ("version", "uptime"),
+    "image_file": ("version", "system_image"),
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+@dataclass
+class CheckResult:
+    """A result of a check."""
+
+    result: bool
+    msg: str
+
+
+class Check(ABC):
+    """A base check of a command output.
+
+    Parameters
+    ----------
+    name : str
+        check name, unique in a suite
+    """
+
+    command = SHOW_VERSION
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    @abstractmethod
+    def run(self, cmd_output: str, params: dict[str, Any]) -> "CheckResult":
+        """Check the command output.
+
+        Parameters
+        ----------
+        cmd_output : str
+            raw output of the command
+        params : dict[str, Any]
+            service parameters
+
+        Returns
+        -------
+        CheckResult
+            check result
+        """
+
+
+class FieldCheck(Check):
+    """A base check of well-known fields of `show version`."""
+
+    fields: tuple[str, ...] = ()
+
+    def run(self, cmd_output: str, params: dict[str, Any]) -> "CheckResult":
+        """Extract fields and evaluate them.
+
+        Parameters
+        ----------
+        cmd_output : str
+            raw output of the command
+        params : dict[str, Any]
+            service parameters
+
+        Returns
+        -------
+        CheckResult
+            check result
+        """
+        fields = scan_fields(cmd_output, self.fields)
+        if len(fields) < len(self.fields):
+            fields.update(genie_fields(cmd_output, set(self.fields) - set(fields)))
+        return self.evaluate(fields)
+
+    @abstractmethod
+    def evaluate(self, fields: dict[str, Any]) -> "CheckResult":
+        """Evaluate extracted fields.
+
+        Parameters
+        ----------
+        fields : dict[str, Any]
+            extracted fields
+
+        Returns
+        -------
+        CheckResult
+            check result
+        """
+
+
+class ConfigRegisterCheck(FieldCheck):
+    """Check a config register value.
+
+    Parameters
+    ----------
+    name : str
+        check name
+    expected : str
+        expected value
+    """
+
+    fields = ("config_register",)
+
+    def __init__(self, name: str = "config-register", expected: str = "0x2102") -> None:
+        super().__init__(name)
+        self.expected = expected
+
+    def evaluate(self, fields: dict[str, Any]) -> CheckResult:
+        """Evaluate extracted fields.
+
+        Parameters
+        ----------
+        fields : dict[str, Any]
+            extracted fields
+
+        Returns
+        -------
+        CheckResult
+            check result
+        """
+        if fields.get("config_register") == self.expected:
+            return CheckResult(True, "Config register check: PASS")
+        return CheckResult(False, "Config register check: FAILED")
+
+
+class FieldMatchCheck(FieldCheck):
+    """Check a well-known field of `show version` with a regex.
+
+    Parameters
+    ----------
+    name : str
+        check name
+    field : str
+        field name, see `SHOW_VERSION_FIELDS`
+    pattern : str
+        regex to search in the field value
+    """
+
+    def __init__(self, name: str, field: str, pattern: str) -> None:
+        super().__init__(name)
+        self.fields = (field,)
+        self.pattern = re.compile(pattern)
+
+    def evaluate(self, fields: dict[str, Any]) -> CheckResult:
+        """Evaluate extracted fields.
+
+        Parameters
+        ----------
+        fields : dict[str, Any]
+            extracted fields
+
+        Returns
+        -------
+        CheckResult
+            check result
+        """
+        value = fields.get(self.fields[0])
+        if value is not None and self.pattern.search(str(value)):
+            return CheckResult(True, f"{self.name} check: PASS")
+        return CheckResult(False, f"{self.name} check: FAILED ({self.fields[0]}={value})")
+
+
+class ContainsCheck(Check):
+    """Check if a command output contains a line.
+
+    Parameters
+    ----------
+    name : str
+        check name
+    command : str
+        `show` command arguments, e.g. running-config
+    text : str
+        text to find, service parameters are substituted with
+        `str.format`, e.g. `ip name-server {name_server}`
+    present : bool
+        False if the text must be absent
+
+    Raises
+    ------
+    ValueError
+        If the text has a placeholder other than `SERVICE_PARAMS`
+    """
+
+    def __init__(self, name: str, command: str, text: str, present: bool = True) -> None:
+        unknown = {
+            field
+            for _, field, _, _ in string.Formatter().parse(text)
+            if field is not None and field not in SERVICE_PARAMS
+        }
+        if unknown:
+            raise ValueError(
+                f"Error: unknown placeholders {sorted(unknown)} in check '{name}', "
+                f"use {', '.join(SERVICE_PARAMS)}."
+            )
+        super().__init__(name)
+        self.command = command
+        self.text = text
+        self.present = present
+
+    def run(self, cmd_output: str, params: dict[str, Any]) -> CheckResult:
+        """Search the text in the command output.
+
+        Parameters
+        ----------
+        cmd_output : str
+            raw output of the command
+        params : dict[str, Any]
+            service parameters
+
+        Returns
+        -------
+        CheckResult
+            check result
+        """
+        try:
+            text = self.text.format(**params)
+        except (KeyError, IndexError, ValueError) as err:
+            return CheckResult(False, f"{self.name} check: FAILED (text: {err!r})")
+        if (text in cmd_output) == self.present:
+            return CheckResult(True, f"{self.name} check: PASS")
+        return CheckResult(False, f"{self.name} check: FAILED")
+
+
+CHECK_TYPES: dict[str, Callable[..., Check]] = {
+    "config-register": ConfigRegisterCheck,
+    "field-match": FieldMatchCheck,
+    "contains": ContainsCheck,
+}
+_suites: Optional[dict[str, list[Check]]] = None
+
+
+def load_suites(filename: str = SUITES_FILE) -> dict[str, list[Check]]:
+    """Load test suites from a file.
+
+    Parameters
+    ----------
+    filename : str
+        JSON file with a list of checks per stage
+
+    Returns
+    -------
+    dict[str, list[Check]]
+        checks by stage
+
+    Raises
+    ------
+    ValueError
+        In case of an unknown check type or invalid check arguments
+    """
+    with open(filename, encoding="utf-8") as suites_file:
+        data = json.load(suites_file)
+    suites: dict[str, list[Check]] = {}
+    for stage, entries in data.items():
+        suites[stage] = []
+        for entry in entries:
+            entry = dict(entry)
+            if not entry.pop("enabled", True):
+                continue
+            check_type = entry.pop("type")
+            if check_type not in CHECK_TYPES:
+                raise ValueError(f"Error: unknown check type '{check_type}' in '{stage}'.")
+            suites[stage].append(CHECK_TYPES[check_type](**entry))
+    return suites
+
+
+def suite(stage: str) -> list[Check]:
+    """Return checks of a stage, suites are loaded on the first call.
+
+    Parameters
+    ----------
+    stage : str
+        stage name, e.g. pre-test
+
+    Returns
+    -------
+    list[Check]
+        checks of the stage
+    """
+    global _suites  # pylint:disable=global-statement
+    if _suites is None:
+        _suites = load_suites()
+    return _suites.get(stage, [])
+
+
+def scan_fields(cmd_output: str, fields: Iterable[str]) -> dict[str, str]:
+    """Extract well-known fields of `show version` line by line.
+
+    Parameters
+    ----------
+    cmd_output : str
+        raw output of the command
+    fields : Iterable[str]
+        names of fields to extract
+
+    Returns
+    -------
+    dict[str, str]
+        found fields, missing fields are omitted
+    """
+    wanted = {name: SHOW_VERSION_FIELDS[name] for name in fields}
+    found: dict[str, str] = {}
+    for line in cmd_output.splitlines():
+        for name, (prefix, pattern) in list(wanted.items()):
+            if not line.startswith(prefix):
+                continue
+            match = pattern.match(line)
+            if match:
+                found[name] = match.group(1)
+                del wanted[name]
+        if not wanted:
+            break
+    return found
+
+
+def genie_parse(cmd_output: str) -> dict[str, Any]:
+    """Parse `show version` output with Genie.
+
+    Parameters
+    ----------
+    cmd_output : str
+        raw output of the command
+
+    Returns
+    -------
+    dict[str, Any]
+        parsed structure
+
+    Notes
+    -----
+    Runs in a worker process of the Genie pool.
+    """
+    show_platform = timed_import("genie.libs.parser.iosxe.show_platform")
+    parser = show_platform.ShowVersion(show_platform.ShowVersionSchema)
+    return parser.cli(output=cmd_output)
+
+
+def genie_pool() -> ProcessPoolExecutor:
+    """Return a process pool for Genie parsers, create it on the first use.
+
+    Returns
+    -------
+    ProcessPoolExecutor
+        a pool of worker processes
+    """
+    global _pool  # pylint:disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            # the Python VM is multithreaded, so forking it is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=GENIE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown() -> None:
+    """Stop Genie worker processes."""
+    global _pool  # pylint:disable=global-statement
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def genie_fields(cmd_output: str, fields: Iterable[str]) -> dict[str, Any]:
+    """Extract fields with a Genie parser in the process pool.
+
+    Parameters
+    ----------
+    cmd_output : str
+        raw output of the command
+    fields : Iterable[str]
+        names of fields to extract
+
+    Returns
+    -------
+    dict[str, Any]
+        found fields, missing fields are omitted
+    """
+    parsed = genie_pool().submit(genie_parse, cmd_output).result(timeout=GENIE_TIMEOUT)
+    found = {}
+    for name in fields:
+        section, key = GENIE_FIELDS[name]
+        if key in parsed.get(section, {}):
+            found[name] = parsed[section][key]
+    return found
+
+
+def run_check(
+    check: Check, cmd_output: str, params: Optional[dict[str, Any]] = None
+) -> CheckResult:
+    """Run a check against command output.
+
+    Parameters
+    ----------
+    check : Check
+        a check object
+    cmd_output : str
+        raw output of the command
+    params : Optional[dict[str, Any]]
+        service parameters
+
+    Returns
+    -------
+    CheckResult
+        check result
+    """
+    if NETSIM_MARKER in cmd_output:
+        return CheckResult(True, "Netsim device detected, It's OK, skipping checks.")
+    return check.run(cmd_output, params or {})
+
+
+def run_suite(
+    checks: list[Check],
+    run_cmd: Callable[[str], str],
+    params: Optional[dict[str, Any]] = None,
+) -> list[tuple[str, CheckResult]]:
+    """Run checks, every distinct command is executed once.
+
+    Parameters
+    ----------
+    checks : list[Check]
+        checks of a stage
+    run_cmd : Callable[[str], str]
+        executes a `show` command on a device and returns its output
+    params : Optional[dict[str, Any]]
+        service parameters
+
+    Returns
+    -------
+    list[tuple[str, CheckResult]]
+        check names and results in order of checks
+    """
+    outputs: dict[str, str] = {}
+    for check in checks:
+        if check.command not in outputs:
+            outputs[check.command] = run_cmd(check.command)
+    return [(check.name, run_check(check, outputs[check.command], params)) for check in checks]
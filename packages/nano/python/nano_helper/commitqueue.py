@@ -0,0 +1,217 @@
+"""Commit queue completion.
+
+Note
+----
+In commit-queue mode device config states of the nano plan have a
+post-condition: no queue items of the service are left in
+`plan/commit-queue`. Post-conditions are evaluated on re-deploy, so an
+operational data subscriber re-deploys a service when its queue item
+is removed, i.e. the device push is completed.
+
+Queues are requested per transaction with commit parameters, devices
+are never switched to commit queues by default, so transactions of
+other services are not queued. Device config of a service in
+commit-queue mode is pushed only by queued transactions: a config
+state reached in a transaction without a queue, e.g. a reactive
+re-deploy after a post-action, applies nothing and is marked
+`deferred` in the component property list. The subscriber re-deploys
+such services with `commit-queue async`, and so are re-deploys after
+completed queue items. Bulk chunks use `apply_trans`.
+"""
+import re
+from typing import Any
+
+import ncs  # type: ignore
+
+# plan nodes are in the service namespace, `ncs:nano-plan-data` is a grouping
+QUEUE_ITEM_PATH = "/nano:nano/nano/plan/commit-queue/queue-item"
+QUEUE_ITEM_KP_RE = re.compile(r"^/nano:nano/nano\{(?P<id>[^}]+)\}/")
+PROPERTY_PATH = "/nano:nano/nano/plan/component/private/property-list/property"
+# property values of config states, keyed by the state name
+DEFERRED = "deferred"
+PUSHED = "pushed"
+
+
+def use_commit_queue(root: ncs.maagic.Root, service: ncs.maagic.ListElement) -> bool:
+    """Check if device config of a service is sent through a commit queue.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+    service : ncs.maagic.ListElement
+        service node
+
+    Returns
+    -------
+    bool
+        the service `commit-queue` leaf, `/nano/sla/commit-queue` if not set
+    """
+    if service.commit_queue is not None:
+        return bool(service.commit_queue)
+    return bool(root.nano__nano.sla.commit_queue)
+
+
+def is_deferred(service: ncs.maagic.ListElement) -> bool:
+    """Check if a config push of a service waits for a re-deploy.
+
+    Parameters
+    ----------
+    service : ncs.maagic.ListElement
+        service node
+
+    Returns
+    -------
+    bool
+        True if a component property is `deferred`
+    """
+    return any(
+        prop.value == DEFERRED
+        for component in service.plan.component
+        for prop in component.private.property_list.property
+    )
+
+
+def re_deploy(service: ncs.maagic.ListElement, queued: bool) -> None:
+    """Re-deploy a service, through commit queues if requested.
+
+    Parameters
+    ----------
+    service : ncs.maagic.ListElement
+        service node
+    queued : bool
+        commit the re-deploy with `commit-queue async` and wait for the
+        commit, a reactive re-deploy is started otherwise
+    """
+    if not queued:
+        service.reactive_re_deploy()
+        return
+    action = service.re_deploy
+    params = action.get_input()
+    params.commit_queue.async_.create()
+    action(params)
+
+
+def is_queued(trans: ncs.maapi.Transaction) -> bool:
+    """Check if a transaction is committed through commit queues.
+
+    Parameters
+    ----------
+    trans : ncs.maapi.Transaction
+        a transaction
+
+    Returns
+    -------
+    bool
+        True for `commit-queue async` or `sync`
+    """
+    params = trans.get_params()
+    return bool(params.is_commit_queue_async() or params.is_commit_queue_sync())
+
+
+def apply_trans(trans: ncs.maapi.Transaction, queued: bool) -> None:
+    """Commit a transaction, through commit queues if requested.
+
+    Parameters
+    ----------
+    trans : ncs.maapi.Transaction
+        a write transaction
+    queued : bool
+        send device changes through commit queues, asynchronously
+    """
+    if not queued:
+        trans.apply()
+        return
+    params = trans.get_params()
+    params.commit_queue_async()
+    trans.apply_params(True, params)
+
+
+class CommitQueueSubscriber(ncs.cdb.OperSubscriber):
+    """Re-deploy services on completed queue items, deferred pushes."""
+
+    def init(self) -> None:
+        """Register subscriptions."""
+        self.register(QUEUE_ITEM_PATH, priority=100)
+        self.register(PROPERTY_PATH, priority=100)
+
+    def pre_iterate(self) -> dict[str, bool]:
+        """Return an initial state.
+
+        Returns
+        -------
+        dict[str, bool]
+            True for services with completed queue items, False for
+            services with changed component properties
+        """
+        return {}
+
+    def iterate(self, kp: Any, op: int, oldv: Any, newv: Any, state: dict[str, bool]) -> int:
+        """Note services with removed queue items or changed properties.
+
+        Parameters
+        ----------
+        kp : ncs.HKeypathRef
+            changed path
+        op : int
+            operation
+        oldv : Any
+            old value
+        newv : Any
+            new value
+        state : dict[str, bool]
+            service ids
+
+        Returns
+        -------
+        int
+            continue iteration
+        """
+        match = QUEUE_ITEM_KP_RE.match(str(kp))
+        if match is None:
+            return ncs.ITER_CONTINUE
+        svc_id = match.group("id")
+        if str(kp).startswith(f"{match.group(0)}plan/commit-queue/"):
+            if op == ncs.MOP_DELETED:
+                state[svc_id] = True
+        else:
+            state.setdefault(svc_id, False)
+        return ncs.ITER_CONTINUE
+
+    def should_post_iterate(self, state: dict[str, bool]) -> bool:
+        """Re-deploy only if queue items or properties are changed.
+
+        Parameters
+        ----------
+        state : dict[str, bool]
+            service ids
+
+        Returns
+        -------
+        bool
+            True if there are services to check
+        """
+        return bool(state)
+
+    def post_iterate(self, state: dict[str, bool]) -> None:
+        """Re-deploy services to check post-conditions or push config.
+
+        Parameters
+        ----------
+        state : dict[str, bool]
+            True for services with completed queue items, False for
+            services with changed component properties
+        """
+        with ncs.maapi.single_read_trans("admin", "python") as t:
+            root = ncs.maagic.get_root(t)
+            services = root.nano__nano.nano
+            for svc_id, completed in sorted(state.items()):
+                if svc_id not in services:
+                    continue
+                service = services[svc_id]
+                try:
+                    if not completed and not is_deferred(service):
+                        continue
+                    re_deploy(service, use_commit_queue(root, service))
+                except Exception as err:  # pylint:disable=broad-except
+                    self.log.error(f"Re-deploy of '{svc_id}' for commit queue failed: {err}")
@@ -0,0 +1,183 @@
+"""Notification context.
+
+Note
+----
+Everything a notification template needs is collected in one read
+transaction. Actions pass their own transaction; callers without an
+action context, e.g. a digest timer, may build contexts for many
+services in one pass.
+"""
+# pylint:disable=protected-access
+import datetime as dt
+import re
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+import ncs  # type: ignore
+
+SERVICE_KPATH = "/nano:nano/nano{{{}}}"
+SERVICE_XPATH = "/nano:nano/nano[id='{}']"
+SERVICE_ID_RE = re.compile(r"/nano:nano/nano:nano\[nano:id='(?P<id>[a-zA-Z0-9_-]+)'\]")
+SPM_TRIGGER_NAME = "nano-spm-{}"
+AC_TIME_FMT = r"%H:%M %d.%m.%Y"
+
+
+def id_from_xpath(string: str) -> Optional[str]:
+    """Return a service id from a given xpath string.
+
+    Parameters
+    ----------
+    string: str
+        String to check
+
+    Returns
+    -------
+    Optional[str]
+        Return a service id if the pattern is detected
+
+    Notes
+    -----
+    "/nano:nano/nano:nano[nano:id='123']"
+    """
+    match = SERVICE_ID_RE.fullmatch(str(string))
+    return match.group("id") if match else None
+
+
+@contextmanager
+def read_trans(trans: Optional[ncs.maapi.Transaction] = None) -> Iterator[ncs.maapi.Transaction]:
+    """Use a given transaction or open a new read transaction.
+
+    Parameters
+    ----------
+    trans : Optional[ncs.maapi.Transaction]
+        an existing transaction, e.g. an action transaction
+
+    Yields
+    ------
+    ncs.maapi.Transaction
+        a read transaction
+    """
+    if trans is not None:
+        yield trans
+        return
+    with ncs.maapi.single_read_trans("admin", "python") as t:
+        yield t
+
+
+def _format_time(value: Optional[str]) -> Optional[str]:
+    """Convert an SPM timestamp to a human-readable format.
+
+    Parameters
+    ----------
+    value : Optional[str]
+        timestamp, e.g. 2021-08-19T23:07:01+00:00
+
+    Returns
+    -------
+    Optional[str]
+        formatted time or None if the value is not set
+    """
+    if not value:
+        return None
+    return dt.datetime.fromisoformat(str(value)).strftime(AC_TIME_FMT)
+
+
+def sla_times(root: ncs.maagic.Root, svc_id: str) -> dict[str, Optional[str]]:
+    """Return jeopardy and violation times of a service.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+    svc_id : str
+        service id
+
+    Returns
+    -------
+    dict[str, Optional[str]]
+        `jeopardy_time` and `violation_time` of the SPM trigger or of
+        the timer wheel engine, None if a service has neither
+    """
+    times: dict[str, Optional[str]] = {"jeopardy_time": None, "violation_time": None}
+    if svc_id not in root.nano__nano.nano:
+        return times
+    trigger_status = root.nano__nano.nano[svc_id].service_progress_monitoring.trigger_status
+    trigger = SPM_TRIGGER_NAME.format(svc_id)
+    if trigger in trigger_status:
+        times["jeopardy_time"] = _format_time(trigger_status[trigger].jeopardy_time)
+        times["violation_time"] = _format_time(trigger_status[trigger].violation_time)
+    elif svc_id in root.nano__nano.sla.deadline:
+        deadline = root.nano__nano.sla.deadline[svc_id]
+        times["jeopardy_time"] = _format_time(deadline.jeopardy)
+        times["violation_time"] = _format_time(deadline.violation)
+    return times
+
+
+def build_context(
+    trans: Optional[ncs.maapi.Transaction],
+    name: str,
+    kp: ncs.HKeypathRef,
+    a_input: ncs.maagic.ActionParams,
+) -> dict[str, Any]:
+    """Return template parameters for an action invocation.
+
+    Parameters
+    ----------
+    trans : Optional[ncs.maapi.Transaction]
+        action transaction, a new read transaction is opened if None
+    name : str
+        name of the invoked service action
+    kp : ncs.HKeypathRef
+        the keypath of the action
+    a_input : ncs.maagic.ActionParams
+        input node
+
+    Returns
+    -------
+    dict[str, Any]
+        action input, action name, service id and SLA times if known
+
+    Notes
+    -----
+    Input params of the timeout action: policy, service, status,
+    timeout, trigger.
+    """
+    # convert an input to a dictionary, enums are normalized to str
+    params: dict[str, Any] = {}
+    for elem in a_input:
+        value = a_input[elem]
+        params[elem.split(":")[1]] = str(value) if isinstance(value, ncs.maagic.Enum) else value
+    params["name"] = name
+    with read_trans(trans) as t:
+        svc_id = None
+        if name == "notify-approver":  # notify on a new service
+            svc_id = ncs.maagic.get_node(t, kp)._parent.id
+        elif name == "timeout":  # notify on a broken SLA
+            svc_id = id_from_xpath(a_input.service)
+        if svc_id is not None:
+            params["id"] = svc_id
+            params.update(sla_times(ncs.maagic.get_root(t), svc_id))
+    return params
+
+
+def build_contexts(
+    trans: Optional[ncs.maapi.Transaction], svc_ids: Iterable[str]
+) -> dict[str, dict[str, Any]]:
+    """Return template parameters for many services in one pass.
+
+    Parameters
+    ----------
+    trans : Optional[ncs.maapi.Transaction]
+        a transaction, a new read transaction is opened if None
+    svc_ids : Iterable[str]
+        service ids
+
+    Returns
+    -------
+    dict[str, dict[str, Any]]
+        service id and SLA times by service id
+    """
+    with read_trans(trans) as t:
+        root = ncs.maagic.get_root(t)
+        return {svc_id: {"id": svc_id, **sla_times(root, svc_id)} for svc_id in svc_ids}
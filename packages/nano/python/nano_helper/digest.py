@@ -0,0 +1,112 @@
+"""SLA timeout digest.
+
+Note
+----
+SPM calls the `timeout` action once per service. When many services
+cross their jeopardy or violation time together, events received
+within `/nano/sla/webex/digest-window` are grouped by the timeout type
+and sent as one `timeout-digest` message. Only the first
+`DIGEST_MAX_IDS` service ids of a type are listed, so a digest of
+thousands of services stays below the Webex message and card size
+limits; the number of services is always complete. Contexts of listed
+services, id and SLA times, are read in one transaction when the
+digest is sent.
+"""
+import threading
+from typing import Any, Callable, Optional
+
+from .context import build_contexts
+from .sender import Message, WebexSender
+
+DIGEST_TMPL_NAME = "timeout-digest"
+# service ids listed per timeout type
+DIGEST_MAX_IDS = 50
+
+
+class TimeoutDigest:
+    """Collect timeout events and send them as one message.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    render : Callable[[str, dict[str, Any]], Message]
+        renders a message from a template name and parameters
+    sender : WebexSender
+        delivery pipeline
+    """
+
+    def __init__(
+        self,
+        log: Any,
+        render: Callable[[str, dict[str, Any]], Message],
+        sender: WebexSender,
+    ) -> None:
+        self.log = log
+        self.render = render
+        self.sender = sender
+        # listed ids, up to DIGEST_MAX_IDS, and all ids by timeout type
+        self._events: dict[str, list[str]] = {}
+        self._seen: dict[str, set[str]] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def add(self, timeout: str, svc_id: str, window: int) -> None:
+        """Add a timeout event, the first event opens a digest window.
+
+        Parameters
+        ----------
+        timeout : str
+            timeout type: jeopardy, violation or success
+        svc_id : str
+            service id
+        window : int
+            seconds to collect events before sending a digest
+        """
+        with self._lock:
+            seen = self._seen.setdefault(timeout, set())
+            if svc_id not in seen:
+                seen.add(svc_id)
+                ids = self._events.setdefault(timeout, [])
+                if len(ids) < DIGEST_MAX_IDS:
+                    ids.append(svc_id)
+            if self._timer is None:
+                self._timer = threading.Timer(window, self.flush)
+                self._timer.name = "nano-timeout-digest"
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        """Send collected events, if any."""
+        with self._lock:
+            events, self._events = self._events, {}
+            seen, self._seen = self._seen, {}
+            self._timer = None
+        if not events:
+            return
+        totals = {timeout: len(ids) for timeout, ids in seen.items()}
+        self.log.info(
+            "Sending a timeout digest: "
+            + ", ".join(f"{timeout}={total}" for timeout, total in totals.items())
+        )
+        try:
+            contexts = build_contexts(None, (svc_id for ids in events.values() for svc_id in ids))
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"Timeout digest context failed, sending ids only: {err}")
+            contexts = {}
+        groups = {
+            timeout: [contexts.get(svc_id, {"id": svc_id}) for svc_id in ids]
+            for timeout, ids in events.items()
+        }
+        params = {"groups": groups, "totals": totals}
+        try:
+            self.sender.submit(self.render(DIGEST_TMPL_NAME, params))
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"Timeout digest failed: {err}")
+
+    def stop(self) -> None:
+        """Cancel a digest window and send collected events right away."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self.flush()
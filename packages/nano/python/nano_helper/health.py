@@ -0,0 +1,253 @@
+"""Device health for live-status calls.
+
+Note
+----
+Every live-status call has a deadline. A call runs in a worker thread
+with its own MAAPI session, so a caller stops waiting at the deadline
+even if the NED is still trying to reach the device. Each device has
+its own workers, so calls hung on a dead device don't hold up calls to
+other devices. The deadline starts when a worker picks up the call; a
+call which waits for a worker longer than `call-timeout` is dropped
+and not counted as a device failure.
+
+Failed calls are counted per device. After `failure-threshold` failures
+in a row the circuit breaker of the device opens and calls fail fast
+without touching the device. After `reset-timeout` one probe call is
+let through (half-open): a success closes the breaker, a failure opens
+it again. Breaker state changes are written to
+`/nano/device-health/device` operational data.
+"""
+import datetime as dt
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from time import monotonic
+from typing import Any, Optional, TypeVar
+
+import ncs  # type: ignore
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60
+CALL_TIMEOUT = 60
+# device calls in progress per device
+DEVICE_WORKERS = 8
+
+T = TypeVar("T")
+
+
+class DeviceUnavailable(Exception):
+    """A device call failed, timed out or was short-circuited."""
+
+
+@dataclass
+class Breaker:
+    """Circuit breaker state of a device."""
+
+    state: str = STATE_CLOSED
+    failures: int = 0
+    opened: float = 0.0
+    probing: bool = False
+    last_error: str = ""
+
+
+class DeviceHealth:
+    """Deadlines and circuit breakers for device calls.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    workers : int
+        maximum number of calls in progress per device
+    """
+
+    def __init__(self, log: Any, workers: int = DEVICE_WORKERS) -> None:
+        self.log = log
+        self.workers = workers
+        self.failure_threshold = FAILURE_THRESHOLD
+        self.reset_timeout = RESET_TIMEOUT
+        self.call_timeout = CALL_TIMEOUT
+        self._breakers: dict[str, Breaker] = {}
+        self._pools: dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def stop(self) -> None:
+        """Stop waiting for device calls in progress."""
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=False)
+
+    def _pool(self, device: str) -> ThreadPoolExecutor:
+        """Return workers of a device, create them on the first call.
+
+        Parameters
+        ----------
+        device : str
+            device name
+
+        Returns
+        -------
+        ThreadPoolExecutor
+            device workers
+        """
+        with self._lock:
+            if device not in self._pools:
+                self._pools[device] = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix=f"nano-device-{device}"
+                )
+            return self._pools[device]
+
+    def configure(self, settings: ncs.maagic.Container) -> None:
+        """Update settings from `/nano/device-health`.
+
+        Parameters
+        ----------
+        settings : ncs.maagic.Container
+            device-health node
+        """
+        self.failure_threshold = int(settings.failure_threshold)
+        self.reset_timeout = int(settings.reset_timeout)
+        self.call_timeout = int(settings.call_timeout)
+
+    def call(self, device: str, func: Callable[[], T]) -> T:
+        """Call a device within a deadline, fail fast if the breaker is open.
+
+        Parameters
+        ----------
+        device : str
+            device name
+        func : Callable[[], T]
+            device call, runs in a worker thread
+
+        Returns
+        -------
+        T
+            a result of the call
+
+        Raises
+        ------
+        DeviceUnavailable
+            If the breaker is open, no worker is free, the call fails or
+            misses the deadline
+        """
+        self._acquire(device)
+        timeout = self.call_timeout
+        started: list[float] = []
+        picked = threading.Event()
+
+        def run() -> T:
+            started.append(monotonic())
+            picked.set()
+            return func()
+
+        future = self._pool(device).submit(run)
+        if not picked.wait(timeout) and future.cancel():
+            self._release(device)
+            raise DeviceUnavailable(
+                f"Error: device '{device}': no free worker in {timeout} seconds."
+            )
+        picked.wait()
+        try:
+            result = future.result(timeout=max(0.0, started[0] + timeout - monotonic()))
+        except FutureTimeoutError:
+            error = f"no answer in {timeout} seconds"
+            self._record(device, error)
+            raise DeviceUnavailable(f"Error: device '{device}': {error}.") from None
+        except Exception as err:
+            self._record(device, str(err))
+            raise DeviceUnavailable(f"Error: device '{device}': {err}") from err
+        self._record(device, None)
+        return result
+
+    def _acquire(self, device: str) -> None:
+        """Check if a call is allowed.
+
+        Parameters
+        ----------
+        device : str
+            device name
+
+        Raises
+        ------
+        DeviceUnavailable
+            If the breaker is open or a probe is in progress
+        """
+        with self._lock:
+            breaker = self._breakers.setdefault(device, Breaker())
+            if breaker.state == STATE_CLOSED:
+                return
+            if breaker.state == STATE_OPEN and monotonic() - breaker.opened >= self.reset_timeout:
+                breaker.state = STATE_HALF_OPEN
+                breaker.probing = False
+            if breaker.state == STATE_HALF_OPEN and not breaker.probing:
+                breaker.probing = True
+                return
+            error = breaker.last_error
+        raise DeviceUnavailable(f"Error: device '{device}' is short-circuited: {error}")
+
+    def _release(self, device: str) -> None:
+        """Let another probe through after a call which never started.
+
+        Parameters
+        ----------
+        device : str
+            device name
+        """
+        with self._lock:
+            self._breakers[device].probing = False
+
+    def _record(self, device: str, error: Optional[str]) -> None:
+        """Update a breaker with a call result.
+
+        Parameters
+        ----------
+        device : str
+            device name
+        error : Optional[str]
+            failure reason, None on success
+        """
+        with self._lock:
+            breaker = self._breakers[device]
+            old_state = breaker.state
+            breaker.probing = False
+            if error is None:
+                breaker.state = STATE_CLOSED
+                breaker.failures = 0
+            else:
+                breaker.failures += 1
+                breaker.last_error = error
+                if breaker.state == STATE_HALF_OPEN or breaker.failures >= self.failure_threshold:
+                    breaker.state = STATE_OPEN
+                    breaker.opened = monotonic()
+            if breaker.state == old_state:
+                return
+            snapshot = Breaker(**vars(breaker))
+        self.log.warning(f"Device '{device}' breaker: {old_state} -> {snapshot.state}")
+        self._publish(device, snapshot)
+
+    def _publish(self, device: str, breaker: Breaker) -> None:
+        """Write breaker state to operational data.
+
+        Parameters
+        ----------
+        device : str
+            device name
+        breaker : Breaker
+            breaker state
+        """
+        try:
+            with ncs.maapi.single_write_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+                node = ncs.maagic.get_root(t).nano__nano.device_health.device.create(device)
+                node.state = breaker.state
+                node.failures = breaker.failures
+                node.last_error = breaker.last_error
+                node.changed = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+                t.apply()
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"Device '{device}' breaker state is not saved: {err}")
@@ -0,0 +1,479 @@
+"""Plan state index.
+
+Note
+----
+Service ids are indexed by plan component type, state and status, and
+by post-action status, so questions like "which services wait in
+`nano:approved`" don't walk `/nano/nano/plan` of every service. The
+index is built once from the plan and then kept up to date by an
+operational data subscriber: only states of changed keypaths are read,
+deleted services, components and states are removed from the delta
+alone. `/nano/query` serves the index with counts and paging.
+
+The index also keeps dwell times for `MetricsExporter`: when a state
+becomes reached, the time since the previous reached state of its
+component is added to a histogram of the component type and state.
+"""
+import datetime as dt
+import re
+import threading
+from collections.abc import Callable, Iterable
+from typing import Any, Optional
+
+import ncs  # type: ignore
+from ncs.dp import Action  # type: ignore
+
+from .metrics import DWELL_BUCKETS, Histogram
+
+PLAN_STATE_PATH = "/nano:nano/nano/plan/component/state"
+PLAN_KP_RE = re.compile(
+    r"^/nano:nano/nano\{(?P<id>[^}]+)\}"
+    r"(?:/plan(?:/component\{(?P<type>\S+) (?P<name>[^}]+)\}"
+    r"(?:/state\{(?P<state>[^}]+)\})?)?)?"
+)
+READY_TIMEOUT = 30
+
+# service id, component type, component name, state
+StateKey = tuple[str, str, str, str]
+
+
+class PlanIndex:
+    """Service ids by plan states.
+
+    A service is listed under a status if any of its components of the
+    type has the status, e.g. one of `nano:device-com-type` components.
+    """
+
+    def __init__(self) -> None:
+        self.ready = threading.Event()
+        self._states: dict[StateKey, tuple[str, Optional[str]]] = {}
+        self._by_service: dict[str, set[StateKey]] = {}
+        # (component type, state, status) -> service id -> number of components
+        self._by_status: dict[tuple[str, str, str], dict[str, int]] = {}
+        # times of reached states
+        self._reached: dict[StateKey, dt.datetime] = {}
+        self._dwell: dict[tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key: tuple[str, str, str], svc_id: str, delta: int) -> None:
+        services = self._by_status.setdefault(key, {})
+        services[svc_id] = services.get(svc_id, 0) + delta
+        if services[svc_id] <= 0:
+            del services[svc_id]
+
+    def _index_keys(
+        self, key: StateKey, value: tuple[str, Optional[str]]
+    ) -> Iterable[tuple[str, str, str]]:
+        _, com_type, _, state = key
+        status, post_action_status = value
+        yield com_type, state, status
+        if post_action_status is not None:
+            yield com_type, state, f"post-action:{post_action_status}"
+
+    def set(
+        self,
+        key: StateKey,
+        status: str,
+        post_action_status: Optional[str],
+        when: Optional[str] = None,
+    ) -> None:
+        """Add or update a plan state.
+
+        Parameters
+        ----------
+        key : StateKey
+            service id, component type, component name and state
+        status : str
+            e.g. reached
+        post_action_status : Optional[str]
+            e.g. create-reached, None if the state has no post-action
+        when : Optional[str]
+            time of the status, e.g. 2021-08-19T23:07:01+00:00
+        """
+        value = (status, post_action_status)
+        with self._lock:
+            old = self._states.get(key)
+            if status == "reached" and when:
+                self._observe_dwell(key, dt.datetime.fromisoformat(when))
+            else:
+                self._reached.pop(key, None)
+            if old == value:
+                return
+            if old is not None:
+                for index_key in self._index_keys(key, old):
+                    self._count(index_key, key[0], -1)
+            self._states[key] = value
+            self._by_service.setdefault(key[0], set()).add(key)
+            for index_key in self._index_keys(key, value):
+                self._count(index_key, key[0], 1)
+
+    def _observe_dwell(self, key: StateKey, when: dt.datetime) -> None:
+        """Record a reached state, a new one is added to dwell times.
+
+        Parameters
+        ----------
+        key : StateKey
+            reached state
+        when : dt.datetime
+            time the state is reached
+        """
+        if self._reached.get(key) == when:
+            return
+        new = key not in self._reached
+        self._reached[key] = when
+        if not new:
+            return
+        previous = [
+            self._reached[other]
+            for other in self._by_service.get(key[0], ())
+            if other[:3] == key[:3] and other in self._reached and self._reached[other] < when
+        ]
+        if previous:
+            hist = self._dwell.setdefault((key[1], key[3]), Histogram(DWELL_BUCKETS))
+            hist.observe(max(0.0, (when - max(previous)).total_seconds()))
+
+    def dwell_times(self) -> dict[tuple[str, str], Histogram]:
+        """Return dwell times of reached states since the index is built.
+
+        Returns
+        -------
+        dict[tuple[str, str], Histogram]
+            copies of histograms by component type and state
+        """
+        with self._lock:
+            return {key: hist.copy() for key, hist in self._dwell.items()}
+
+    def remove(self, svc_id: str, com_type: str = "", com_name: str = "", state: str = "") -> None:
+        """Remove a service, a component or a state.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        com_type : str
+            component type, all components if empty
+        com_name : str
+            component name
+        state : str
+            state, all states of the component if empty
+        """
+        prefix = tuple(part for part in (svc_id, com_type, com_name, state) if part)
+        with self._lock:
+            keys = self._by_service.get(svc_id, set())
+            for key in [key for key in keys if key[: len(prefix)] == prefix]:
+                self._reached.pop(key, None)
+                for index_key in self._index_keys(key, self._states.pop(key)):
+                    self._count(index_key, svc_id, -1)
+                keys.discard(key)
+            if not keys:
+                self._by_service.pop(svc_id, None)
+
+    def query(self, com_type: str, state: str, status: str) -> list[str]:
+        """Return ids of services in a plan state.
+
+        Parameters
+        ----------
+        com_type : str
+            component type, e.g. nano:cfg-com-type
+        state : str
+            state, e.g. nano:approved
+        status : str
+            status, e.g. not-reached, or a post-action status prefixed
+            with `post-action:`, e.g. post-action:create-failed
+
+        Returns
+        -------
+        list[str]
+            sorted service ids
+        """
+        with self._lock:
+            return sorted(self._by_status.get((com_type, state, status), {}))
+
+    def counts(self, com_type: str, state: str) -> dict[str, int]:
+        """Return numbers of services by status of a plan state.
+
+        Parameters
+        ----------
+        com_type : str
+            component type
+        state : str
+            state
+
+        Returns
+        -------
+        dict[str, int]
+            numbers of services by status and post-action status
+        """
+        with self._lock:
+            return {
+                status: len(services)
+                for (key_type, key_state, status), services in sorted(self._by_status.items())
+                if key_type == com_type and key_state == state and services
+            }
+
+    def load(self, root: ncs.maagic.Root) -> None:
+        """Add plan states of all services.
+
+        Parameters
+        ----------
+        root : ncs.maagic.Root
+            root node
+        """
+        for service in root.nano__nano.nano:
+            self.load_service(service)
+
+    def load_service(self, service: ncs.maagic.ListElement) -> None:
+        """Replace plan states of a service.
+
+        Parameters
+        ----------
+        service : ncs.maagic.ListElement
+            service node
+        """
+        svc_id = str(service.id)
+        self.remove(svc_id)
+        for component in service.plan.component:
+            for state in component.state:
+                self.set(
+                    (svc_id, str(component.type), str(component.name), str(state.name)),
+                    str(state.status),
+                    _string(state.post_action_status),
+                    _string(state.when),
+                )
+
+
+def _string(value: Any) -> Optional[str]:
+    """Convert an optional leaf value to a string."""
+    return str(value) if value is not None else None
+
+
+class PlanIndexSubscriber(ncs.cdb.OperSubscriber):
+    """Update the plan index from plan changes.
+
+    Parameters
+    ----------
+    index : PlanIndex
+        plan index
+    app : ncs.application.Application
+        application object
+    on_delete : Optional[Callable[[str], None]]
+        called with a service id when the plan of a service is deleted
+    """
+
+    def __init__(
+        self,
+        index: PlanIndex,
+        app: Any,
+        on_delete: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.index = index
+        self.on_delete = on_delete
+        self._loader: Optional[threading.Thread] = None
+        # states changed while the index is loaded
+        self._dirty: set[StateKey] = set()
+        self._dirty_lock = threading.Lock()
+        super().__init__(app=app)
+
+    def init(self) -> None:
+        """Register the subscription."""
+        self.register(PLAN_STATE_PATH, priority=100)
+
+    def start(self) -> None:
+        """Start the subscriber, then build the index in the background.
+
+        States changed while the index is built are read again after the
+        load, so a stale value read by the load doesn't stay.
+        """
+        super().start()
+        self._loader = threading.Thread(target=self._load, name="nano-plan-index", daemon=True)
+        self._loader.start()
+
+    def _load(self) -> None:
+        try:
+            with ncs.maapi.single_read_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+                self.index.load(ncs.maagic.get_root(t))
+            with self._dirty_lock:
+                dirty, self._dirty = self._dirty, set()
+                self.index.ready.set()
+            self._refresh(dirty)
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"Plan index load failed: {err}")
+
+    def _refresh(self, keys: set[StateKey]) -> None:
+        """Read plan states, missing states are removed from the index.
+
+        Parameters
+        ----------
+        keys : set[StateKey]
+            changed states
+        """
+        values = []
+        with ncs.maapi.single_read_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+            services = ncs.maagic.get_root(t).nano__nano.nano
+            for key in keys:
+                svc_id, com_type, com_name, state = key
+                try:
+                    node = services[svc_id].plan.component[com_type, com_name].state[state]
+                except KeyError:
+                    self.index.remove(*key)
+                    continue
+                when = _string(node.when) or ""
+                values.append((when, key, str(node.status), _string(node.post_action_status)))
+        # states reached together are added in order, for dwell times
+        for when, key, status, post_action_status in sorted(values):
+            self.index.set(key, status, post_action_status, when)
+
+    def pre_iterate(self) -> tuple[set[StateKey], list[tuple[str, ...]]]:
+        """Return an initial state.
+
+        Returns
+        -------
+        tuple[set[StateKey], list[tuple[str, ...]]]
+            changed states and deleted keypath keys
+        """
+        return set(), []
+
+    def iterate(
+        self,
+        kp: Any,
+        op: int,
+        oldv: Any,
+        newv: Any,
+        state: tuple[set[StateKey], list[tuple[str, ...]]],
+    ) -> int:
+        """Note changed and deleted plan states.
+
+        Parameters
+        ----------
+        kp : ncs.HKeypathRef
+            changed path
+        op : int
+            operation
+        oldv : Any
+            old value
+        newv : Any
+            new value
+        state : tuple[set[StateKey], list[tuple[str, ...]]]
+            changed states and deleted keypath keys
+
+        Returns
+        -------
+        int
+            recurse into created and modified nodes only down to states
+        """
+        changed, deleted = state
+        match = PLAN_KP_RE.match(str(kp))
+        if match is None:
+            return ncs.ITER_CONTINUE
+        keys = match.group("id", "type", "name", "state")
+        if op == ncs.MOP_DELETED:
+            deleted.append(tuple(key for key in keys if key is not None))
+            return ncs.ITER_CONTINUE
+        if keys[3] is None:
+            return ncs.ITER_RECURSE
+        changed.add(keys)  # type: ignore
+        return ncs.ITER_CONTINUE
+
+    def should_post_iterate(self, state: tuple[set[StateKey], list[tuple[str, ...]]]) -> bool:
+        """Update the index only if plan states are changed.
+
+        Parameters
+        ----------
+        state : tuple[set[StateKey], list[tuple[str, ...]]]
+            changed states and deleted keypath keys
+
+        Returns
+        -------
+        bool
+            True if there are changes
+        """
+        return any(state)
+
+    def post_iterate(self, state: tuple[set[StateKey], list[tuple[str, ...]]]) -> None:
+        """Apply changes to the index.
+
+        Parameters
+        ----------
+        state : tuple[set[StateKey], list[tuple[str, ...]]]
+            changed states and deleted keypath keys
+        """
+        changed, deleted = state
+        for keys in deleted:
+            self.index.remove(*keys)
+            if len(keys) == 1 and self.on_delete is not None:
+                try:
+                    self.on_delete(keys[0])
+                except Exception as err:  # pylint:disable=broad-except
+                    self.log.error(f"Plan delete handler failed: {keys[0]}: {err}")
+        with self._dirty_lock:
+            if not self.index.ready.is_set():
+                self._dirty.update(changed)
+        self._refresh(changed)
+
+
+class QueryAction(Action):
+    """Query services by plan state."""
+
+    def init(self, init_args: dict[str, Any]) -> None:
+        """Initialize an action.
+
+        Parameters
+        ----------
+        init_args : dict[str, Any]
+            plan `index`
+        """
+        self.index: PlanIndex = init_args["index"]
+
+    @Action.action
+    def cb_action(
+        self,
+        uinfo: ncs.UserInfo,
+        name: str,
+        kp: ncs.HKeypathRef,
+        a_input: ncs.maagic.ActionParams,
+        a_output: ncs.maagic.ActionParams,
+        trans: ncs.maapi.Transaction,
+    ) -> Any:
+        """Execute an action.
+
+        Parameters
+        ----------
+        uinfo : ncs.UserInfo
+            a UserInfo object
+        name : str
+            the tailf:action name
+        kp : ncs.HKeypathRef
+            the keypath of the action (HKeypathRef)
+        a_input : ncs.maagic.ActionParams
+            input node
+        a_output : ncs.maagic.ActionParams
+            output node
+        trans : ncs.maapi.Transaction
+            read only transaction, same as action transaction if
+            executed with an action context.
+
+        Returns
+        -------
+        Optional[Union[ncs.CONFD_OK, ncs.CONFD_ERR]]
+        """
+        if not self.index.ready.wait(READY_TIMEOUT):
+            a_output.result = False
+            a_output.msg = "Error: the plan index is loading, try again later."
+            return ncs.CONFD_OK
+        com_type = str(a_input.component_type)
+        state = str(a_input.state)
+        if a_input.post_action_status is not None:
+            status = f"post-action:{a_input.post_action_status}"
+        else:
+            status = str(a_input.status)
+        svc_ids = self.index.query(com_type, state, status)
+        offset = int(a_input.offset)
+        page = svc_ids[offset : offset + int(a_input.limit)]
+        for svc_id in page:
+            a_output.id.create(svc_id)
+        for count_status, count in self.index.counts(com_type, state).items():
+            a_output.count.create(count_status).services = count
+        a_output.total = len(svc_ids)
+        a_output.result = True
+        a_output.msg = f"{len(svc_ids)} services, {len(page)} from {offset}"
+        return ncs.CONFD_OK
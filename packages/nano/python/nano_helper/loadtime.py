@@ -0,0 +1,98 @@
+"""Lazy imports and load-time report.
+
+Note
+----
+Heavy dependencies (Jinja, Webex SDK) are imported on first use, so
+callbacks are registered right after the Python VM starts. A warm-up
+thread imports them in the background and logs the time spent per
+import. Genie parsers are not imported into the VM, they run in worker
+processes of `checks.genie_pool`.
+"""
+import importlib
+import sys
+import threading
+from collections.abc import Callable, Iterable
+from time import perf_counter
+from types import ModuleType
+from typing import Any, Optional
+
+WARMUP_IMPORTS = (
+    "jinja2",
+    "webexteamssdk",
+)
+
+LOAD_TIMES: dict[str, float] = {}
+
+
+def timed_import(name: str) -> ModuleType:
+    """Import a module and record the time spent.
+
+    Parameters
+    ----------
+    name : str
+        module name
+
+    Returns
+    -------
+    ModuleType
+        imported module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    start = perf_counter()
+    module = importlib.import_module(name)
+    LOAD_TIMES.setdefault(name, perf_counter() - start)
+    return module
+
+
+def report() -> str:
+    """Return a load-time report.
+
+    Returns
+    -------
+    str
+        milliseconds per import, the slowest first
+    """
+    times = sorted(LOAD_TIMES.items(), key=lambda item: item[1], reverse=True)
+    return ", ".join(f"{name}={sec * 1000:.1f}ms" for name, sec in times)
+
+
+def warm_up(
+    log: Any,
+    names: Iterable[str] = WARMUP_IMPORTS,
+    tasks: Optional[Iterable[Callable[[], Any]]] = None,
+) -> threading.Thread:
+    """Import modules and run tasks in a background thread.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    names : Iterable[str]
+        modules to import
+    tasks : Optional[Iterable[Callable[[], Any]]]
+        callables to run after imports, e.g. template compilation
+
+    Returns
+    -------
+    threading.Thread
+        started thread
+    """
+
+    def _run() -> None:
+        start = perf_counter()
+        for name in names:
+            try:
+                timed_import(name)
+            except ImportError as err:
+                log.warning(f"Warm-up import failed: {name}: {err}")
+        for task in tasks or ():
+            try:
+                task()
+            except Exception as err:  # pylint:disable=broad-except
+                log.error(f"Warm-up task failed: {err}")
+        log.info(f"Warm-up done in {(perf_counter() - start) * 1000:.1f}ms: {report()}")
+
+    thread = threading.Thread(target=_run, name="nano-warm-up", daemon=True)
+    thread.start()
+    return thread
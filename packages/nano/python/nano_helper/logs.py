@@ -0,0 +1,119 @@
+"""Structured logging for callbacks.
+
+Note
+----
+Callbacks log key/value records through `CallbackLog`. Nothing is
+formatted unless the level is enabled, and a field value may be a
+callable, e.g. `lambda: str(a_input)`, which is called only when the
+record is written, so `str()` of maagic nodes doesn't read CDB when
+debug is off. Debug records are sampled per callback: only every N-th
+invocation logs debug detail, N is set by `NANO_LOG_SAMPLE` env
+variable.
+"""
+import itertools
+import logging
+import threading
+from collections.abc import Iterator
+from os import environ
+from typing import Any
+
+SAMPLE_ENV_VAR = "NANO_LOG_SAMPLE"
+SAMPLE_EVERY = max(1, int(environ.get(SAMPLE_ENV_VAR, "1")))
+
+_counters: dict[str, Iterator[int]] = {}
+_counters_lock = threading.Lock()
+
+
+def is_enabled(log: Any, level: int) -> bool:
+    """Check if a level is enabled for a logger.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger, a wrapper of `logging.Logger`
+    level : int
+        logging level, e.g. `logging.DEBUG`
+
+    Returns
+    -------
+    bool
+        True if records of the level are written
+    """
+    for logger in (log, getattr(log, "log", None), getattr(log, "_logobject", None)):
+        if hasattr(logger, "isEnabledFor"):
+            return bool(logger.isEnabledFor(level))
+    return True
+
+
+def sampled(name: str) -> bool:
+    """Count an invocation of a callback, check if it's sampled.
+
+    Parameters
+    ----------
+    name : str
+        callback name
+
+    Returns
+    -------
+    bool
+        True for every `SAMPLE_EVERY`-th invocation
+    """
+    with _counters_lock:
+        counter = _counters.setdefault(name, itertools.count())
+        return next(counter) % SAMPLE_EVERY == 0
+
+
+def format_record(name: str, msg: str, fields: dict[str, Any]) -> str:
+    """Format a key/value record, callable values are called.
+
+    Parameters
+    ----------
+    name : str
+        callback name
+    msg : str
+        message
+    fields : dict[str, Any]
+        record fields
+
+    Returns
+    -------
+    str
+        e.g. `nano-create: Applying templates state=nano:banner-cfg`
+    """
+    items = (f"{key}={value() if callable(value) else value}" for key, value in fields.items())
+    return " ".join((f"{name}: {msg}", *items))
+
+
+class CallbackLog:
+    """A logger of a callback.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    name : str
+        callback name, used as a record prefix and a sampling key
+    """
+
+    def __init__(self, log: Any, name: str) -> None:
+        self.log = log
+        self.name = name
+        self.detail = is_enabled(log, logging.DEBUG) and sampled(name)
+
+    def debug(self, msg: str, **fields: Any) -> None:
+        """Write a debug record if the invocation is sampled."""
+        if self.detail:
+            self.log.debug(format_record(self.name, msg, fields))
+
+    def info(self, msg: str, **fields: Any) -> None:
+        """Write an info record."""
+        if is_enabled(self.log, logging.INFO):
+            self.log.info(format_record(self.name, msg, fields))
+
+    def warning(self, msg: str, **fields: Any) -> None:
+        """Write a warning record."""
+        self.log.warning(format_record(self.name, msg, fields))
+
+    def error(self, msg: str, **fields: Any) -> None:
+        """Write an error record."""
+        self.log.error(format_record(self.name, msg, fields))
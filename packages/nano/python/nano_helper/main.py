@@ -1,10 +1,28 @@
 """Components init module."""
+from time import perf_counter
+
 from ncs.application import Application  # type: ignore
 
-from .nano_cb import TemplateCfg
+from . import checks
+from .bulk import BulkAction
+from .commitqueue import CommitQueueSubscriber
+from .digest import TimeoutDigest
+from .health import DeviceHealth
+from .index import PlanIndex, PlanIndexSubscriber, QueryAction
+from .loadtime import warm_up
+from .metrics import MetricsExporter
+from .nano_cb import BANNER_STATE, NAME_SERVER_STATE, TRIGGER_STATE, TemplateCfg
+from .outbox import Outbox
+from .pools import POOLS, PoolSettingsSubscriber
+from .registry import TemplateRegistry
+from .runner import RunTestsAction
+from .sender import WebexSender
+from .settings import WebexSettings, WebexSettingsSubscriber
+from .sla import SlaEngine, SlaPlanSubscriber, SlaSettingsSubscriber
+from .snapshots import SnapshotStore
 from .spm import InitSPMAction
 from .tests import PostTestAction, PreTestAction
-from .webex import SendMsgAction
+from .webex import SendMsgAction, webex_settings
 
 
 class Init(Application):
@@ -12,18 +30,77 @@ class Init(Application):
 
     def setup(self):
         """Register callbacks."""
+        start = perf_counter()
         self.log.info("Main RUNNING")
-        self.register_action("send-msg-action", SendMsgAction)
-        self.register_action("pre-test-action", PreTestAction)
-        self.register_action("post-test-action", PostTestAction)
+        # callbacks without application services are available right away
+        for state in (BANNER_STATE, NAME_SERVER_STATE):
+            self.register_nano_service("nano-svcpoint", "nano:cfg-com-type", state, TemplateCfg)
+        self.register_nano_service("nano-svcpoint", "nano:sla-com-type", TRIGGER_STATE, TemplateCfg)
         self.register_action("init-spm-action", InitSPMAction)
-        self.register_nano_service(
-            "nano-svcpoint",
-            "nano:cfg-com-type",
-            "nano:name-server-cfg",
-            TemplateCfg,
+        self.log.info(f"Nano callbacks registered in {(perf_counter() - start) * 1000:.1f}ms")
+        self.templates = TemplateRegistry()
+        self.templates.load()
+        self.settings = WebexSettings(webex_settings)
+        self.settings_sub = WebexSettingsSubscriber(self.settings, app=self)
+        self.settings_sub.start()
+        self.cq_sub = CommitQueueSubscriber(app=self)
+        self.cq_sub.start()
+        self.snapshots = SnapshotStore()
+        self.plan_index = PlanIndex()
+        self.index_sub = PlanIndexSubscriber(
+            self.plan_index, app=self, on_delete=self.snapshots.delete
+        )
+        self.index_sub.start()
+        self.pools_sub = PoolSettingsSubscriber(POOLS, app=self)
+        self.pools_sub.start()
+        self.outbox = Outbox()
+        self.sender = WebexSender(self.log, self.settings, self.outbox)
+        self.sender.start()
+        self.metrics = MetricsExporter(self.log, pools=POOLS, index=self.plan_index)
+        self.metrics.start()
+        self.digest = TimeoutDigest(self.log, self.templates.render, self.sender)
+        self.sla = SlaEngine(self.log)
+        self.sla.start()
+        self.sla_sub = SlaSettingsSubscriber(self.sla, app=self)
+        self.sla_sub.start()
+        self.sla_plan_sub = SlaPlanSubscriber(self.sla, app=self)
+        self.sla_plan_sub.start()
+        self.register_action(
+            "send-msg-action",
+            SendMsgAction,
+            {
+                "sender": self.sender,
+                "digest": self.digest,
+                "settings": self.settings,
+                "templates": self.templates,
+            },
+        )
+        self.health = DeviceHealth(self.log)
+        tests_args = {"snapshots": self.snapshots, "health": self.health}
+        self.register_action("pre-test-action", PreTestAction, tests_args)
+        self.register_action("post-test-action", PostTestAction, tests_args)
+        self.register_action(
+            "run-tests-action", RunTestsAction, {**tests_args, "index": self.plan_index}
         )
+        self.register_action("query-action", QueryAction, {"index": self.plan_index})
+        self.register_action("bulk-action", BulkAction)
+        self.log.info(f"Main callbacks registered in {(perf_counter() - start) * 1000:.1f}ms")
+        self.warm_up = warm_up(self.log, tasks=[self.templates.warm])
 
     def teardown(self):
         """Teardown gracefully."""
+        self.sla_plan_sub.stop()
+        self.sla_sub.stop()
+        self.sla.stop()
+        self.digest.stop()
+        self.metrics.stop()
+        checks.shutdown()
+        self.health.stop()
+        self.sender.stop()
+        self.outbox.close()
+        self.snapshots.close()
+        self.settings_sub.stop()
+        self.cq_sub.stop()
+        self.index_sub.stop()
+        self.pools_sub.stop()
         self.log.info("Main FINISHED")
@@ -0,0 +1,370 @@
+"""Callback latency and plan dwell time metrics.
+
+Note
+----
+Callbacks decorated with `timed` record their duration and outcome in
+in-memory histograms. Plan state dwell times are collected by the plan
+index from plan changes, see `index.PlanIndex`. An exporter thread
+periodically writes everything to `/nano/stats` operational data and
+to a Prometheus text file for the node_exporter textfile collector,
+`nano.prom` in the package state directory or `NANO_METRICS_FILE`.
+Worker pool queue depth, wait times and rejections are exported along,
+see `pools`.
+"""
+import datetime as dt
+import functools
+import threading
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from os import environ, replace
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Optional
+
+import ncs  # type: ignore
+
+from .state import state_path
+
+if TYPE_CHECKING:
+    from .index import PlanIndex
+    from .pools import ActionPools, PoolStats
+
+EXPORT_INTERVAL = 60
+METRICS_ENV_VAR = "NANO_METRICS_FILE"
+METRICS_FILE = "nano.prom"
+# seconds
+CALLBACK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DWELL_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600, 14400, 86400)
+
+
+class Histogram:
+    """A cumulative histogram with fixed buckets.
+
+    Parameters
+    ----------
+    buckets : tuple[float, ...]
+        upper bounds of buckets, ascending
+    """
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Add a value.
+
+        Parameters
+        ----------
+        value : float
+            observed value
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as an upper bound of its bucket.
+
+        Parameters
+        ----------
+        q : float
+            quantile, e.g. 0.99
+
+        Returns
+        -------
+        float
+            bucket upper bound, the last bound for the overflow bucket
+        """
+        rank = q * self.count
+        seen = 0
+        for num, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[min(num, len(self.buckets) - 1)]
+        return 0.0
+
+    def cumulative(self) -> Iterable[tuple[str, int]]:
+        """Return Prometheus `le` labels and cumulative counts.
+
+        Returns
+        -------
+        Iterable[tuple[str, int]]
+            bucket bounds and counts, `+Inf` is the last one
+        """
+        total = 0
+        for bound, count in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+    def copy(self) -> "Histogram":
+        """Return a copy of the histogram.
+
+        Returns
+        -------
+        Histogram
+            an independent copy
+        """
+        copy = Histogram(self.buckets)
+        copy.counts = list(self.counts)
+        copy.sum = self.sum
+        copy.count = self.count
+        return copy
+
+
+class Metrics:
+    """Callback metrics registry."""
+
+    def __init__(self) -> None:
+        self.durations: dict[str, Histogram] = {}
+        self.errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, ok: bool) -> None:
+        """Record a callback invocation.
+
+        Parameters
+        ----------
+        name : str
+            callback name
+        seconds : float
+            duration
+        ok : bool
+            False if the callback failed
+        """
+        with self._lock:
+            self.durations.setdefault(name, Histogram(CALLBACK_BUCKETS)).observe(seconds)
+            self.errors[name] = self.errors.get(name, 0) + (0 if ok else 1)
+
+    def snapshot(self) -> tuple[dict[str, Histogram], dict[str, int]]:
+        """Return a consistent copy of all metrics.
+
+        Returns
+        -------
+        tuple[dict[str, Histogram], dict[str, int]]
+            durations and errors by callback name
+        """
+        with self._lock:
+            return {name: hist.copy() for name, hist in self.durations.items()}, dict(self.errors)
+
+
+METRICS = Metrics()
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Record duration and outcome of a callback.
+
+    Parameters
+    ----------
+    name : Optional[str]
+        callback name, e.g. spm-init; the tailf:action name of an
+        action callback if None
+
+    Returns
+    -------
+    Callable
+        decorator, a callback fails if it raises or returns CONFD_ERR
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = perf_counter()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = result != ncs.CONFD_ERR
+                return result
+            finally:
+                # cb_action(self, uinfo, name, ...)
+                METRICS.observe(name or str(args[2]), perf_counter() - start, ok)
+
+        return wrapper
+
+    return decorator
+
+
+def _labels(**labels: str) -> str:
+    """Format Prometheus labels."""
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _histogram_lines(
+    lines: list[str], metric: str, doc: str, series: list[tuple[dict[str, str], Histogram]]
+) -> None:
+    """Append a histogram in the Prometheus text format.
+
+    Parameters
+    ----------
+    lines : list[str]
+        output lines
+    metric : str
+        metric name
+    doc : str
+        metric help
+    series : list[tuple[dict[str, str], Histogram]]
+        labels and histograms
+    """
+    lines += [f"# HELP {metric} {doc}", f"# TYPE {metric} histogram"]
+    for labels, hist in series:
+        for bound, count in hist.cumulative():
+            lines.append(f"{metric}_bucket{{{_labels(**labels, le=bound)}}} {count}")
+        lines.append(f"{metric}_sum{{{_labels(**labels)}}} {hist.sum}")
+        lines.append(f"{metric}_count{{{_labels(**labels)}}} {hist.count}")
+
+
+def prometheus_text(
+    durations: dict[str, Histogram],
+    errors: dict[str, int],
+    dwell: dict[tuple[str, str], Histogram],
+    pools: Optional[list["PoolStats"]] = None,
+) -> str:
+    """Format metrics in the Prometheus text format.
+
+    Parameters
+    ----------
+    durations : dict[str, Histogram]
+        callback durations by name
+    errors : dict[str, int]
+        failed callbacks by name
+    dwell : dict[tuple[str, str], Histogram]
+        dwell times by component type and state
+    pools : Optional[list[PoolStats]]
+        worker pool snapshots
+
+    Returns
+    -------
+    str
+        text file content
+    """
+    lines: list[str] = []
+    _histogram_lines(
+        lines,
+        "nano_callback_duration_seconds",
+        "Duration of nano_helper callbacks.",
+        [({"callback": name}, hist) for name, hist in sorted(durations.items())],
+    )
+    lines += [
+        "# HELP nano_callback_errors_total Failed nano_helper callbacks.",
+        "# TYPE nano_callback_errors_total counter",
+    ]
+    for name, count in sorted(errors.items()):
+        lines.append(f"nano_callback_errors_total{{{_labels(callback=name)}}} {count}")
+    _histogram_lines(
+        lines,
+        "nano_plan_state_dwell_seconds",
+        "Time from the previous reached plan state.",
+        [
+            ({"component_type": com_type, "state": state}, hist)
+            for (com_type, state), hist in sorted(dwell.items())
+        ],
+    )
+    pools = pools or []
+    _histogram_lines(
+        lines,
+        "nano_pool_wait_seconds",
+        "Time callbacks waited for a worker of an action point.",
+        [({"pool": pool.name}, pool.wait) for pool in pools],
+    )
+    for metric, kind, doc, attr in (
+        ("nano_pool_active", "gauge", "Callbacks in progress.", "active"),
+        ("nano_pool_queued", "gauge", "Callbacks waiting for a worker.", "queued"),
+        ("nano_pool_rejected_total", "counter", "Rejected callbacks.", "rejected"),
+    ):
+        lines += [f"# HELP {metric} {doc}", f"# TYPE {metric} {kind}"]
+        for pool in pools:
+            lines.append(f"{metric}{{{_labels(pool=pool.name)}}} {getattr(pool, attr)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Export metrics periodically.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    interval : float
+        seconds between exports
+    pools : Optional[ActionPools]
+        worker pools to export
+    index : Optional[PlanIndex]
+        plan index with dwell times to export
+    """
+
+    def __init__(
+        self,
+        log: Any,
+        interval: float = EXPORT_INTERVAL,
+        pools: Optional["ActionPools"] = None,
+        index: Optional["PlanIndex"] = None,
+    ) -> None:
+        self.log = log
+        self.interval = interval
+        self.pools = pools
+        self.index = index
+        self.filename = environ.get(METRICS_ENV_VAR) or state_path(METRICS_FILE)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the exporter thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="nano-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the exporter thread.
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for the thread
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.export()
+            except Exception as err:  # pylint:disable=broad-except
+                self.log.error(f"Metrics export failed: {err}")
+
+    def export(self) -> None:
+        """Write metrics to operational data and the text file."""
+        durations, errors = METRICS.snapshot()
+        pools = self.pools.snapshot() if self.pools is not None else []
+        dwell = self.index.dwell_times() if self.index is not None else {}
+        with ncs.maapi.single_write_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+            stats = ncs.maagic.get_root(t).nano__nano.stats
+            for name, hist in durations.items():
+                entry = stats.callback.create(name)
+                entry.count = hist.count
+                entry.errors = errors.get(name, 0)
+                entry.avg_ms = f"{hist.sum / hist.count * 1000:.3f}" if hist.count else "0"
+                entry.p99_ms = f"{hist.quantile(0.99) * 1000:.3f}"
+            stats.dwell.delete()
+            for (com_type, state), hist in dwell.items():
+                entry = stats.dwell.create(com_type, state)
+                entry.count = hist.count
+                entry.avg_seconds = int(hist.sum / hist.count)
+            for pool in pools:
+                entry = stats.pool.create(pool.name)
+                entry.max_workers = pool.max_workers
+                entry.active = pool.active
+                entry.queued = pool.queued
+                entry.admitted = pool.admitted
+                entry.rejected = pool.rejected
+                wait = pool.wait
+                entry.avg_wait_ms = f"{wait.sum / wait.count * 1000:.3f}" if wait.count else "0"
+                entry.p99_wait_ms = f"{wait.quantile(0.99) * 1000:.3f}"
+            stats.updated = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+            t.apply()
+        tmp_file = f"{self.filename}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as fp:
+            fp.write(prometheus_text(durations, errors, dwell, pools))
+        # node_exporter must not read a partially written file
+        replace(tmp_file, self.filename)
@@ -1,14 +1,126 @@
 """Nano service python callback."""
 # pylint:disable=too-many-arguments
+from typing import Optional
+
 import ncs  # type: ignore
 from ncs.application import NanoService  # type: ignore
 from ncs.template import Template, Variables  # type: ignore
 
+from .commitqueue import DEFERRED, PUSHED, is_queued, use_commit_queue
+from .logs import CallbackLog
+from .metrics import timed
+
+
+BANNER_STATE = "nano:banner-cfg"
+NAME_SERVER_STATE = "nano:name-server-cfg"
+TRIGGER_STATE = "nano:trigger-created"
+
+
+def service_devices(root: ncs.maagic.Root, service: ncs.maagic.ListElement) -> list[str]:
+    """Return target devices of a service.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+    service : ncs.maagic.ListElement
+        service node
+
+    Returns
+    -------
+    list[str]
+        `device`, `devices` and members of `device-group`, without
+        duplicates
+    """
+    devices = [str(service.device)] if service.device is not None else []
+    devices.extend(str(device) for device in service.devices)
+    if service.device_group is not None:
+        group = root.devices.device_group[service.device_group]
+        devices.extend(str(device) for device in group.member)
+    return list(dict.fromkeys(devices))
+
+
+def apply_template(
+    service: ncs.maagic.ListElement,
+    name: str,
+    devices: list[str],
+    common: tuple[tuple[str, str], ...] = (),
+) -> None:
+    """Apply a device template to all target devices.
+
+    Parameters
+    ----------
+    service : ncs.maagic.ListElement
+        service node
+    name : str
+        template name, the template uses `$DEVICE`
+    devices : list[str]
+        target devices
+    common : tuple[tuple[str, str], ...]
+        variables shared by all devices
+    """
+    template = Template(service)
+    for device in devices:
+        template.apply(name, Variables(common + (("DEVICE", device),)))
+
+
+def apply_banner(service: ncs.maagic.ListElement, devices: list[str]) -> None:
+    """Apply the banner template.
+
+    Parameters
+    ----------
+    service : ncs.maagic.ListElement
+        service node
+    devices : list[str]
+        target devices
+    """
+    apply_template(service, "nano-banner", devices)
+
+
+def apply_name_server(service: ncs.maagic.ListElement, devices: list[str]) -> None:
+    """Apply the name server template.
+
+    Parameters
+    ----------
+    service : ncs.maagic.ListElement
+        service node
+    devices : list[str]
+        target devices
+    """
+    common = (
+        ("name-server", service.name_server),
+        ("domain-list", "example.com"),
+        ("domain-name", "example.com"),
+        ("domain-name-lookup", "true"),
+    )
+    apply_template(service, "nano-name-server", devices, common)
+
 
 class TemplateCfg(NanoService):
-    """Nano service class."""
+    """Nano service class.
+
+    Device configuration states push their config in separate
+    transactions. With `merged-push` set, `banner-cfg` applies both
+    templates, so the device gets all config in one push and the
+    `name-server-cfg` transaction has no device changes.
+
+    In commit-queue mode config states push device config only in
+    transactions with a commit queue, so they don't wait for the device.
+    In other transactions a state not pushed yet applies nothing and is
+    marked `deferred` in the component properties, the config is pushed
+    by a queued re-deploy. States are reached when their queue items
+    complete, see `commitqueue`.
+
+    A service may target many devices; variables are built once per
+    state and templates are applied to all devices in the same
+    transaction.
+
+    `trigger-created` creates an SPM trigger only if `/nano/sla/engine`
+    is `spm`, the timer wheel engine tracks services without triggers.
+    """
 
     @NanoService.create
+    @timed("nano-create")
     def cb_nano_create(
         self,
         tctx: ncs.TransCtxRef,
@@ -19,8 +131,8 @@ class TemplateCfg(NanoService):
         state: str,
         opaque: list[tuple[str, str]],
         compproplist: list[tuple[str, str]],
-    ) -> None:
-        """Fill variables into template.
+    ) -> Optional[list[tuple[str, str]]]:
+        """Apply templates of a device configuration state.
 
         Parameters
         ----------
@@ -40,27 +152,42 @@ class TemplateCfg(NanoService):
             properties
         compproplist : list[tuple[str, str]]
             component properties
+
+        Returns
+        -------
+        Optional[list[tuple[str, str]]]
+            properties of config states, push status by state name
         """
-        self.log.info(
-            f"Nano service callback invoked: {service=} {component[0]=} {component[1]=} {state=}"
-        )
-        self.log.info(
-            f"{tctx=}, {root=}, {service=}, {plan=}, {component=}, {state=}, "
-            f"{opaque=}, {compproplist=}"
-        )
-        status = service.plan.component[component].state[state].status.string
-        self.log.info(f"State status: {status=}")
-
-        name_server = service.name_server
-
-        t_vars = Variables(
-            (
-                ("name-server", name_server),
-                ("domain-list", "example.com"),
-                ("domain-name", "example.com"),
-                ("domain-name-lookup", "true"),
-            )
+        log = CallbackLog(self.log, "nano-create")
+        log.info("Applying templates", id=service.id, component=component[1], state=state)
+        log.debug(
+            "Callback detail",
+            status=lambda: service.plan.component[component].state[state].status.string,
+            opaque=opaque,
+            compproplist=compproplist,
         )
 
-        name_server_tmpl = Template(service)
-        name_server_tmpl.apply("nano-name-server", t_vars)
+        if state == TRIGGER_STATE:
+            if root.nano__nano.sla.engine == "spm":
+                Template(service).apply("nano-spm-trigger")
+            return
+        if state == NAME_SERVER_STATE and service.merged_push:
+            # pushed by banner-cfg
+            return opaque
+        props = dict(opaque)
+        if use_commit_queue(root, service):
+            reached = service.plan.component[component].state[state].status == "reached"
+            if props.get(state) != PUSHED and not reached:
+                if not is_queued(ncs.maagic.get_trans(root)):
+                    log.info("Device config deferred to a queued re-deploy", id=service.id)
+                    props[state] = DEFERRED
+                    return list(props.items())
+                props[state] = PUSHED
+        devices = service_devices(root, service)
+        if state == BANNER_STATE:
+            apply_banner(service, devices)
+            if service.merged_push:
+                apply_name_server(service, devices)
+        else:
+            apply_name_server(service, devices)
+        return list(props.items())
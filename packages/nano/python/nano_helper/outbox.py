@@ -0,0 +1,184 @@
+"""Durable notification outbox.
+
+Note
+----
+Every rendered message is stored in a SQLite database in the package
+state directory before it is sent, and removed after a successful
+delivery. Pending messages survive a package reload and are sent again
+when the application starts. Undeliverable messages are kept as
+`failed` for `FAILED_RETENTION` seconds, then pruned by the sender.
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .state import state_path
+
+OUTBOX_FILE = "nano-outbox.db"
+STATUS_PENDING = "pending"
+STATUS_FAILED = "failed"
+# seconds
+FAILED_RETENTION = 7 * 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    markdown TEXT NOT NULL,
+    attachments TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+
+@dataclass
+class OutboxEntry:
+    """A stored message."""
+
+    id: int
+    markdown: str
+    attachments: list[dict[str, Any]]
+    attempts: int
+
+
+class Outbox:
+    """Store messages until they are delivered.
+
+    Parameters
+    ----------
+    filename : Optional[str]
+        database file, `nano-outbox.db` in the package state directory
+        by default
+    """
+
+    def __init__(self, filename: Optional[str] = None) -> None:
+        self.filename = filename or state_path(OUTBOX_FILE)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.filename, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+    def add(self, markdown: str, attachments: list[dict[str, Any]]) -> int:
+        """Store a new message.
+
+        Parameters
+        ----------
+        markdown : str
+            message text
+        attachments : list[dict[str, Any]]
+            message attachments
+
+        Returns
+        -------
+        int
+            message id
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO outbox (markdown, attachments, status, next_attempt, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (markdown, json.dumps(attachments), STATUS_PENDING, now, now),
+            )
+        return int(cur.lastrowid)
+
+    def due(self, limit: int) -> list[OutboxEntry]:
+        """Return pending messages ready for the next attempt.
+
+        Parameters
+        ----------
+        limit : int
+            maximum number of messages
+
+        Returns
+        -------
+        list[OutboxEntry]
+            messages in order of creation
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, markdown, attachments, attempts FROM outbox "
+                "WHERE status = ? AND next_attempt <= ? ORDER BY id LIMIT ?",
+                (STATUS_PENDING, time.time(), limit),
+            ).fetchall()
+        return [OutboxEntry(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def done(self, msg_id: int) -> None:
+        """Remove a delivered message.
+
+        Parameters
+        ----------
+        msg_id : int
+            message id
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (msg_id,))
+
+    def retry(self, msg_id: int, delay: float, error: str) -> None:
+        """Schedule another attempt for a message.
+
+        Parameters
+        ----------
+        msg_id : int
+            message id
+        delay : float
+            seconds before the next attempt
+        error : str
+            reason of the failed attempt
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ? "
+                "WHERE id = ?",
+                (time.time() + delay, error, msg_id),
+            )
+
+    def fail(self, msg_id: int, error: str) -> None:
+        """Keep an undeliverable message for investigation only.
+
+        Parameters
+        ----------
+        msg_id : int
+            message id
+        error : str
+            reason of the last failed attempt
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ? "
+                "WHERE id = ?",
+                (STATUS_FAILED, error, msg_id),
+            )
+
+    def prune(self, max_age: float = FAILED_RETENTION) -> int:
+        """Remove failed messages created more than `max_age` ago.
+
+        Parameters
+        ----------
+        max_age : float
+            seconds to keep failed messages
+
+        Returns
+        -------
+        int
+            number of removed messages
+        """
+        with self._lock:
+            cur = self._db.execute(
+                "DELETE FROM outbox WHERE status = ? AND created < ?",
+                (STATUS_FAILED, time.time() - max_age),
+            )
+        return int(cur.rowcount)
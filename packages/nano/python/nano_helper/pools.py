@@ -0,0 +1,362 @@
+"""Worker pools of action points.
+
+Note
+----
+All action points of the package are served by the same Python VM, so
+slow live-status tests could hold up notifications and SLA `timeout`
+callbacks. Every action point decorated with `pooled` has its own pool:
+at most `max-workers` callbacks run at once, others wait in a queue
+ordered by the priority of the tailf:action name, then by arrival.
+A callback which waits longer than `queue-timeout`, or finds the queue
+full, is rejected with an error instead of piling up. High priority
+callbacks, e.g. SLA `timeout`, are never rejected because of a full
+queue.
+
+Pools are configured in `/nano/workers`, queue depth, wait times and
+rejections are exported to `/nano/stats/pool` by `MetricsExporter`.
+"""
+import functools
+import heapq
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from itertools import count
+from time import monotonic
+from typing import Any
+
+import ncs  # type: ignore
+
+from .metrics import Histogram
+from .subscribers import ReloadSubscriber
+
+WORKERS_PATH = "/nano:nano/nano:workers"
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_LEVELS = {"high": PRIORITY_HIGH, "normal": PRIORITY_NORMAL, "low": PRIORITY_LOW}
+# seconds
+WAIT_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+class PoolRejected(Exception):
+    """A callback is not admitted to a pool."""
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    """Limits of a pool."""
+
+    max_workers: int
+    queue_size: int
+    queue_timeout: float
+
+
+POOL_DEFAULTS = PoolSettings(max_workers=8, queue_size=100, queue_timeout=60)
+# pools without `/nano/workers/pool` entries
+DEFAULT_POOLS = {
+    "send-msg-action": PoolSettings(max_workers=16, queue_size=500, queue_timeout=60),
+    "pre-test-action": PoolSettings(max_workers=8, queue_size=200, queue_timeout=600),
+    "post-test-action": PoolSettings(max_workers=8, queue_size=200, queue_timeout=600),
+    "init-spm-action": PoolSettings(max_workers=1, queue_size=10, queue_timeout=60),
+}
+# tailf:action names without `/nano/workers/priority` entries are normal
+DEFAULT_PRIORITIES = {"timeout": PRIORITY_HIGH}
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    admitted: bool = field(default=False, compare=False)
+
+
+@dataclass
+class PoolStats:
+    """A snapshot of a pool."""
+
+    name: str
+    max_workers: int
+    active: int
+    queued: int
+    admitted: int
+    rejected: int
+    wait: Histogram
+
+
+class ActionPool:
+    """A concurrency limit with a bounded priority queue.
+
+    Parameters
+    ----------
+    name : str
+        action point
+    settings : PoolSettings
+        limits
+    """
+
+    def __init__(self, name: str, settings: PoolSettings) -> None:
+        self.name = name
+        self.settings = settings
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait = Histogram(WAIT_BUCKETS)
+        self._waiting: list[_Waiter] = []
+        self._seq = count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int) -> float:
+        """Wait for a free worker.
+
+        Parameters
+        ----------
+        priority : int
+            lower values are admitted first
+
+        Returns
+        -------
+        float
+            seconds waited
+
+        Raises
+        ------
+        PoolRejected
+            If the queue is full or no worker is free in `queue_timeout`
+        """
+        start = monotonic()
+        with self._cond:
+            if self.active < self.settings.max_workers and not self._waiting:
+                self.active += 1
+                self.admitted += 1
+                self.wait.observe(0.0)
+                return 0.0
+            if priority != PRIORITY_HIGH and len(self._waiting) >= self.settings.queue_size:
+                self.rejected += 1
+                raise PoolRejected(
+                    f"Error: '{self.name}' is busy, {len(self._waiting)} callbacks wait."
+                )
+            waiter = _Waiter(priority, next(self._seq))
+            heapq.heappush(self._waiting, waiter)
+            while not waiter.admitted:
+                timeout = self.settings.queue_timeout
+                remaining = start + timeout - monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(waiter)
+                    heapq.heapify(self._waiting)
+                    self.rejected += 1
+                    raise PoolRejected(
+                        f"Error: '{self.name}' had no free worker in {timeout:g} seconds."
+                    )
+                self._cond.wait(remaining)
+            waited = monotonic() - start
+            self.wait.observe(waited)
+            return waited
+
+    def release(self) -> None:
+        """Free a worker, admit the next waiting callback."""
+        with self._cond:
+            self.active -= 1
+            self._admit()
+
+    def resize(self, settings: PoolSettings) -> None:
+        """Change limits, callbacks in progress are not interrupted.
+
+        Parameters
+        ----------
+        settings : PoolSettings
+            new limits
+        """
+        with self._cond:
+            self.settings = settings
+            self._admit()
+
+    def _admit(self) -> None:
+        admitted = False
+        while self._waiting and self.active < self.settings.max_workers:
+            heapq.heappop(self._waiting).admitted = True
+            self.active += 1
+            self.admitted += 1
+            admitted = True
+        if admitted:
+            self._cond.notify_all()
+
+    def stats(self) -> PoolStats:
+        """Return a snapshot of the pool.
+
+        Returns
+        -------
+        PoolStats
+            counters and a copy of the wait time histogram
+        """
+        with self._cond:
+            return PoolStats(
+                self.name,
+                self.settings.max_workers,
+                self.active,
+                len(self._waiting),
+                self.admitted,
+                self.rejected,
+                self.wait.copy(),
+            )
+
+
+class ActionPools:
+    """Pools by action point and priorities by tailf:action name."""
+
+    def __init__(self) -> None:
+        self._settings = dict(DEFAULT_POOLS)
+        self._priorities = dict(DEFAULT_PRIORITIES)
+        self._pools: dict[str, ActionPool] = {}
+        self._lock = threading.Lock()
+
+    def pool(self, name: str) -> ActionPool:
+        """Return a pool, create it on first use.
+
+        Parameters
+        ----------
+        name : str
+            action point
+
+        Returns
+        -------
+        ActionPool
+            the pool of the action point
+        """
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = ActionPool(name, self._settings.get(name, POOL_DEFAULTS))
+            return self._pools[name]
+
+    def priority(self, action: str) -> int:
+        """Return a priority of a tailf:action name.
+
+        Parameters
+        ----------
+        action : str
+            e.g. timeout
+
+        Returns
+        -------
+        int
+            one of `PRIORITY_LEVELS`
+        """
+        return self._priorities.get(action, PRIORITY_NORMAL)
+
+    def configure(self, settings: dict[str, PoolSettings], priorities: dict[str, int]) -> None:
+        """Replace configured limits and priorities.
+
+        Parameters
+        ----------
+        settings : dict[str, PoolSettings]
+            limits by action point, merged with `DEFAULT_POOLS`
+        priorities : dict[str, int]
+            priorities by tailf:action name, merged with
+            `DEFAULT_PRIORITIES`
+        """
+        with self._lock:
+            self._settings = {**DEFAULT_POOLS, **settings}
+            self._priorities = {**DEFAULT_PRIORITIES, **priorities}
+            merged = self._settings
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.resize(merged.get(pool.name, POOL_DEFAULTS))
+
+    def snapshot(self) -> list[PoolStats]:
+        """Return snapshots of all pools.
+
+        Returns
+        -------
+        list[PoolStats]
+            pools sorted by name
+        """
+        with self._lock:
+            pools = sorted(self._pools.values(), key=lambda pool: pool.name)
+        return [pool.stats() for pool in pools]
+
+
+POOLS = ActionPools()
+
+
+def pooled(func: Callable) -> Callable:
+    """Run an action callback in the pool of its action point.
+
+    A rejected callback sets `result` and `msg` of the output and
+    returns CONFD_ERR.
+
+    Parameters
+    ----------
+    func : Callable
+        `cb_action` of an `ncs.dp.Action`
+
+    Returns
+    -------
+    Callable
+        decorated callback
+    """
+
+    @functools.wraps(func)
+    def wrapper(
+        self: Any, uinfo: Any, name: str, kp: Any, a_input: Any, a_output: Any, trans: Any
+    ) -> Any:
+        if self.actionpoint is None:
+            return func(self, uinfo, name, kp, a_input, a_output, trans)
+        pool = POOLS.pool(self.actionpoint)
+        try:
+            pool.acquire(POOLS.priority(str(name)))
+        except PoolRejected as err:
+            self.log.warning(f"{name} rejected: {err}")
+            a_output.result = False
+            a_output.msg = str(err)
+            return ncs.CONFD_ERR
+        try:
+            return func(self, uinfo, name, kp, a_input, a_output, trans)
+        finally:
+            pool.release()
+
+    return wrapper
+
+
+def load_pool_settings() -> tuple[dict[str, PoolSettings], dict[str, int]]:
+    """Read `/nano/workers`.
+
+    Returns
+    -------
+    tuple[dict[str, PoolSettings], dict[str, int]]
+        limits by action point and priorities by tailf:action name
+    """
+    with ncs.maapi.single_read_trans("admin", "python") as t:
+        workers = ncs.maagic.get_root(t).nano__nano.workers
+        settings = {
+            str(pool.action_point): PoolSettings(
+                int(pool.max_workers), int(pool.queue_size), int(pool.queue_timeout)
+            )
+            for pool in workers.pool
+        }
+        priorities = {
+            str(priority.action): PRIORITY_LEVELS[str(priority.level)]
+            for priority in workers.priority
+        }
+    return settings, priorities
+
+
+class PoolSettingsSubscriber(ReloadSubscriber):
+    """Reconfigure pools on configuration changes.
+
+    Parameters
+    ----------
+    pools : ActionPools
+        pools to configure
+    app : ncs.application.Application
+        application object
+    """
+
+    def __init__(self, pools: ActionPools, app: Any) -> None:
+        self.pools = pools
+        super().__init__(app, self.reload_pools, WORKERS_PATH)
+
+    def reload_pools(self) -> None:
+        """Apply the current configuration, keep old limits on errors."""
+        try:
+            self.pools.configure(*load_pool_settings())
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"Worker pools reload failed: {err}")
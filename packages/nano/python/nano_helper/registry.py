@@ -0,0 +1,304 @@
+"""Notification template registry.
+
+Note
+----
+All templates are validated when the application starts, so a broken
+template fails the package load. Markdown templates are compiled by
+the warm-up thread, compiled code is kept in a Jinja bytecode cache in
+the package state directory.
+
+Adaptive card templates `{name}-ac.json.j2` are JSON documents with
+Jinja templates in string values. A card is parsed once and rendered
+straight into Python structures; only strings with Jinja syntax are
+rendered per message. A `"$if"` key with a Jinja expression drops an
+object from its parent if the expression is false.
+"""
+import json
+import threading
+from os import environ, listdir, makedirs, path
+from typing import Any, Optional, Union
+
+from .loadtime import timed_import
+from .sender import Message
+from .state import state_path
+
+TMPL_SUBFOLDER = "templates"
+TMPL_FOLDER = path.join(path.dirname(path.abspath(__file__)), TMPL_SUBFOLDER)
+MD_SUFFIX = ".md.j2"
+AC_SUFFIX = "-ac.json.j2"
+COND_KEY = "$if"
+CACHE_FOLDER = "j2-cache"
+# re-read changed templates from disk, for development only
+RELOAD_ENV_VAR = "NANO_TEMPLATES_RELOAD"
+
+_SKIP = object()
+
+
+class _Leaf:
+    """A string with Jinja syntax."""
+
+    def __init__(self, template: Any) -> None:
+        self.template = template
+
+    def render(self, params: dict[str, Any]) -> Any:
+        return self.template.render(params)
+
+
+class _Dict:
+    """An object with dynamic values or a condition."""
+
+    def __init__(self, items: dict[str, Any], cond: Any = None) -> None:
+        self.items = items
+        self.cond = cond
+
+    def render(self, params: dict[str, Any]) -> Any:
+        if self.cond is not None and not self.cond(**params):
+            return _SKIP
+        rendered = {}
+        for key, value in self.items.items():
+            value = _render(value, params)
+            if value is not _SKIP:
+                rendered[key] = value
+        return rendered
+
+
+class _List:
+    """An array with dynamic items."""
+
+    def __init__(self, items: list[Any]) -> None:
+        self.items = items
+
+    def render(self, params: dict[str, Any]) -> Any:
+        rendered = []
+        for item in self.items:
+            item = _render(item, params)
+            if item is not _SKIP:
+                rendered.append(item)
+        return rendered
+
+
+def _render(node: Any, params: dict[str, Any]) -> Any:
+    """Render a compiled card node, static nodes are returned as is.
+
+    Parameters
+    ----------
+    node : Any
+        compiled node
+    params : dict[str, Any]
+        template parameters
+
+    Returns
+    -------
+    Any
+        a rendered structure
+    """
+    if isinstance(node, (_Leaf, _Dict, _List)):
+        return node.render(params)
+    return node
+
+
+def _is_template(value: str) -> bool:
+    """Check if a string contains Jinja syntax.
+
+    Parameters
+    ----------
+    value : str
+        string to check
+
+    Returns
+    -------
+    bool
+        True for a template
+    """
+    return "{{" in value or "{%" in value
+
+
+class TemplateRegistry:
+    """Compile, validate and render notification templates.
+
+    Parameters
+    ----------
+    folder : str
+        templates folder
+    reload : Optional[bool]
+        re-read changed templates, `NANO_TEMPLATES_RELOAD` env variable
+        by default
+    """
+
+    def __init__(self, folder: str = TMPL_FOLDER, reload: Optional[bool] = None) -> None:
+        self.folder = folder
+        self.reload = bool(environ.get(RELOAD_ENV_VAR)) if reload is None else reload
+        self._leaves: dict[str, str] = {}
+        self._cards: dict[str, Any] = {}
+        self._mtimes: dict[str, float] = {}
+        self._env: Any = None
+        self._lock = threading.RLock()
+
+    @property
+    def env(self) -> Any:
+        """Return a Jinja environment, create it on the first use.
+
+        Returns
+        -------
+        jinja2.Environment
+            environment with file and card template loaders
+        """
+        with self._lock:
+            if self._env is None:
+                jinja2 = timed_import("jinja2")
+                cache_folder = state_path(CACHE_FOLDER)
+                makedirs(cache_folder, exist_ok=True)
+                self._env = jinja2.Environment(
+                    loader=jinja2.PrefixLoader(
+                        {
+                            "file": jinja2.FileSystemLoader(searchpath=self.folder),
+                            "card": jinja2.DictLoader(self._leaves),
+                        },
+                        delimiter=":",
+                    ),
+                    bytecode_cache=jinja2.FileSystemBytecodeCache(cache_folder),
+                    auto_reload=self.reload,
+                    autoescape=True,
+                    trim_blocks=True,
+                )
+            return self._env
+
+    @property
+    def names(self) -> list[str]:
+        """Return names of available messages.
+
+        Returns
+        -------
+        list[str]
+            names with both markdown and card templates
+        """
+        return sorted(
+            fname[: -len(MD_SUFFIX)]
+            for fname in listdir(self.folder)
+            if fname.endswith(MD_SUFFIX)
+            and path.isfile(path.join(self.folder, fname[: -len(MD_SUFFIX)] + AC_SUFFIX))
+        )
+
+    def load(self) -> None:
+        """Parse markdown templates and compile card templates.
+
+        Raises
+        ------
+        ValueError
+            In case of a broken template
+        """
+        for name in self.names:
+            try:
+                source, _, _ = self.env.loader.get_source(self.env, f"file:{name}{MD_SUFFIX}")
+                self.env.parse(source)
+                with self._lock:
+                    self._load_card(name)
+            except Exception as err:
+                raise ValueError(f"Error: template '{name}' is broken: {err}") from err
+
+    def warm(self) -> None:
+        """Compile markdown templates into the bytecode cache."""
+        for name in self.names:
+            self.env.get_template(f"file:{name}{MD_SUFFIX}")
+
+    def render(self, name: str, params: dict[str, Any]) -> Message:
+        """Render a message from markdown and adaptive card templates.
+
+        Parameters
+        ----------
+        name : str
+            template name, `{name}.md.j2` and `{name}-ac.json.j2` are used
+        params : dict[str, Any]
+            template parameters
+
+        Returns
+        -------
+        Message
+            a message ready for delivery
+        """
+        if name not in self._cards or (self.reload and self._is_changed(name)):
+            with self._lock:
+                self._load_card(name)
+        markdown = self.env.get_template(f"file:{name}{MD_SUFFIX}").render(params)
+        return Message(markdown=markdown, attachments=_render(self._cards[name], params))
+
+    def _card_file(self, name: str) -> str:
+        """Return a path of a card template.
+
+        Parameters
+        ----------
+        name : str
+            template name
+
+        Returns
+        -------
+        str
+            file path
+        """
+        return path.join(self.folder, f"{name}{AC_SUFFIX}")
+
+    def _is_changed(self, name: str) -> bool:
+        """Check if a card template is changed on disk.
+
+        Parameters
+        ----------
+        name : str
+            template name
+
+        Returns
+        -------
+        bool
+            True if the file is modified after loading
+        """
+        return path.getmtime(self._card_file(name)) != self._mtimes.get(name)
+
+    def _load_card(self, name: str) -> None:
+        """Parse and compile an adaptive card template.
+
+        Parameters
+        ----------
+        name : str
+            template name
+        """
+        card_file = self._card_file(name)
+        self._mtimes[name] = path.getmtime(card_file)
+        with open(card_file, encoding="utf-8") as card:
+            self._cards[name] = self._compile(json.load(card)["attachments"], f"{name}/attachments")
+
+    def _compile(self, node: Any, ref: str) -> Union[_Leaf, _Dict, _List, Any]:
+        """Compile dynamic parts of a card, static parts are kept as is.
+
+        Parameters
+        ----------
+        node : Any
+            a parsed JSON node
+        ref : str
+            node reference, used as a template name
+
+        Returns
+        -------
+        Union[_Leaf, _Dict, _List, Any]
+            a compiled node
+        """
+        if isinstance(node, str) and _is_template(node):
+            self._leaves[ref] = node
+            return _Leaf(self.env.get_template(f"card:{ref}"))
+        if isinstance(node, list):
+            items = [self._compile(item, f"{ref}/{num}") for num, item in enumerate(node)]
+            if any(isinstance(item, (_Leaf, _Dict, _List)) for item in items):
+                return _List(items)
+            return node
+        if isinstance(node, dict):
+            cond = None
+            if COND_KEY in node:
+                cond = self.env.compile_expression(node[COND_KEY])
+            items = {
+                key: self._compile(value, f"{ref}/{key}")
+                for key, value in node.items()
+                if key != COND_KEY
+            }
+            dynamic = any(isinstance(v, (_Leaf, _Dict, _List)) for v in items.values())
+            if cond is not None or dynamic:
+                return _Dict(items, cond)
+            return node
+        return node
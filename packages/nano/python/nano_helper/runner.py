@@ -0,0 +1,248 @@
+"""Bulk test runner.
+
+Note
+----
+`/nano/run-tests` runs pre or post-tests of many services in a bounded
+thread pool, every device of a multi-device service is a separate task.
+A per-device limit keeps the number of parallel live-status calls to one
+device low; services of other devices are scheduled meanwhile. A device
+which doesn't answer within the timeout is reported as timed out together
+with its queued services, so one dead device doesn't hold the whole run.
+Results are reported as they complete and streamed to the CLI session of
+the caller.
+"""
+# pylint:disable=too-many-arguments, too-many-locals
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from time import monotonic
+from typing import Any, Optional
+
+import ncs  # type: ignore
+from ncs.dp import Action  # type: ignore
+
+from .health import DeviceHealth
+from .index import PlanIndex
+from .nano_cb import service_devices
+from .snapshots import SnapshotStore
+from .tests import STAGES, StageResult, run_stage
+
+POLL_INTERVAL = 1.0
+CONFIG_COMPONENT = ("nano:cfg-com-type", "config")
+
+# service id, device name, result or None, error message or None
+ResultCallback = Callable[[str, str, Optional[StageResult], Optional[str]], None]
+
+
+def run_tests(
+    run: Callable[[str, str], StageResult],
+    targets: list[tuple[str, str]],
+    on_result: ResultCallback,
+    max_workers: int,
+    per_device: int,
+    timeout: float,
+) -> None:
+    """Run tests of services concurrently.
+
+    Parameters
+    ----------
+    run : Callable[[str, str], StageResult]
+        runs tests of a service device by a service id and a device name
+    targets : list[tuple[str, str]]
+        service ids and device names
+    on_result : ResultCallback
+        called in the caller thread for every service as soon as its
+        result is known
+    max_workers : int
+        maximum number of services tested in parallel
+    per_device : int
+        maximum number of services of a device tested in parallel
+    timeout : float
+        seconds to wait for a service result
+    """
+    queues: dict[str, deque[str]] = {}
+    for svc_id, device in targets:
+        queues.setdefault(device, deque()).append(svc_id)
+    busy = dict.fromkeys(queues, 0)
+    started: dict[tuple[str, str], float] = {}
+    running: dict[Future, tuple[str, str]] = {}
+
+    def _run(svc_id: str, device: str) -> StageResult:
+        started[(svc_id, device)] = monotonic()
+        return run(svc_id, device)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nano-run-tests")
+    try:
+        while running or any(queues.values()):
+            for device, queue in queues.items():
+                while queue and busy[device] < per_device and len(running) < max_workers:
+                    svc_id = queue.popleft()
+                    busy[device] += 1
+                    running[pool.submit(_run, svc_id, device)] = (svc_id, device)
+            done, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                svc_id, device = running.pop(future)
+                busy[device] -= 1
+                try:
+                    on_result(svc_id, device, future.result(), None)
+                except Exception as err:  # pylint:disable=broad-except
+                    on_result(svc_id, device, None, f"Error: {err}")
+            now = monotonic()
+            for future, (svc_id, device) in list(running.items()):
+                if now - started.get((svc_id, device), now) < timeout:
+                    continue
+                # the call can't be cancelled, it is left to finish in the background
+                del running[future]
+                on_result(svc_id, device, None, f"Error: no result in {timeout} seconds.")
+                while queues[device]:
+                    on_result(queues[device].popleft(), device, None, "Skipped, device timed out.")
+    finally:
+        pool.shutdown(wait=False)
+
+
+def select_services(
+    root: ncs.maagic.Root,
+    svc_ids: list[str],
+    plan_state: Optional[str],
+    index: Optional[PlanIndex] = None,
+) -> list[tuple[str, str]]:
+    """Return services to test.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+    svc_ids : list[str]
+        service ids, all services if empty
+    plan_state : Optional[str]
+        only services with a reached state of the config component
+    index : Optional[PlanIndex]
+        plan index, plans are read if None or the index is loading
+
+    Returns
+    -------
+    list[tuple[str, str]]
+        service ids and device names, a pair per device of a service
+
+    Raises
+    ------
+    ValueError
+        In case of an unknown service id
+    """
+    services = root.nano__nano.nano
+    for svc_id in svc_ids:
+        if svc_id not in services:
+            raise ValueError(f"Error: service '{svc_id}' doesn't exist.")
+    reached = None
+    if plan_state is not None and index is not None and index.ready.is_set():
+        reached = set(index.query(CONFIG_COMPONENT[0], plan_state, "reached"))
+        if not svc_ids:
+            svc_ids = sorted(svc_id for svc_id in reached if svc_id in services)
+    selected = [services[svc_id] for svc_id in svc_ids] if svc_ids else list(services)
+    targets = []
+    for service in selected:
+        if reached is not None:
+            if str(service.id) not in reached:
+                continue
+        elif plan_state is not None:
+            component = service.plan.component[CONFIG_COMPONENT]
+            if plan_state not in component.state or component.state[plan_state].status != "reached":
+                continue
+        targets.extend((str(service.id), device) for device in service_devices(root, service))
+    return targets
+
+
+class RunTestsAction(Action):
+    """Run tests of many services concurrently."""
+
+    def init(self, init_args: dict[str, Any]) -> None:
+        """Initialize an action.
+
+        Parameters
+        ----------
+        init_args : dict[str, Any]
+            `snapshots` store, device `health` and plan `index`
+        """
+        self.snapshots: SnapshotStore = init_args["snapshots"]
+        self.health: DeviceHealth = init_args["health"]
+        self.index: PlanIndex = init_args["index"]
+
+    @Action.action
+    def cb_action(
+        self,
+        uinfo: ncs.UserInfo,
+        name: str,
+        kp: ncs.HKeypathRef,
+        a_input: ncs.maagic.ActionParams,
+        a_output: ncs.maagic.ActionParams,
+        trans: ncs.maapi.Transaction,
+    ) -> Any:
+        """Execute an action.
+
+        Parameters
+        ----------
+        uinfo : ncs.UserInfo
+            a UserInfo object
+        name : str
+            the tailf:action name
+        kp : ncs.HKeypathRef
+            the keypath of the action (HKeypathRef)
+        a_input : ncs.maagic.ActionParams
+            input node
+        a_output : ncs.maagic.ActionParams
+            output node
+        trans : ncs.maapi.Transaction
+            read only transaction, same as action transaction if
+            executed with an action context.
+
+        Returns
+        -------
+        Optional[Union[ncs.CONFD_OK, ncs.CONFD_ERR]]
+        """
+        stage = STAGES[str(a_input.stage)]
+        plan_state = str(a_input.plan_state) if a_input.plan_state is not None else None
+        try:
+            targets = select_services(
+                ncs.maagic.get_root(trans), list(a_input.id), plan_state, self.index
+            )
+        except ValueError as err:
+            a_output.result = False
+            a_output.msg = str(err)
+            return ncs.CONFD_OK
+        self.log.info(f"Running {stage.name} for {len(targets)} services")
+
+        stream = None
+        if uinfo.context == "cli":
+            stream = ncs.maapi.Maapi()
+        failed = 0
+
+        def on_result(
+            svc_id: str, device: str, stage_result: Optional[StageResult], error: Optional[str]
+        ) -> None:
+            nonlocal failed
+            entry = a_output.service.create(svc_id, device)
+            entry.result = stage_result.result if stage_result is not None else False
+            entry.msg = stage_result.msg if stage_result is not None else error
+            if not entry.result:
+                failed += 1
+            if stream is not None:
+                status = "PASS" if entry.result else "FAIL"
+                stream.cli_write(uinfo.usid, f"{svc_id} ({device}): {status} {entry.msg}\n")
+
+        refresh = bool(a_input.refresh)
+        run_tests(
+            lambda svc_id, device: run_stage(
+                self.snapshots, self.health, stage, svc_id, device, refresh
+            ),
+            targets,
+            on_result,
+            max_workers=int(a_input.max_workers),
+            per_device=int(a_input.per_device),
+            timeout=int(a_input.timeout),
+        )
+        if stream is not None:
+            stream.close()
+        a_output.result = failed == 0
+        a_output.msg = f"{len(targets) - failed} passed, {failed} failed"
+        self.log.info(f"{stage.name}: {a_output.msg}")
+        return ncs.CONFD_OK
@@ -0,0 +1,338 @@
+"""Webex delivery pipeline.
+
+Note
+----
+Messages are rendered in an action callback, stored in the outbox and
+handed over to a bounded in-process queue. Worker threads deliver them
+with one keep-alive HTTP session per bot token, so an action doesn't
+wait for a TLS handshake with Webex unless it asks to wait for delivery.
+
+Failed attempts are retried with an exponential backoff. A rate limit
+response pauses all deliveries for the `Retry-After` period. Messages
+left in the outbox by a previous run are sent again after a package
+reload. The scheduler prunes failed messages from the outbox every
+`PRUNE_INTERVAL` seconds.
+"""
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from .loadtime import timed_import
+from .outbox import Outbox
+
+SENDER_WORKERS = 4
+SENDER_QUEUE_SIZE = 1000
+DELIVERY_TIMEOUT = 60
+RETRY_LIMIT = 10
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+SCHEDULER_INTERVAL = 1.0
+PRUNE_INTERVAL = 3600.0
+
+
+class SenderError(Exception):
+    """A message can't be delivered."""
+
+
+@dataclass
+class Message:
+    """A rendered message waiting for delivery."""
+
+    markdown: str
+    attachments: list[dict[str, Any]]
+    outbox_id: int = 0
+    attempts: int = 0
+    delivered: threading.Event = field(default_factory=threading.Event, repr=False)
+    error: Optional[Exception] = None
+
+
+def backoff(attempts: int) -> float:
+    """Return a delay before the next attempt.
+
+    Parameters
+    ----------
+    attempts : int
+        number of failed attempts
+
+    Returns
+    -------
+    float
+        seconds, doubled on every attempt with a random jitter
+    """
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempts)
+    return delay / 2 + random.uniform(0, delay / 2)  # nosec
+
+
+def is_retryable(err: Exception) -> bool:
+    """Check if a failed delivery is worth another attempt.
+
+    Parameters
+    ----------
+    err : Exception
+        delivery error
+
+    Returns
+    -------
+    bool
+        False for requests rejected by Webex, True otherwise
+    """
+    exceptions = timed_import("webexteamssdk.exceptions")
+    if isinstance(err, exceptions.ApiError) and not isinstance(err, exceptions.RateLimitError):
+        return err.status_code >= 500 or err.status_code == 408
+    return True
+
+
+class WebexSender:
+    """Deliver messages with a pool of worker threads.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    settings : Callable[[], dict[str, Any]]
+        returns webex settings with `bot_token` and `room_id` keys
+    outbox : Outbox
+        durable storage for messages
+    workers : int
+        number of worker threads
+    queue_size : int
+        maximum number of queued messages
+    base_url : Optional[str]
+        Webex API URL, the SDK default if None
+    """
+
+    def __init__(
+        self,
+        log: Any,
+        settings: Callable[[], dict[str, Any]],
+        outbox: Outbox,
+        workers: int = SENDER_WORKERS,
+        queue_size: int = SENDER_QUEUE_SIZE,
+        base_url: Optional[str] = None,
+    ) -> None:
+        self.log = log
+        self.base_url = base_url
+        self.settings = settings
+        self.outbox = outbox
+        self.workers = workers
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threads: list[threading.Thread] = []
+        self._stopped = threading.Event()
+        self._apis: dict[str, Any] = {}
+        self._apis_lock = threading.Lock()
+        # outbox ids which are queued or being sent, and their waiters
+        self._inflight: set[int] = set()
+        self._waiters: dict[int, Message] = {}
+        self._inflight_lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def start(self) -> None:
+        """Start worker threads and the retry scheduler."""
+        self._stopped.clear()
+        for num in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"nano-webex-sender-{num}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._scheduler, name="nano-webex-retry", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop threads, undelivered messages are kept in the outbox.
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for each thread
+        """
+        self._stopped.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def submit(self, msg: Message, wait: bool = False, timeout: float = DELIVERY_TIMEOUT) -> None:
+        """Store a message and optionally wait for its delivery.
+
+        Parameters
+        ----------
+        msg : Message
+            a message to send
+        wait : bool
+            wait until the message is delivered
+        timeout : float
+            seconds to wait for the delivery
+
+        Raises
+        ------
+        SenderError
+            In case of a failed or late delivery
+        """
+        with self._inflight_lock:
+            msg.outbox_id = self.outbox.add(msg.markdown, msg.attachments)
+            if wait:
+                self._waiters[msg.outbox_id] = msg
+            self._inflight.add(msg.outbox_id)
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            # the scheduler picks it up from the outbox later
+            with self._inflight_lock:
+                self._inflight.discard(msg.outbox_id)
+        if not wait:
+            return
+        if not msg.delivered.wait(timeout):
+            with self._inflight_lock:
+                self._waiters.pop(msg.outbox_id, None)
+            raise SenderError("Error: webex delivery timed out, the message will be retried.")
+        if msg.error is not None:
+            raise SenderError(f"Error: webex delivery failed: {msg.error}") from msg.error
+
+    def _api(self, bot_token: str) -> Any:
+        """Return a shared API client for a bot token.
+
+        Parameters
+        ----------
+        bot_token : str
+            Webex bot token
+
+        Returns
+        -------
+        webexteamssdk.WebexTeamsAPI
+            an API client keeping its HTTP session alive between calls
+        """
+        with self._apis_lock:
+            if bot_token not in self._apis:
+                webexteamssdk = timed_import("webexteamssdk")
+                kwargs = {"base_url": self.base_url} if self.base_url else {}
+                # rate limits are handled by the sender without blocking a worker
+                self._apis[bot_token] = webexteamssdk.WebexTeamsAPI(
+                    access_token=bot_token, wait_on_rate_limit=False, **kwargs
+                )
+            return self._apis[bot_token]
+
+    def _deliver(self, msg: Message) -> None:
+        """Send a message to the configured room.
+
+        Parameters
+        ----------
+        msg : Message
+            a message to send
+        """
+        webex = self.settings()
+        self._api(webex["bot_token"]).messages.create(
+            roomId=webex["room_id"],
+            markdown=msg.markdown,
+            attachments=msg.attachments,
+        )
+
+    def _finish(self, msg: Message, error: Optional[Exception] = None, final: bool = True) -> None:
+        """Release a message and notify a waiter on a final result.
+
+        Parameters
+        ----------
+        msg : Message
+            a processed message
+        error : Optional[Exception]
+            a reason if the message is not delivered
+        final : bool
+            False if the message will be retried
+        """
+        with self._inflight_lock:
+            self._inflight.discard(msg.outbox_id)
+            waiter = self._waiters.pop(msg.outbox_id, None) if final else None
+        if waiter is not None:
+            waiter.error = error
+            waiter.delivered.set()
+
+    def _handle_error(self, msg: Message, err: Exception) -> None:
+        """Schedule another attempt or give up on a message.
+
+        Parameters
+        ----------
+        msg : Message
+            a failed message
+        err : Exception
+            delivery error
+        """
+        attempts = msg.attempts + 1
+        if isinstance(err, timed_import("webexteamssdk.exceptions").RateLimitError):
+            self._paused_until = time.monotonic() + err.retry_after
+            self.outbox.retry(msg.outbox_id, err.retry_after, str(err))
+            self.log.warning(f"Webex rate limit, pausing deliveries for {err.retry_after}s")
+            self._finish(msg, err, final=False)
+        elif is_retryable(err) and attempts < RETRY_LIMIT:
+            self.outbox.retry(msg.outbox_id, backoff(attempts), str(err))
+            self.log.warning(f"Webex delivery failed, attempt {attempts}: {err}")
+            self._finish(msg, err, final=False)
+        else:
+            self.outbox.fail(msg.outbox_id, str(err))
+            self.log.error(f"Webex delivery failed, attempt {attempts}, giving up: {err}")
+            self._finish(msg, err)
+
+    def _worker(self) -> None:
+        """Deliver queued messages until a stop marker is received."""
+        while True:
+            msg = self._queue.get()
+            if msg is None or self._stopped.is_set():
+                return
+            pause = self._paused_until - time.monotonic()
+            if pause > 0 and self._stopped.wait(pause):
+                return
+            try:
+                self._deliver(msg)
+            except Exception as err:  # pylint:disable=broad-except
+                self._handle_error(msg, err)
+            else:
+                self.outbox.done(msg.outbox_id)
+                self._finish(msg)
+
+    def _prune(self) -> None:
+        """Remove expired failed messages from the outbox."""
+        try:
+            pruned = self.outbox.prune()
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"Outbox prune failed: {err}")
+            return
+        if pruned:
+            self.log.info(f"Outbox: {pruned} failed messages pruned")
+
+    def _scheduler(self) -> None:
+        """Queue messages from the outbox which are due for an attempt."""
+        next_prune = 0.0
+        while not self._stopped.wait(SCHEDULER_INTERVAL):
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+                self._prune()
+            free = self._queue.maxsize - self._queue.qsize()
+            if free <= 0:
+                continue
+            # the outbox is read under the lock: a message being added or
+            # delivered meanwhile is in flight until its row is updated
+            with self._inflight_lock:
+                msgs = []
+                for entry in self.outbox.due(free + len(self._inflight)):
+                    if entry.id in self._inflight:
+                        continue
+                    self._inflight.add(entry.id)
+                    msg = self._waiters.get(entry.id) or Message(
+                        entry.markdown, entry.attachments, outbox_id=entry.id
+                    )
+                    msg.attempts = entry.attempts
+                    msgs.append(msg)
+            for num, msg in enumerate(msgs):
+                try:
+                    self._queue.put_nowait(msg)
+                except queue.Full:
+                    with self._inflight_lock:
+                        self._inflight.difference_update(m.outbox_id for m in msgs[num:])
+                    break
@@ -0,0 +1,71 @@
+"""Cached webex settings.
+
+Note
+----
+Settings are read from CDB once and kept by the application. A CDB
+subscriber on `/nano:nano/sla/webex` reloads them on start and on every
+change, so sending a message doesn't need a MAAPI session.
+"""
+import threading
+from typing import Any, Callable, Optional
+
+from .subscribers import ReloadSubscriber
+
+WEBEX_SETTINGS_PATH = "/nano:nano/nano:sla/nano:webex"
+
+
+class WebexSettings:
+    """Webex settings cache.
+
+    Parameters
+    ----------
+    load : Callable[[], dict[str, Any]]
+        reads settings from CDB
+    """
+
+    def __init__(self, load: Callable[[], dict[str, Any]]) -> None:
+        self.load = load
+        self._data: Optional[dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> dict[str, Any]:
+        """Return settings, read them from CDB if the cache is empty.
+
+        Returns
+        -------
+        dict[str, Any]
+            a dictionary with webex settings
+        """
+        with self._lock:
+            if self._data is None:
+                self._data = self.load()
+            return self._data
+
+    def invalidate(self) -> None:
+        """Drop cached settings."""
+        with self._lock:
+            self._data = None
+
+
+class WebexSettingsSubscriber(ReloadSubscriber):
+    """Reload webex settings on configuration changes.
+
+    Parameters
+    ----------
+    settings : WebexSettings
+        settings cache
+    app : ncs.application.Application
+        application object
+    """
+
+    def __init__(self, settings: WebexSettings, app: Any) -> None:
+        self.settings = settings
+        super().__init__(app, self.reload_settings, WEBEX_SETTINGS_PATH)
+
+    def reload_settings(self) -> None:
+        """Read settings again, log invalid ones."""
+        self.settings.invalidate()
+        try:
+            self.settings()
+        except ValueError as err:
+            self.log.error(f"Webex settings reload failed: {err}")
@@ -0,0 +1,658 @@
+"""Timer wheel SLA engine.
+
+Note
+----
+With `/nano/sla/engine` set to `timer-wheel`, services get no SPM
+triggers. Their jeopardy and violation deadlines are tracked in memory
+by a hierarchical timer wheel instead: scheduling, cancelling and
+rescheduling a deadline is O(1), so a policy timeout change costs O(1)
+per service and nothing is re-evaluated by SPM.
+
+The SLA of a service starts when its `self` component reaches
+`ncs:init` and succeeds when `self` reaches `ncs:ready`, like the
+`nano-sla-policy` SPM policy. Deadlines are rebuilt from the plan when
+the engine is enabled or the package starts, missed deadlines fire once
+unless `/nano/sla/deadline` shows they already fired. Events are sent
+through the `/nano/sla/timeouts/timeout` action, the same path SPM
+uses, so digests and templates work unchanged. Services are
+re-deployed on an engine change to add or remove their SPM triggers.
+"""
+import datetime as dt
+import threading
+from collections.abc import Callable, Hashable, Iterable
+from dataclasses import dataclass
+from time import time
+from typing import Any, Optional
+
+import ncs  # type: ignore
+
+from .context import SPM_TRIGGER_NAME
+from .index import PLAN_KP_RE, PLAN_STATE_PATH
+from .nano_cb import TRIGGER_STATE
+from .spm import SPM_POLICY_NAME
+from .subscribers import ReloadSubscriber
+
+ENGINE_SPM = "spm"
+ENGINE_TIMER_WHEEL = "timer-wheel"
+SLA_ENGINE_PATH = "/nano:nano/nano:sla/nano:engine"
+SLA_TIMEOUTS_PATH = "/nano:nano/nano:sla/nano:timeouts"
+TRIGGER_SERVICE_XPATH = "/nano:nano/nano:nano[nano:id='{}']"
+SELF_COMPONENT = ("ncs:self", "self")
+SLA_COMPONENT = ("nano:sla-com-type", "sla")
+STATUS_RUNNING = "running"
+STATUS_JEOPARDY = "jeopardy"
+STATUS_VIOLATION = "violation"
+STATUS_SUCCESS = "success"
+# an event is not sent again once the status is reached
+STATUS_RANK = {STATUS_RUNNING: 0, STATUS_JEOPARDY: 1, STATUS_VIOLATION: 2, STATUS_SUCCESS: 3}
+# seconds
+TICK = 1.0
+# 64 slots per level, 4 levels cover 194 days of 1 second ticks
+WHEEL_BITS = 6
+WHEEL_LEVELS = 4
+
+
+class TimerWheel:
+    """A hierarchical timer wheel with 1 second ticks.
+
+    Level `n` has 64 slots of 64**n seconds. A timer is put on the
+    lowest level its delay fits into and moves down a level each time
+    the slot of the upper level comes round.
+
+    Parameters
+    ----------
+    now : int
+        current time, seconds
+    """
+
+    def __init__(self, now: int) -> None:
+        self.now = now
+        self._slots = 1 << WHEEL_BITS
+        self._wheels: list[list[set[Hashable]]] = [
+            [set() for _ in range(self._slots)] for _ in range(WHEEL_LEVELS)
+        ]
+        self._timers: dict[Hashable, tuple[int, set[Hashable]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def _place(self, key: Hashable, deadline: int) -> None:
+        delay = deadline - self.now
+        level = 0
+        while level < WHEEL_LEVELS - 1 and delay >= self._slots ** (level + 1):
+            level += 1
+        slot = self._wheels[level][(deadline >> (WHEEL_BITS * level)) & (self._slots - 1)]
+        slot.add(key)
+        self._timers[key] = (deadline, slot)
+
+    def schedule(self, key: Hashable, deadline: int) -> None:
+        """Add or move a timer, a past deadline expires on the next tick.
+
+        Parameters
+        ----------
+        key : Hashable
+            timer key
+        deadline : int
+            expiration time, seconds
+        """
+        self.cancel(key)
+        self._place(key, max(deadline, self.now + 1))
+
+    def cancel(self, key: Hashable) -> None:
+        """Remove a timer if it exists.
+
+        Parameters
+        ----------
+        key : Hashable
+            timer key
+        """
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer[1].discard(key)
+
+    def clear(self) -> None:
+        """Remove all timers."""
+        for key in list(self._timers):
+            self.cancel(key)
+
+    def advance(self, now: int) -> list[tuple[Hashable, int]]:
+        """Move the time forward.
+
+        Parameters
+        ----------
+        now : int
+            current time, seconds
+
+        Returns
+        -------
+        list[tuple[Hashable, int]]
+            expired timer keys and deadlines
+        """
+        if now - self.now > self._slots:
+            # a long pause, e.g. a clock jump: expire and re-place directly
+            timers = list(self._timers.items())
+            self.clear()
+            self.now = now
+            expired = []
+            for key, (deadline, _) in timers:
+                if deadline <= now:
+                    expired.append((key, deadline))
+                else:
+                    self._place(key, deadline)
+            return expired
+        expired = []
+        while self.now < now:
+            self.now += 1
+            tick = self.now
+            for level in range(1, WHEEL_LEVELS):
+                if tick & ((1 << (WHEEL_BITS * level)) - 1):
+                    break
+                slot = self._wheels[level][(tick >> (WHEEL_BITS * level)) & (self._slots - 1)]
+                for key in list(slot):
+                    slot.discard(key)
+                    self._place(key, self._timers[key][0])
+            slot = self._wheels[0][tick & (self._slots - 1)]
+            for key in list(slot):
+                deadline = self._timers[key][0]
+                slot.discard(key)
+                if deadline > tick:
+                    # a deadline beyond the top level came round early
+                    self._place(key, deadline)
+                    continue
+                del self._timers[key]
+                expired.append((key, deadline))
+        return expired
+
+
+@dataclass
+class Deadline:
+    """SLA state of a service."""
+
+    start: float
+    status: str = STATUS_RUNNING
+
+
+def invoke_timeout(svc_id: str, timeout: str) -> None:
+    """Send an SLA event through the `timeout` action.
+
+    Parameters
+    ----------
+    svc_id : str
+        service id
+    timeout : str
+        jeopardy, violation or success
+
+    Raises
+    ------
+    ValueError
+        If the action fails
+    """
+    with ncs.maapi.single_read_trans("admin", "python") as t:
+        action = ncs.maagic.get_root(t).nano__nano.sla.timeouts.timeout
+        a_input = action.get_input()
+        a_input.policy = SPM_POLICY_NAME
+        a_input.service = TRIGGER_SERVICE_XPATH.format(svc_id)
+        a_input.status = "reached" if timeout == STATUS_SUCCESS else "not-reached"
+        a_input.timeout = timeout
+        a_output = action(a_input)
+    if not a_output.result:
+        raise ValueError(f"Error: {timeout} of '{svc_id}' is not sent: {a_output.msg}")
+
+
+def _timestamp(value: float) -> str:
+    """Format seconds as yang:date-and-time."""
+    return dt.datetime.fromtimestamp(value, dt.timezone.utc).isoformat(timespec="seconds")
+
+
+class SlaEngine:
+    """Deadlines of services in a timer wheel.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    fire : Callable[[str, str], None]
+        sends an event of a service: jeopardy, violation or success
+    """
+
+    def __init__(self, log: Any, fire: Callable[[str, str], None] = invoke_timeout) -> None:
+        self.log = log
+        self.fire = fire
+        self.enabled = False
+        self.jeopardy = 0
+        self.violation = 0
+        self._deadlines: dict[str, Deadline] = {}
+        self._wheel = TimerWheel(int(time()))
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the tick thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="nano-sla", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the tick thread.
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for the thread
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(TICK):
+            try:
+                self.tick()
+            except Exception as err:  # pylint:disable=broad-except
+                self.log.error(f"SLA engine tick failed: {err}")
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """Fire expired deadlines.
+
+        Parameters
+        ----------
+        now : Optional[float]
+            current time, seconds
+        """
+        events = []
+        with self._lock:
+            if not self.enabled:
+                return
+            for (svc_id, status), _ in self._wheel.advance(int(now or time())):
+                deadline = self._deadlines.get(svc_id)
+                if deadline is None or STATUS_RANK[deadline.status] >= STATUS_RANK[status]:
+                    continue
+                deadline.status = status
+                events.append((svc_id, status))
+        self._emit(events)
+
+    def configure(self, enabled: bool, jeopardy: int, violation: int) -> bool:
+        """Apply the engine mode and policy timeouts.
+
+        Parameters
+        ----------
+        enabled : bool
+            True if the timer wheel engine is selected
+        jeopardy : int
+            jeopardy timeout, seconds
+        violation : int
+            violation timeout, seconds
+
+        Returns
+        -------
+        bool
+            True if the engine is enabled now and must be rebuilt
+        """
+        with self._lock:
+            was_enabled = self.enabled
+            changed = (jeopardy, violation) != (self.jeopardy, self.violation)
+            self.enabled = enabled
+            self.jeopardy = jeopardy
+            self.violation = violation
+            if not enabled:
+                self._wheel.clear()
+                self._deadlines.clear()
+                return False
+            if not was_enabled:
+                self._wheel = TimerWheel(int(time()))
+            if was_enabled and changed:
+                for svc_id, deadline in self._deadlines.items():
+                    self._schedule(svc_id, deadline)
+            svc_ids = list(self._deadlines) if was_enabled and changed else []
+        self.publish(svc_ids)
+        return not was_enabled
+
+    def _schedule(self, svc_id: str, deadline: Deadline) -> None:
+        timeouts = ((STATUS_JEOPARDY, self.jeopardy), (STATUS_VIOLATION, self.violation))
+        for status, timeout in timeouts:
+            if STATUS_RANK[deadline.status] >= STATUS_RANK[status]:
+                self._wheel.cancel((svc_id, status))
+            else:
+                self._wheel.schedule((svc_id, status), int(deadline.start + timeout))
+
+    def track(
+        self, svc_id: str, start: float, status: str = STATUS_RUNNING, publish: bool = True
+    ) -> None:
+        """Start tracking a service, a tracked service is not changed.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        start : float
+            start of the SLA, seconds
+        status : str
+            already fired status, e.g. jeopardy after a restart
+        publish : bool
+            write the deadline to operational data, see `publish`
+        """
+        with self._lock:
+            if not self.enabled or svc_id in self._deadlines:
+                return
+            deadline = self._deadlines[svc_id] = Deadline(start, status)
+            self._schedule(svc_id, deadline)
+        if publish:
+            self.publish([svc_id])
+
+    def succeed(self, svc_id: str) -> None:
+        """Stop deadlines of a tracked service and send a success event.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        """
+        with self._lock:
+            deadline = self._deadlines.get(svc_id)
+            if deadline is None or deadline.status == STATUS_SUCCESS:
+                return
+            deadline.status = STATUS_SUCCESS
+            self._schedule(svc_id, deadline)
+        self._emit([(svc_id, STATUS_SUCCESS)])
+
+    def untrack(self, svc_ids: Iterable[str]) -> None:
+        """Forget deleted services, their deadlines are removed.
+
+        Parameters
+        ----------
+        svc_ids : Iterable[str]
+            service ids
+        """
+        svc_ids = list(svc_ids)
+        with self._lock:
+            for svc_id in svc_ids:
+                self._deadlines.pop(svc_id, None)
+                self._wheel.cancel((svc_id, STATUS_JEOPARDY))
+                self._wheel.cancel((svc_id, STATUS_VIOLATION))
+        self.publish(svc_ids)
+
+    def update(
+        self, service: ncs.maagic.ListElement, fired: dict[str, str], publish: bool = True
+    ) -> None:
+        """Track a service by its `self` plan component.
+
+        Parameters
+        ----------
+        service : ncs.maagic.ListElement
+            service node
+        fired : dict[str, str]
+            statuses by service id from `/nano/sla/deadline`
+        publish : bool
+            write a new deadline to operational data
+        """
+        svc_id = str(service.id)
+        if SELF_COMPONENT not in service.plan.component:
+            return
+        states = service.plan.component[SELF_COMPONENT].state
+        if "ncs:ready" in states and states["ncs:ready"].status == "reached":
+            self.succeed(svc_id)
+            return
+        if "ncs:init" not in states or not states["ncs:init"].when:
+            return
+        start = dt.datetime.fromisoformat(str(states["ncs:init"].when)).timestamp()
+        self.track(svc_id, start, fired.get(svc_id, STATUS_RUNNING), publish)
+
+    def rebuild(self) -> None:
+        """Track all services from the plan."""
+        with ncs.maapi.single_read_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+            root = ncs.maagic.get_root(t)
+            fired = {str(entry.id): str(entry.status) for entry in root.nano__nano.sla.deadline}
+            for service in root.nano__nano.nano:
+                if fired.get(str(service.id)) != STATUS_SUCCESS:
+                    self.update(service, fired, publish=False)
+        with self._lock:
+            svc_ids = list(self._deadlines)
+        # one transaction for all services
+        self.publish(svc_ids)
+        self.log.info(f"SLA engine tracks {len(svc_ids)} services")
+
+    def _emit(self, events: list[tuple[str, str]]) -> None:
+        """Send events, then publish new statuses.
+
+        Parameters
+        ----------
+        events : list[tuple[str, str]]
+            service ids and statuses
+        """
+        for svc_id, status in events:
+            self.log.info(f"SLA {status}: {svc_id}")
+            try:
+                self.fire(svc_id, status)
+            except Exception as err:  # pylint:disable=broad-except
+                self.log.error(f"SLA {status} of '{svc_id}' failed: {err}")
+        self.publish(svc_id for svc_id, _ in events)
+
+    def publish(self, svc_ids: Iterable[str]) -> None:
+        """Write deadlines to operational data, untracked services are removed.
+
+        Parameters
+        ----------
+        svc_ids : Iterable[str]
+            changed services
+        """
+        svc_ids = list(svc_ids)
+        if not svc_ids:
+            return
+        with self._lock:
+            deadlines = {svc_id: self._deadlines.get(svc_id) for svc_id in svc_ids}
+            jeopardy, violation = self.jeopardy, self.violation
+        try:
+            with ncs.maapi.single_write_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+                entries = ncs.maagic.get_root(t).nano__nano.sla.deadline
+                for svc_id, deadline in deadlines.items():
+                    if deadline is None:
+                        if svc_id in entries:
+                            del entries[svc_id]
+                        continue
+                    entry = entries.create(svc_id)
+                    entry.start = _timestamp(deadline.start)
+                    entry.jeopardy = _timestamp(deadline.start + jeopardy)
+                    entry.violation = _timestamp(deadline.start + violation)
+                    entry.status = deadline.status
+                t.apply()
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"SLA deadlines are not saved: {err}")
+
+
+def stale_triggers(root: ncs.maagic.Root) -> list[str]:
+    """Return services whose SPM trigger doesn't match the engine.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+
+    Returns
+    -------
+    list[str]
+        ids of services with a trigger under the timer wheel engine, or
+        without a trigger under SPM although `trigger-created` is reached
+    """
+    spm = root.nano__nano.sla.engine == ENGINE_SPM
+    triggers = root.ncs__service_progress_monitoring.trigger
+    svc_ids = []
+    for service in root.nano__nano.nano:
+        svc_id = str(service.id)
+        wanted = False
+        if spm and SLA_COMPONENT in service.plan.component:
+            states = service.plan.component[SLA_COMPONENT].state
+            wanted = TRIGGER_STATE in states and states[TRIGGER_STATE].status == "reached"
+        if wanted != (SPM_TRIGGER_NAME.format(svc_id) in triggers):
+            svc_ids.append(svc_id)
+    return svc_ids
+
+
+class SlaSettingsSubscriber(ReloadSubscriber):
+    """Apply the engine mode and policy timeouts on configuration changes.
+
+    SPM triggers are created by the `trigger-created` callback only for
+    the `spm` engine. When the engine is changed, or on start, services
+    with a stale trigger or a missing one are re-deployed, so SPM and the
+    timer wheel never both track a service.
+
+    Parameters
+    ----------
+    engine : SlaEngine
+        SLA engine
+    app : ncs.application.Application
+        application object
+    """
+
+    def __init__(self, engine: SlaEngine, app: Any) -> None:
+        self.engine = engine
+        self._mode: Optional[str] = None
+        super().__init__(app, self.reload_settings, SLA_ENGINE_PATH, SLA_TIMEOUTS_PATH)
+
+    def reload_settings(self) -> None:
+        """Apply the configuration, rebuild the engine and reconcile triggers in the background."""
+        try:
+            with ncs.maapi.single_read_trans("admin", "python") as t:
+                sla = ncs.maagic.get_root(t).nano__nano.sla
+                mode = str(sla.engine)
+                # convert from minutes (model) to seconds
+                jeopardy = int(sla.timeouts.jeopardy) * 60
+                violation = int(sla.timeouts.violation) * 60
+            if self.engine.configure(mode == ENGINE_TIMER_WHEEL, jeopardy, violation):
+                self._background(self._rebuild, "nano-sla-rebuild")
+            if mode != self._mode:
+                self._mode = mode
+                self._background(self._reconcile, "nano-sla-triggers")
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"SLA engine reload failed: {err}")
+
+    @staticmethod
+    def _background(target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+
+    def _rebuild(self) -> None:
+        try:
+            self.engine.rebuild()
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"SLA engine rebuild failed: {err}")
+
+    def _reconcile(self) -> None:
+        """Re-deploy services with a stale or missing SPM trigger."""
+        try:
+            with ncs.maapi.single_read_trans("admin", "python") as t:
+                root = ncs.maagic.get_root(t)
+                services = root.nano__nano.nano
+                redeployed = 0
+                for svc_id in stale_triggers(root):
+                    try:
+                        services[svc_id].reactive_re_deploy()
+                        redeployed += 1
+                    except Exception as err:  # pylint:disable=broad-except
+                        self.log.error(f"Re-deploy of '{svc_id}' for SPM trigger failed: {err}")
+        except Exception as err:  # pylint:disable=broad-except
+            self.log.error(f"SPM trigger reconciliation failed: {err}")
+            return
+        if redeployed:
+            self.log.info(f"SPM triggers of {redeployed} services reconciled by re-deploy")
+
+
+class SlaPlanSubscriber(ncs.cdb.OperSubscriber):
+    """Start, succeed and forget SLAs on plan changes.
+
+    Parameters
+    ----------
+    engine : SlaEngine
+        SLA engine
+    app : ncs.application.Application
+        application object
+    """
+
+    def __init__(self, engine: SlaEngine, app: Any) -> None:
+        self.engine = engine
+        super().__init__(app=app)
+
+    def init(self) -> None:
+        """Register the subscription."""
+        self.register(PLAN_STATE_PATH, priority=110)
+
+    def pre_iterate(self) -> tuple[set[str], set[str]]:
+        """Return an initial state.
+
+        Returns
+        -------
+        tuple[set[str], set[str]]
+            ids of services with changed `self` states and deleted services
+        """
+        return set(), set()
+
+    def iterate(
+        self, kp: Any, op: int, oldv: Any, newv: Any, state: tuple[set[str], set[str]]
+    ) -> int:
+        """Note services with changed `self` component states.
+
+        Parameters
+        ----------
+        kp : ncs.HKeypathRef
+            changed path
+        op : int
+            operation
+        oldv : Any
+            old value
+        newv : Any
+            new value
+        state : tuple[set[str], set[str]]
+            ids of services with changed `self` states and deleted services
+
+        Returns
+        -------
+        int
+            recurse only into services
+        """
+        changed, deleted = state
+        match = PLAN_KP_RE.match(str(kp))
+        if match is None or not self.engine.enabled:
+            return ncs.ITER_CONTINUE
+        svc_id, com_type = match.group("id", "type")
+        if com_type is None:
+            if op == ncs.MOP_DELETED:
+                deleted.add(svc_id)
+                return ncs.ITER_CONTINUE
+            return ncs.ITER_RECURSE
+        if com_type == SELF_COMPONENT[0]:
+            changed.add(svc_id)
+        return ncs.ITER_CONTINUE
+
+    def should_post_iterate(self, state: tuple[set[str], set[str]]) -> bool:
+        """Update the engine only if `self` states are changed.
+
+        Parameters
+        ----------
+        state : tuple[set[str], set[str]]
+            ids of services with changed `self` states and deleted services
+
+        Returns
+        -------
+        bool
+            True if there are changes
+        """
+        return any(state)
+
+    def post_iterate(self, state: tuple[set[str], set[str]]) -> None:
+        """Update the engine.
+
+        Parameters
+        ----------
+        state : tuple[set[str], set[str]]
+            ids of services with changed `self` states and deleted services
+        """
+        changed, deleted = state
+        self.engine.untrack(deleted)
+        with ncs.maapi.single_read_trans("admin", "python", db=ncs.OPERATIONAL) as t:
+            services = ncs.maagic.get_root(t).nano__nano.nano
+            for svc_id in changed - deleted:
+                if svc_id in services:
+                    self.engine.update(services[svc_id], {}, publish=False)
+        self.engine.publish(changed - deleted)
@@ -0,0 +1,198 @@
+"""Device command output snapshots.
+
+Note
+----
+Command outputs captured by tests are stored zlib-compressed in a SQLite
+database in the package state directory, keyed by service id, device,
+stage and command. A pre-test re-run within `SNAPSHOT_TTL` is served
+from the snapshot, and post-test compares its outputs with pre-test
+snapshots instead of asking the device for the baseline again.
+
+Snapshots are bounded: an output is truncated to `MAX_OUTPUT_BYTES`,
+and snapshots older than `MAX_AGE` or above `MAX_SNAPSHOTS` are pruned
+on start and then by `put` at most every `PRUNE_INTERVAL` seconds.
+Snapshots of a service are removed with its plan, see
+`PlanIndexSubscriber`.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+from .checks import SHOW_VERSION, SHOW_VERSION_FIELDS, scan_fields
+from .state import state_path
+
+SNAPSHOTS_FILE = "nano-snapshots.db"
+SNAPSHOT_TTL = 600
+MAX_OUTPUT_BYTES = 1024 * 1024
+MAX_AGE = 7 * 24 * 3600
+MAX_SNAPSHOTS = 10000
+PRUNE_INTERVAL = 60
+# fields changing on every run are not compared
+VOLATILE_FIELDS = ("uptime",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    svc_id TEXT NOT NULL,
+    device TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    command TEXT NOT NULL,
+    output BLOB NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (svc_id, device, stage, command)
+);
+CREATE INDEX IF NOT EXISTS snapshot_created ON snapshot (created);
+"""
+
+
+@dataclass
+class Change:
+    """A difference between pre-test and post-test outputs."""
+
+    command: str
+    item: str
+    pre: Optional[str]
+    post: Optional[str]
+
+
+class SnapshotStore:
+    """Store command outputs captured by tests.
+
+    Parameters
+    ----------
+    filename : Optional[str]
+        database file, `nano-snapshots.db` in the package state directory
+        by default
+    """
+
+    def __init__(self, filename: Optional[str] = None) -> None:
+        self.filename = filename or state_path(SNAPSHOTS_FILE)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.filename, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._next_prune = 0.0
+        self.prune()
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+    def put(self, svc_id: str, device: str, stage: str, command: str, output: str) -> None:
+        """Store a command output, replaces an older snapshot.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        device : str
+            device name
+        stage : str
+            test stage, e.g. pre-test
+        command : str
+            `show` command arguments
+        output : str
+            raw output of the command
+        """
+        data = zlib.compress(output.encode("utf-8")[:MAX_OUTPUT_BYTES])
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?, ?, ?)",
+                (svc_id, device, stage, command, data, time.time()),
+            )
+        if time.monotonic() >= self._next_prune:
+            self.prune()
+
+    def get(
+        self, svc_id: str, device: str, stage: str, command: str, ttl: Optional[float] = None
+    ) -> Optional[str]:
+        """Return a stored command output.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        device : str
+            device name
+        stage : str
+            test stage, e.g. pre-test
+        command : str
+            `show` command arguments
+        ttl : Optional[float]
+            maximum age in seconds, any age if None
+
+        Returns
+        -------
+        Optional[str]
+            raw output or None if there is no fresh snapshot
+        """
+        min_created = time.time() - ttl if ttl is not None else 0
+        with self._lock:
+            row = self._db.execute(
+                "SELECT output FROM snapshot WHERE svc_id = ? AND device = ? AND stage = ? "
+                "AND command = ? AND created >= ?",
+                (svc_id, device, stage, command, min_created),
+            ).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8", errors="replace")
+
+    def delete(self, svc_id: str) -> None:
+        """Remove snapshots of a service.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM snapshot WHERE svc_id = ?", (svc_id,))
+
+    def prune(self) -> None:
+        """Remove expired snapshots and the oldest ones above the limit."""
+        with self._lock:
+            self._next_prune = time.monotonic() + PRUNE_INTERVAL
+            self._db.execute("DELETE FROM snapshot WHERE created < ?", (time.time() - MAX_AGE,))
+            self._db.execute(
+                "DELETE FROM snapshot WHERE rowid IN "
+                "(SELECT rowid FROM snapshot ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (MAX_SNAPSHOTS,),
+            )
+
+
+def diff_outputs(command: str, pre: str, post: str) -> list[Change]:
+    """Compare pre-test and post-test outputs of a command.
+
+    Parameters
+    ----------
+    command : str
+        `show` command arguments
+    pre : str
+        pre-test output
+    post : str
+        post-test output
+
+    Returns
+    -------
+    list[Change]
+        changed well-known fields of `show version`, added and removed
+        lines of other commands
+    """
+    if command == SHOW_VERSION:
+        fields = [name for name in SHOW_VERSION_FIELDS if name not in VOLATILE_FIELDS]
+        pre_fields = scan_fields(pre, fields)
+        post_fields = scan_fields(post, fields)
+        return [
+            Change(command, name, pre_fields.get(name), post_fields.get(name))
+            for name in fields
+            if pre_fields.get(name) != post_fields.get(name)
+        ]
+    pre_lines = {line.strip() for line in pre.splitlines() if line.strip()}
+    post_lines = {line.strip() for line in post.splitlines() if line.strip()}
+    removed = [Change(command, line, line, None) for line in sorted(pre_lines - post_lines)]
+    added = [Change(command, line, None, line) for line in sorted(post_lines - pre_lines)]
+    return removed + added
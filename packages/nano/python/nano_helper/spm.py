@@ -6,53 +6,133 @@ from typing import Any
 import ncs  # type: ignore
 from ncs.dp import Action  # type: ignore
 
+from .logs import CallbackLog
+from .metrics import timed
+from .pools import pooled
+
 SPM_POLICY_NAME = "nano-sla-policy"
+SPM_KICKER_NAME = "nano-sla-timeouts-kicker"
+
+
+def reconcile(node: ncs.maagic.Node, desired: dict[str, Any], path: str) -> list[str]:
+    """Set leaves which differ from desired values.
+
+    Parameters
+    ----------
+    node : ncs.maagic.Node
+        a container or a list entry
+    desired : dict[str, Any]
+        desired values by python leaf names
+    path : str
+        node path for change descriptions
+
+    Returns
+    -------
+    list[str]
+        changes, e.g. `/kickers/.../monitor: None -> /nano:nano/...`
+    """
+    changes = []
+    for leaf, value in desired.items():
+        current = getattr(node, leaf)
+        if current is not None and str(current) == str(value):
+            continue
+        setattr(node, leaf, value)
+        changes.append(f"{path}/{leaf.replace('_', '-')}: {current} -> {value}")
+    return changes
+
 
+def ensure_entry(lst: ncs.maagic.List, key: str, path: str, changes: list[str]) -> Any:
+    """Return a list entry, create it if missing.
 
-def update_kicker(root: ncs.maagic.Root) -> None:
+    Parameters
+    ----------
+    lst : ncs.maagic.List
+        a list node
+    key : str
+        entry key
+    path : str
+        entry path for change descriptions
+    changes : list[str]
+        changes, a created entry is added
+
+    Returns
+    -------
+    ncs.maagic.ListElement
+        list entry
+    """
+    if key not in lst:
+        changes.append(f"{path}: created")
+        return lst.create(key)
+    return lst[key]
+
+
+def update_kicker(root: ncs.maagic.Root) -> list[str]:
     """Create or update a kicker to track timeouts changes.
 
     Parameters
     ----------
     root : ncs.maagic.Root
         Root object
+
+    Returns
+    -------
+    list[str]
+        changes, empty if the kicker is up to date
     """
-    kicker = root.kicker__kickers.data_kicker.create("nano-sla-timeouts-kicker")
-    kicker.monitor = "/nano:nano/nano:sla/nano:timeouts"
-    kicker.kick_node = "/nano:nano/nano:sla"
-    kicker.action_name = "init-sla-policy"
+    changes: list[str] = []
+    path = f"/kickers/data-kicker{{{SPM_KICKER_NAME}}}"
+    kicker = ensure_entry(root.kicker__kickers.data_kicker, SPM_KICKER_NAME, path, changes)
+    desired = {
+        "monitor": "/nano:nano/nano:sla/nano:timeouts",
+        "kick_node": "/nano:nano/nano:sla",
+        "action_name": "init-sla-policy",
+    }
+    return changes + reconcile(kicker, desired, path)
 
 
-def update_spm_policy(root: ncs.maagic.Root) -> None:
+def update_spm_policy(root: ncs.maagic.Root) -> list[str]:
     """Create or update SPM policy.
 
     Parameters
     ----------
     root : ncs.maagic.Root
         Root object
+
+    Returns
+    -------
+    list[str]
+        changes, empty if the policy is up to date
     """
-    if SPM_POLICY_NAME not in root.ncs__service_progress_monitoring.policy:
-        policy = root.ncs__service_progress_monitoring.policy.create(SPM_POLICY_NAME)
-    policy = root.ncs__service_progress_monitoring.policy[SPM_POLICY_NAME]
+    changes: list[str] = []
+    path = f"/service-progress-monitoring/policy{{{SPM_POLICY_NAME}}}"
+    policy = ensure_entry(
+        root.ncs__service_progress_monitoring.policy, SPM_POLICY_NAME, path, changes
+    )
     # convert from minutes (model) to seconds (SPM policy)
-    policy.jeopardy_timeout = root.nano__nano.sla.timeouts.jeopardy * 60
-    policy.violation_timeout = root.nano__nano.sla.timeouts.violation * 60
-    policy.action.always_call = True
-    policy.action.action_path = "/nano:nano/nano:sla/nano:timeouts/nano:timeout"
-    if "self-ready" not in policy.condition:
-        policy.condition.create("self-ready")
-    condition = policy.condition["self-ready"]
-    if "self" not in condition.component_type:
-        condition.component_type.create("self")
-    condition.component_type["self"].status = "reached"
-    condition.component_type["self"].plan_state = "ready"
-    condition.component_type["self"].what = "all"
+    desired = {
+        "jeopardy_timeout": root.nano__nano.sla.timeouts.jeopardy * 60,
+        "violation_timeout": root.nano__nano.sla.timeouts.violation * 60,
+    }
+    changes += reconcile(policy, desired, path)
+    desired = {
+        "always_call": True,
+        "action_path": "/nano:nano/nano:sla/nano:timeouts/nano:timeout",
+    }
+    changes += reconcile(policy.action, desired, f"{path}/action")
+    path += "/condition{self-ready}"
+    condition = ensure_entry(policy.condition, "self-ready", path, changes)
+    path += "/component-type{self}"
+    component_type = ensure_entry(condition.component_type, "self", path, changes)
+    desired = {"status": "reached", "plan_state": "ncs:ready", "what": "all"}
+    return changes + reconcile(component_type, desired, path)
 
 
 class InitSPMAction(Action):
     """Action to create or update SPM policy."""
 
     @Action.action
+    @pooled
+    @timed("spm-init")
     def cb_action(
         self,
         uinfo: ncs.UserInfo,
@@ -89,12 +169,18 @@ class InitSPMAction(Action):
         You may return a response via the a_output object.
         Path: /nano/sla/init-sla-policy
         """
-        self.log.info(f"Actionpoint invoked: {name}")
+        log = CallbackLog(self.log, "spm-init")
+        log.info("Actionpoint invoked", name=name, user=uinfo.username)
         with ncs.maapi.single_write_trans(uinfo.username, __name__) as t:
             root = ncs.maagic.get_root(t)
-            update_spm_policy(root)
-            update_kicker(root)
-            t.apply()
+            changes = update_spm_policy(root) + update_kicker(root)
+            # an unchanged policy is not committed, SPM doesn't re-evaluate triggers
+            if changes:
+                t.apply()
+        for change in changes:
+            a_output.change.create(change)
+        log.info("Reconciled", changes=len(changes))
+        log.debug("Changes", changes=changes)
         a_output.result = True
-        a_output.msg = "OK"
+        a_output.msg = f"OK, {len(changes)} changes" if changes else "OK, no changes"
         return ncs.CONFD_OK
@@ -0,0 +1,22 @@
+"""Package state directory."""
+from os import getcwd, makedirs, path
+
+# NSO starts the Python VM in the NSO run directory
+STATE_DIR = path.join(getcwd(), "state", "nano")
+
+
+def state_path(filename: str) -> str:
+    """Return a path of a file in the package state directory.
+
+    Parameters
+    ----------
+    filename : str
+        file or folder name
+
+    Returns
+    -------
+    str
+        an absolute path, the state directory is created if missing
+    """
+    makedirs(STATE_DIR, exist_ok=True)
+    return path.join(STATE_DIR, filename)
@@ -0,0 +1,101 @@
+"""Configuration subscribers.
+
+Note
+----
+Settings kept by the application are applied by a `ReloadSubscriber`:
+it calls a reload function once it is started and after every
+transaction changing its paths. Changes are not inspected, the reload
+function reads the current configuration.
+"""
+from collections.abc import Callable
+from typing import Any
+
+import ncs  # type: ignore
+
+
+class ReloadSubscriber(ncs.cdb.Subscriber):
+    """Reload settings on any change of configuration paths.
+
+    Parameters
+    ----------
+    app : ncs.application.Application
+        application object
+    reload : Callable[[], None]
+        applies the current configuration, handles its own errors
+    paths : str
+        subscription paths
+    """
+
+    def __init__(self, app: Any, reload: Callable[[], None], *paths: str) -> None:
+        self.reload = reload
+        self.paths = paths
+        super().__init__(app=app)
+
+    def init(self) -> None:
+        """Register subscriptions."""
+        for path in self.paths:
+            self.register(path, priority=100)
+
+    def start(self) -> None:
+        """Start the subscriber, then apply the current configuration."""
+        super().start()
+        self.reload()
+
+    def pre_iterate(self) -> list[str]:
+        """Return an initial state.
+
+        Returns
+        -------
+        list[str]
+            changed paths
+        """
+        return []
+
+    def iterate(self, kp: Any, op: int, oldv: Any, newv: Any, state: list[str]) -> int:
+        """Note a change, any change is enough to reload settings.
+
+        Parameters
+        ----------
+        kp : ncs.HKeypathRef
+            changed path
+        op : int
+            operation
+        oldv : Any
+            old value
+        newv : Any
+            new value
+        state : list[str]
+            changed paths
+
+        Returns
+        -------
+        int
+            stop iteration
+        """
+        state.append(str(kp))
+        return ncs.ITER_STOP
+
+    def should_post_iterate(self, state: list[str]) -> bool:
+        """Reload settings only if something is changed.
+
+        Parameters
+        ----------
+        state : list[str]
+            changed paths
+
+        Returns
+        -------
+        bool
+            True if settings are changed
+        """
+        return bool(state)
+
+    def post_iterate(self, state: list[str]) -> None:
+        """Reload settings.
+
+        Parameters
+        ----------
+        state : list[str]
+            changed paths
+        """
+        self.reload()
@@ -20,113 +20,231 @@ versions of IOS NED can run any commands:
 >>> any_cmd.args = ["show version"]
 >>> cmd_output = device.live_status.ios_stats__exec.any(any_cmd).result
 """
-# pylint:disable=too-many-arguments, protected-access
-
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
 import ncs  # type: ignore
-
-# pylint:disable=no-name-in-module
-from genie.libs.parser.iosxe import show_platform  # type: ignore
 from ncs.dp import Action  # type: ignore
 
-# pylint:enable=no-name-in-module
+from .checks import CheckResult, run_suite, suite
+from .health import DeviceHealth, DeviceUnavailable
+from .logs import CallbackLog
+from .metrics import timed
+from .nano_cb import service_devices
+from .pools import pooled
+from .snapshots import SNAPSHOT_TTL, Change, SnapshotStore, diff_outputs
+
+# devices of a multi-device service tested in parallel
+FANOUT_WORKERS = 8
 
 
-def check_cmd_result(output: ncs.maagic.ActionParams, cmd_output: str) -> ncs.maagic.ActionParams:
-    """Check executed command output.
+def set_suite_result(
+    output: ncs.maagic.ActionParams, results: list[tuple[str, CheckResult]]
+) -> ncs.maagic.ActionParams:
+    """Set an aggregated suite result and per-check results.
 
     Parameters
     ----------
     output : ncs.maagic.ActionParams
         output node
-    cmd_output : str
-        raw output of the command
+    results : list[tuple[str, CheckResult]]
+        check names and results
 
     Returns
     -------
     ncs.maagic.ActionParams
         output params with updated status
     """
-    if "NETSIM" in cmd_output:
-        output.result = True
-        output.msg = "Netsim device detected, It's OK, skipping checks."
-        return output
+    output.result = all(check_result.result for _, check_result in results)
+    output.msg = "; ".join(check_result.msg for _, check_result in results)
+    for check_name, check_result in results:
+        check = output.check.create(check_name)
+        check.result = check_result.result
+        check.msg = check_result.msg
+    return output
 
-    parser = show_platform.ShowVersion(show_platform.ShowVersionSchema)
-    show_ver = parser.cli(output=cmd_output)
-    if show_ver["version"]["curr_config_register"] == "0x2102":
-        output.result = True
-        output.msg = "Config register check: PASS"
-        return output
-    output.result = False
-    output.msg = "Config register check: FAILED"
+
+def set_diff(output: ncs.maagic.ActionParams, changes: list[Change]) -> ncs.maagic.ActionParams:
+    """Set pre/post-test differences.
+
+    Parameters
+    ----------
+    output : ncs.maagic.ActionParams
+        output node
+    changes : list[Change]
+        differences
+
+    Returns
+    -------
+    ncs.maagic.ActionParams
+        output params with differences
+    """
+    for change in changes:
+        diff = output.diff.create(change.command, change.item)
+        if change.pre is not None:
+            diff.pre = change.pre
+        if change.post is not None:
+            diff.post = change.post
     return output
 
 
-class PostTestAction(Action):
-    """Run post-test."""
+@dataclass(frozen=True)
+class Stage:
+    """Test stage settings.
 
-    @Action.action
-    def cb_action(
-        self,
-        uinfo: ncs.UserInfo,
-        name: str,
-        kp: ncs.HKeypathRef,
-        a_input: ncs.maagic.ActionParams,
-        a_output: ncs.maagic.ActionParams,
-        trans: ncs.maapi.Transaction,
-    ) -> Any:
-        """Execute an action.
+    Command outputs are stored as snapshots of the stage. If `cached` is
+    set, a fresh snapshot is used instead of running a command again.
+    Commands of `baseline` stages are captured as well, and outputs are
+    compared with snapshots of the `diff_with` stage.
+    """
 
-        Parameters
-        ----------
-        uinfo : ncs.UserInfo
-            a UserInfo object
-        name : str
-            the tailf:action name
-        kp : ncs.HKeypathRef
-            the keypath of the action (HKeypathRef)
-        a_input : ncs.maagic.ActionParams
-            input node
-        a_output : ncs.maagic.ActionParams
-            output node
-        trans : ncs.maapi.Transaction
-            read only transaction, same as action transaction if
-            executed with an action context.
+    name: str
+    cached: bool = False
+    baseline: tuple[str, ...] = ()
+    diff_with: Optional[str] = None
 
-        Returns
-        -------
-        Optional[Union[ncs.CONFD_OK, ncs.CONFD_ERR]]
-        """
-        self.log.info(
-            f"{uinfo=}, {name=}, {kp=}, {str(kp)=}, {a_input=}, {str(a_input)=}, "
-            f"{a_output=}, {str(a_output)=}, {trans=}",
-        )
-
-        with ncs.maapi.single_read_trans("admin", "python") as t:
-            root = ncs.maagic.get_root(t)
-            print(f"{type(root)=}")
-            request = ncs.maagic.get_node(t, kp)
-            device = root.devices.device[request._parent.device]
-            act_input = device.live_status.ios_stats__exec.show.get_input()
-            act_input.args = ["version"]  # 'show version'
-            cmd_output = device.live_status.ios_stats__exec.show(act_input).result
-
-        self.log.info(f"{request=}, {str(request)=}")
-        self.log.info(f"{request._parent.id=}, {request._parent.device=}")
-        self.log.info(f"{cmd_output=}")
-
-        a_output = check_cmd_result(a_output, cmd_output)
-        if a_output.result:
-            return ncs.CONFD_OK
-        return ncs.CONFD_ERR
 
+STAGES = {
+    "pre-test": Stage("pre-test", cached=True, baseline=("post-test",)),
+    "post-test": Stage("post-test", diff_with="pre-test"),
+}
+
+
+@dataclass
+class StageResult:
+    """Results of a test stage of a service."""
+
+    svc_id: str
+    device: str
+    checks: list[tuple[str, CheckResult]]
+    changes: list[Change] = field(default_factory=list)
+
+    @property
+    def result(self) -> bool:
+        """Return True if all checks passed."""
+        return all(check_result.result for _, check_result in self.checks)
+
+    @property
+    def msg(self) -> str:
+        """Return messages of all checks."""
+        return "; ".join(check_result.msg for _, check_result in self.checks)
+
+
+def live_show(device_name: str, command: str) -> str:
+    """Run a `show` command on a device with live-status.
+
+    Parameters
+    ----------
+    device_name : str
+        device name
+    command : str
+        `show` command arguments, e.g. version
+
+    Returns
+    -------
+    str
+        raw output of the command
 
-class PreTestAction(Action):
-    """Run pre-test."""
+    Notes
+    -----
+    Opens its own transaction, so it may run in a worker thread of
+    `DeviceHealth` and be abandoned at a deadline.
+    """
+    with ncs.maapi.single_read_trans("admin", "python") as t:
+        device = ncs.maagic.get_root(t).devices.device[device_name]
+        act_input = device.live_status.ios_stats__exec.show.get_input()
+        act_input.args = command.split()  # e.g. 'show version'
+        return device.live_status.ios_stats__exec.show(act_input).result
+
+
+def run_stage(  # pylint:disable=too-many-arguments
+    snapshots: SnapshotStore,
+    health: DeviceHealth,
+    stage: Stage,
+    svc_id: str,
+    device_name: str,
+    refresh: bool = False,
+) -> StageResult:
+    """Run a test suite of a stage for a service device.
+
+    Parameters
+    ----------
+    snapshots : SnapshotStore
+        snapshot store
+    health : DeviceHealth
+        deadlines and circuit breakers for device calls
+    stage : Stage
+        stage settings
+    svc_id : str
+        service id
+    device_name : str
+        one of service devices
+    refresh : bool
+        ignore fresh snapshots
+
+    Returns
+    -------
+    StageResult
+        check results and differences
+
+    Raises
+    ------
+    DeviceUnavailable
+        If a device call fails, misses the deadline or is short-circuited
+    """
+    cached = stage.cached and not refresh
+    outputs: dict[str, str] = {}
+    with ncs.maapi.single_read_trans("admin", "python") as t:
+        root = ncs.maagic.get_root(t)
+        health.configure(root.nano__nano.device_health)
+        service = root.nano__nano.nano[svc_id]
+        params = {"id": svc_id, "device": device_name, "name_server": service.name_server}
+
+    def run_cmd(command: str) -> str:
+        if command in outputs:
+            return outputs[command]
+        output = None
+        if cached:
+            output = snapshots.get(svc_id, device_name, stage.name, command, ttl=SNAPSHOT_TTL)
+        if output is None:
+            output = health.call(device_name, lambda: live_show(device_name, command))
+            snapshots.put(svc_id, device_name, stage.name, command, output)
+        outputs[command] = output
+        return output
+
+    stage_result = StageResult(svc_id, device_name, run_suite(suite(stage.name), run_cmd, params))
+    for baseline in stage.baseline:
+        for check in suite(baseline):
+            run_cmd(check.command)
+
+    if stage.diff_with is not None:
+        for command, post in outputs.items():
+            pre = snapshots.get(svc_id, device_name, stage.diff_with, command)
+            if pre is not None:
+                stage_result.changes.extend(diff_outputs(command, pre, post))
+    return stage_result
+
+
+class SuiteAction(Action):
+    """Run a test suite of a stage, see `suites.json`."""
+
+    STAGE = ""
+
+    def init(self, init_args: dict[str, Any]) -> None:
+        """Initialize an action.
+
+        Parameters
+        ----------
+        init_args : dict[str, Any]
+            `snapshots` store and device `health`
+        """
+        self.snapshots: SnapshotStore = init_args["snapshots"]
+        self.health: DeviceHealth = init_args["health"]
 
     @Action.action
+    @pooled
+    @timed()
     def cb_action(
         self,
         uinfo: ncs.UserInfo,
@@ -158,24 +276,52 @@ class PreTestAction(Action):
         -------
         Optional[Union[ncs.CONFD_OK, ncs.CONFD_ERR]]
         """
-        self.log.info(
-            f"{uinfo=}, {name=}, {kp=}, {str(kp)=}, {a_input=}, {str(a_input)=}, "
-            f"{a_output=}, {str(a_output)=}, {trans=}",
-        )
-
-        with ncs.maapi.single_read_trans("admin", "python") as t:
-            root = ncs.maagic.get_root(t)
-            request = ncs.maagic.get_node(t, kp)
-            device = root.devices.device[request._parent.device]
-            act_input = device.live_status.ios_stats__exec.show.get_input()
-            act_input.args = ["version"]  # 'show version'
-            cmd_output = device.live_status.ios_stats__exec.show(act_input).result
-
-        self.log.info(f"{request=}, {str(request)=}")
-        self.log.info(f"{request._parent.id=}, {request._parent.device=}")
-        self.log.info(f"{cmd_output=}")
-
-        a_output = check_cmd_result(a_output, cmd_output)
+        stage = STAGES[self.STAGE]
+        log = CallbackLog(self.log, self.STAGE)
+        service = ncs.maagic.get_node(trans, kp)._parent  # pylint:disable=protected-access
+        svc_id = str(service.id)
+        devices = service_devices(ncs.maagic.get_root(trans), service)
+        refresh = bool(a_input.refresh) if stage.cached else False
+        checks: list[tuple[str, CheckResult]] = []
+        changes: list[Change] = []
+        with ThreadPoolExecutor(max_workers=min(len(devices), FANOUT_WORKERS) or 1) as pool:
+            futures = {
+                device: pool.submit(
+                    run_stage, self.snapshots, self.health, stage, svc_id, device, refresh
+                )
+                for device in devices
+            }
+        for device, future in futures.items():
+            # results of many devices are prefixed with a device name
+            prefix = f"{device}/" if len(devices) > 1 else ""
+            try:
+                stage_result = future.result()
+            except DeviceUnavailable as err:
+                log.error(str(err), id=svc_id, device=device)
+                checks.append((f"{prefix}device", CheckResult(False, str(err))))
+                continue
+            log.info("Done", id=svc_id, device=device, result=stage_result.result)
+            log.debug("Checks", id=svc_id, device=device, checks=stage_result.checks)
+            checks.extend((f"{prefix}{name}", result) for name, result in stage_result.checks)
+            changes.extend(
+                Change(f"{prefix}{change.command}", change.item, change.pre, change.post)
+                for change in stage_result.changes
+            )
+        a_output = set_suite_result(a_output, checks)
+        if stage.diff_with is not None:
+            set_diff(a_output, changes)
         if a_output.result:
             return ncs.CONFD_OK
         return ncs.CONFD_ERR
+
+
+class PostTestAction(SuiteAction):
+    """Run post-test and compare outputs with pre-test snapshots."""
+
+    STAGE = "post-test"
+
+
+class PreTestAction(SuiteAction):
+    """Run pre-test, capture a baseline for post-test."""
+
+    STAGE = "pre-test"
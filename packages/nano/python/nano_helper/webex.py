@@ -1,26 +1,22 @@
 """Webex notification action."""
-# pylint:disable=too-many-arguments, protected-access, too-many-locals
-import datetime as dt
-import json
+# pylint:disable=too-many-arguments, too-many-locals
 import re
-from os import environ, path
+from os import environ
 from typing import Any, Optional
 
 import ncs  # type: ignore
-from jinja2 import Environment, FileSystemLoader  # type: ignore
 from ncs.dp import Action  # type: ignore
-from webexteamssdk import WebexTeamsAPI  # type: ignore
 
-SERVICE_KPATH = "/nano:nano/nano{{{}}}"
-SERVICE_XPATH = "/nano:nano/nano[id='{}']"
-TMPL_SUBFOLDER = "templates"
-file_path = path.dirname(path.abspath(__file__))
-tmpl_folder = path.join(file_path, TMPL_SUBFOLDER)
-j2_env = Environment(
-    loader=FileSystemLoader(searchpath=tmpl_folder),
-    autoescape=True,
-    trim_blocks=True,
-)
+from .context import build_context, id_from_xpath
+from .digest import TimeoutDigest
+from .logs import CallbackLog
+from .metrics import timed
+from .pools import pooled
+from .registry import TemplateRegistry
+from .sender import SenderError, WebexSender
+from .settings import WebexSettings
+
+ENV_VAR_RE = re.compile(r"^%ENV{(?P<env_name>[a-zA-Z0-9]+[a-zA-Z0-9_-]*)}$")
 
 
 def _env_var(string: str) -> Optional[str]:
@@ -38,39 +34,16 @@ def _env_var(string: str) -> Optional[str]:
     """
     if not isinstance(string, str):
         string = str(string)
-    pattern = re.compile(r"^%ENV{(?P<env_name>[a-zA-Z0-9]+[a-zA-Z0-9_-]*)}$")
-    match = pattern.fullmatch(string)
+    match = ENV_VAR_RE.fullmatch(string)
     return match.group("env_name") if match else None
 
 
-def _id_from_xpath(string: str) -> Optional[str]:
-    """Return a service id from a given xpath string.
-
-    Parameters
-    ----------
-    string: str
-        String to check
-
-    Returns
-    -------
-    Optional[str]
-        Return env variable name if the pattern is detected
-
-    Notes
-    -----
-    "/nano:nano/nano:nano[nano:id='123']"
-    """
-    pattern = re.compile(r"/nano:nano/nano:nano\[nano:id='(?P<id>[a-zA-Z0-9_-]+)'\]")
-    match = pattern.fullmatch(string)
-    return match.group("id") if match else None
-
-
-def webex_settings() -> dict[str, str]:
+def webex_settings() -> dict[str, Any]:
     """Return webex settings as a dict.
 
     Returns
     -------
-    dict[str, str]
+    dict[str, Any]
         a dictionary with webex settings
 
     Raises
@@ -79,9 +52,11 @@ def webex_settings() -> dict[str, str]:
         In case of missing env variables
     """
     with ncs.maapi.single_read_trans("admin", "python") as t:
-        root = ncs.maagic.get_root(t)
-        bot_token = root.nano__nano.sla.webex.bot_token
-        room_id = root.nano__nano.sla.webex.room_id
+        webex = ncs.maagic.get_root(t).nano__nano.sla.webex
+        bot_token = webex.bot_token
+        room_id = webex.room_id
+        wait_for_delivery = bool(webex.wait_for_delivery)
+        digest_window = int(webex.digest_window)
     try:
         if env_bot_token := _env_var(bot_token):
             bot_token = environ[env_bot_token]
@@ -89,75 +64,34 @@ def webex_settings() -> dict[str, str]:
             room_id = environ[env_room_id]
     except KeyError as err:
         raise ValueError("Error: env variable is not defined.") from err
-    return {"bot_token": bot_token, "room_id": room_id}
-
-
-def get_input_dict(
-    uinfo: ncs.UserInfo,
-    name: str,
-    kp: ncs.HKeypathRef,
-    a_input: ncs.maagic.ActionParams,
-) -> dict[str, str]:
-    """Return a dictionary for given ncs.maagic.ActionParams.
-
-    Parameters
-    ----------
-    uinfo : ncs.UserInfo
-        a UserInfo object
-    name : str
-        name of the invoked service action
-    kp : ncs.HKeypathRef
-        service path
-    a_input : ncs.maagic.ActionParams
-        input node
-
-    Returns
-    -------
-    dict[str, str]
-        a dictionary for given input ncs.maagic.ActionParams
-    """
-    # convert an input to a dictionary
-    params = {elem.split(":")[1]: a_input[elem] for elem in a_input}
-    # add known params
-    params["name"] = name
-    # add extra params from CDB
-    with ncs.maapi.single_read_trans("admin", "python") as t:
-        _path = ncs.maagic.get_node(t, kp)
-    print(f"{_path=}, {str(_path)=}")
-    # add service specific params
-    if name == "notify-approver":  # notify on a new service
-        svc_id = _path._parent.id
-        params["id"] = svc_id
-    if name == "timeout":  # notify on a broken SLA
-        svc_id = _id_from_xpath(a_input.service)
-        params["id"] = svc_id
-    if name in ["notify-approver", "timeout"]:
-        ac_fmt = r"%H:%M %d.%m.%Y"
-        spm_fmt = r"%Y-%m-%dT%H:%M:%S+00:00"
-        with ncs.maapi.single_read_trans(uinfo.username, __name__) as t:
-            svc = ncs.maagic.get_node(t, SERVICE_KPATH.format(svc_id))
-            # expected format: 2021-08-19T23:07:01+00:00
-            jeopardy = svc.service_progress_monitoring.trigger_status[
-                f"nano-spm-{svc_id}"
-            ].jeopardy_time
-            violation = svc.service_progress_monitoring.trigger_status[
-                f"nano-spm-{svc_id}"
-            ].violation_time
-            params["jeopardy_time"] = dt.datetime.strptime(jeopardy, spm_fmt).strftime(ac_fmt)
-            params["violation_time"] = dt.datetime.strptime(violation, spm_fmt).strftime(ac_fmt)
-            # other input params for timeout action: policy, service,
-            # status, timeout, trigger
-    # normalizing to str
-    for k, v in params.items():
-        if isinstance(v, ncs.maagic.Enum):
-            params[k] = str(v)
-    return params
+    return {
+        "bot_token": bot_token,
+        "room_id": room_id,
+        "wait_for_delivery": wait_for_delivery,
+        "digest_window": digest_window,
+    }
 
 
 class SendMsgAction(Action):
     """Send different types of messages via Webex bot."""
 
+    def init(self, init_args: dict[str, Any]) -> None:
+        """Keep references to application-wide services.
+
+        Parameters
+        ----------
+        init_args : dict[str, Any]
+            services created by the application, `sender`, `digest`,
+            `settings` and `templates` are required
+        """
+        self.sender: WebexSender = init_args["sender"]
+        self.settings: WebexSettings = init_args["settings"]
+        self.templates: TemplateRegistry = init_args["templates"]
+        self.digest: TimeoutDigest = init_args["digest"]
+
     @Action.action
+    @pooled
+    @timed("notify")
     def cb_action(
         self,
         uinfo: ncs.UserInfo,
@@ -193,33 +127,32 @@ class SendMsgAction(Action):
         -----
         You may return a response via the a_output object.
         """
-        self.log.info(f"Actionpoint invoked: {name}")
-        self.log.info(
-            f"{uinfo=}, {name=}, {type(name)=}, {kp=}, {str(kp)=}, {a_input=}, {str(a_input)=}, "
-            f"{a_output=}, {str(a_output)=}, {trans=}",
-        )
-
-        self.log.debug(f"{tmpl_folder=}")
-        md_tmpl = j2_env.get_template(f"{name}.md.j2")
-        ac_tmpl = j2_env.get_template(f"{name}-ac.json.j2")
-
-        params = get_input_dict(uinfo, name, kp, a_input)
-        self.log.info(f"{params=}")
-        msg_md = md_tmpl.render(params)
-        msg_ac = ac_tmpl.render(params)
-        self.log.debug(f"{msg_md=}")
-        self.log.debug(f"{msg_ac=}")
-
-        webex = webex_settings()
-        self.log.debug(f"{webex['bot_token'][-10:]=}")
-        self.log.debug(f"{webex['room_id'][-10:]=}")
-
-        api = WebexTeamsAPI(access_token=webex["bot_token"])
-        api.messages.create(
-            roomId=webex["room_id"],
-            markdown=f"{msg_md}",
-            attachments=json.loads(msg_ac)["attachments"],
-        )
+        log = CallbackLog(self.log, "notify")
+        log.info("Actionpoint invoked", name=name, user=uinfo.username)
+        log.debug("Action detail", kp=lambda: str(kp), input=lambda: str(a_input))
+
+        webex = self.settings()
+        if name == "timeout" and webex["digest_window"]:
+            svc_id = id_from_xpath(a_input.service)
+            self.digest.add(str(a_input.timeout), svc_id, webex["digest_window"])
+            a_output.result = True
+            a_output.msg = "OK, added to a digest"
+            return ncs.CONFD_OK  # pylint:disable=no-member
+
+        params = build_context(trans, name, kp, a_input)
+        log.debug("Context", params=params)
+        msg = self.templates.render(name, params)
+        log.debug("Message", markdown=lambda: repr(msg.markdown))
+
+        # a test message is always delivered synchronously to check settings
+        wait = name == "send-test-msg" or webex["wait_for_delivery"]
+        try:
+            self.sender.submit(msg, wait=wait)
+        except SenderError as err:
+            log.error(str(err), name=name)
+            a_output.result = False
+            a_output.msg = str(err)
+            return ncs.CONFD_OK  # pylint:disable=no-member
         a_output.result = True
-        a_output.msg = "OK"
+        a_output.msg = "OK" if wait else "OK, queued"
         return ncs.CONFD_OK  # pylint:disable=no-member
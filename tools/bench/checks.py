@@ -0,0 +1,67 @@
+"""Benchmark `show version` checks: line scanner vs Genie.
+
+Usage: python3 tools/bench/checks.py [CAPTURE ...] [--rounds N]
+
+Runs the fast path and Genie parsing on captured `show version` outputs,
+`tools/captures/*.txt` by default. Genie is skipped if it isn't installed.
+"""
+import argparse
+import glob
+import statistics
+import sys
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.join(path.dirname(__file__), "..", "..", "packages", "nano", "python"))
+
+# pylint:disable=wrong-import-position
+from nano_helper import checks  # noqa: E402
+
+CAPTURES = path.join(path.dirname(__file__), "..", "captures", "show-version-*.txt")
+
+
+def bench(func, rounds):
+    """Return per-call times of a function in microseconds."""
+    times = []
+    for _ in range(rounds):
+        start = perf_counter()
+        func()
+        times.append((perf_counter() - start) * 1e6)
+    return times
+
+
+def main():
+    """Run the benchmark."""
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("captures", nargs="*", default=sorted(glob.glob(CAPTURES)))
+    args.add_argument("--rounds", type=int, default=1000)
+    opts = args.parse_args()
+
+    try:
+        checks.timed_import("genie.libs.parser.iosxe.show_platform")
+        has_genie = True
+    except ImportError:
+        has_genie = False
+        print("Genie is not installed, skipping Genie benchmarks")
+
+    fields = tuple(checks.SHOW_VERSION_FIELDS)
+    print(f"{'capture':<32} {'path':<14} {'p50, us':>10} {'p99, us':>10}  fields")
+    for capture in opts.captures:
+        with open(capture, encoding="utf-8") as cap:
+            output = cap.read()
+        name = path.basename(capture)
+        scanners = [("scanner", lambda: checks.scan_fields(output, fields))]
+        if has_genie and checks.NETSIM_MARKER not in output:
+            scanners.append(("genie", lambda: checks.genie_parse(output)))
+            scanners.append(("genie-pool", lambda: checks.genie_fields(output, fields)))
+        for label, func in scanners:
+            rounds = opts.rounds if label == "scanner" else max(1, opts.rounds // 100)
+            times = sorted(bench(func, rounds))
+            p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+            found = func() if label != "genie" else ""
+            print(f"{name:<32} {label:<14} {statistics.median(times):>10.1f} {p99:>10.1f}  {found}")
+    checks.shutdown()
+
+
+if __name__ == "__main__":
+    main()
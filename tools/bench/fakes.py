@@ -0,0 +1,175 @@
+"""Fake devices and a mock Webex API server."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+# device config leaves rendered by `ncs.template` as IOS lines
+IOS_LINES = {
+    "config/banner/motd": "banner motd ^{}^",
+    "config/ip/domain/list/name": "ip domain list {}",
+    "config/ip/domain/name": "ip domain name {}",
+    "config/ip/name-server/name-server-list/address": "ip name-server {}",
+}
+
+
+class FakeNetwork:
+    """Devices answering `show` commands of live-status with a latency.
+
+    Parameters
+    ----------
+    version : str
+        `show version` output
+    latency : float
+        seconds per command
+    """
+
+    def __init__(self, version: str, latency: float) -> None:
+        self.version = version
+        self.latency = latency
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def running_config(name: str, config: dict[str, list[str]]) -> str:
+        """Return `show running-config` output from rendered templates.
+
+        Parameters
+        ----------
+        name : str
+            device name
+        config : dict[str, list[str]]
+            device config values by leaf paths
+
+        Returns
+        -------
+        str
+            IOS config lines
+        """
+        lines = [f"hostname {name}"]
+        for leaf, values in config.items():
+            if leaf in IOS_LINES:
+                lines.extend(IOS_LINES[leaf].format(value) for value in values)
+        return "\n".join(lines) + "\nend\n"
+
+    def show(self, node: Any, params: Any) -> dict[str, str]:
+        """Handle `live-status exec show`.
+
+        Parameters
+        ----------
+        node : ncs.maagic.Node
+            `live-status/exec` node of a device
+        params : ncs.maagic.ActionParams
+            action input with `args`
+
+        Returns
+        -------
+        dict[str, str]
+            action output
+        """
+        device = node._parent._parent  # pylint:disable=protected-access
+        command = " ".join(params.args)
+        with self._lock:
+            self.commands += 1
+        time.sleep(self.latency)
+        if command == "version":
+            return {"result": self.version}
+        if command == "running-config":
+            return {"result": self.running_config(str(device.name), device.config or {})}
+        return {"result": f"% Invalid input detected: {command}"}
+
+
+class MockWebex:
+    """A local Webex API server accepting messages.
+
+    Parameters
+    ----------
+    latency : float
+        seconds per request
+    rate_limit_every : int
+        answer every N-th request with 429, 0 to disable
+    """
+
+    def __init__(self, latency: float, rate_limit_every: int = 0) -> None:
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.messages = 0
+        self.last_message = 0.0
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Return the API URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def start(self) -> None:
+        """Start the server."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait(self, count: int, timeout: float) -> bool:
+        """Wait for messages.
+
+        Parameters
+        ----------
+        count : int
+            number of accepted messages
+        timeout : float
+            seconds to wait
+
+        Returns
+        -------
+        bool
+            True if all messages are accepted
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self.messages >= count, timeout)
+
+    def _accept(self) -> int:
+        """Count a request, return an HTTP status."""
+        with self._cond:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                return 429
+            self.messages += 1
+            self.last_message = time.monotonic()
+            self._cond.notify_all()
+            return 200
+
+    def _handler(self) -> type:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Messages API handler."""
+
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:  # pylint:disable=invalid-name
+                """Accept a message."""
+                message = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(mock.latency)
+                status = mock._accept()  # pylint:disable=protected-access
+                body = json.dumps({"id": str(mock.messages), "roomId": message.get("roomId")})
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args: Any) -> None:
+                """Don't log requests."""
+
+        return Handler
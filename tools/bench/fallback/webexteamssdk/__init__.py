@@ -0,0 +1,42 @@
+"""Minimal Webex client used when `webexteamssdk` isn't installed.
+
+It implements `WebexTeamsAPI(...).messages.create()` on a keep-alive
+`requests` session and the SDK exceptions used by the sender.
+"""
+from typing import Any
+
+import requests
+
+from .exceptions import ApiError, RateLimitError
+
+DEFAULT_BASE_URL = "https://webexapis.com/v1/"
+
+
+class _Messages:
+    def __init__(self, session: requests.Session, base_url: str) -> None:
+        self._session = session
+        self._url = f"{base_url.rstrip('/')}/messages"
+
+    def create(self, **message: Any) -> dict[str, Any]:
+        """Post a message."""
+        response = self._session.post(self._url, json=message, timeout=60)
+        if response.status_code == 429:
+            raise RateLimitError(response)
+        if response.status_code >= 300:
+            raise ApiError(response)
+        return response.json()
+
+
+class WebexTeamsAPI:
+    """Webex API client."""
+
+    def __init__(
+        self,
+        access_token: str,
+        base_url: str = DEFAULT_BASE_URL,
+        wait_on_rate_limit: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {access_token}"
+        self.messages = _Messages(session, base_url)
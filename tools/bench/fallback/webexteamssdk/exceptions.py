@@ -0,0 +1,19 @@
+"""Webex API errors."""
+from typing import Any
+
+
+class ApiError(Exception):
+    """A request is rejected."""
+
+    def __init__(self, response: Any) -> None:
+        self.response = response
+        self.status_code = response.status_code
+        super().__init__(f"[{response.status_code}] {response.reason}")
+
+
+class RateLimitError(ApiError):
+    """A rate limit is hit."""
+
+    def __init__(self, response: Any) -> None:
+        super().__init__(response)
+        self.retry_after = max(1, int(response.headers.get("Retry-After", 15)))
@@ -0,0 +1,418 @@
+"""Benchmark nano_helper callbacks offline.
+
+Usage: python3 tools/bench/run.py [--services N] [--devices N] [--workers N]
+           [--device-latency MS] [--webex-latency MS] [--maapi-latency MS]
+           [--save FILE] [--baseline FILE] [--tolerance PCT]
+
+Runs synthetic service lifecycles with the real callbacks against an
+in-process stand-in of the `ncs` API (`tools/bench/standin`), fake
+devices answering `show` commands with a latency, and a local mock Webex
+API server. A lifecycle creates a service, runs nano create callbacks of
+both config states, notifies an approver, runs pre and post-tests and
+sends an SLA timeout notification. Throughput and p50/p99 latency are
+reported per callback.
+
+`--save` writes results as JSON; `--baseline` compares results with a
+saved run and exits with 1 if a p99 latency or a throughput is worse by
+more than `--tolerance` percent.
+
+The stand-in has no transaction isolation, validation or XPath, so the
+numbers show the cost of the Python code, not of NSO itself.
+`webexteamssdk` is used if installed, a minimal client otherwise.
+"""
+# pylint:disable=wrong-import-position, import-error, too-many-locals
+import argparse
+import datetime as dt
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from time import monotonic, perf_counter
+from typing import Any
+
+HERE = path.dirname(path.abspath(__file__))
+PACKAGE = path.join(HERE, "..", "..", "packages", "nano")
+sys.path.insert(0, path.join(HERE, "standin"))
+sys.path.insert(1, path.join(PACKAGE, "python"))
+# the real SDK wins if it is installed
+sys.path.append(path.join(HERE, "fallback"))
+
+import ncs  # type: ignore # noqa: E402
+
+from fakes import FakeNetwork, MockWebex  # noqa: E402
+from nano_helper import state  # noqa: E402
+from nano_helper.digest import TimeoutDigest  # noqa: E402
+from nano_helper.health import DeviceHealth  # noqa: E402
+from nano_helper.nano_cb import BANNER_STATE, NAME_SERVER_STATE, TemplateCfg  # noqa: E402
+from nano_helper.outbox import Outbox  # noqa: E402
+from nano_helper.pools import POOLS  # noqa: E402
+from nano_helper.registry import TemplateRegistry  # noqa: E402
+from nano_helper.sender import WebexSender  # noqa: E402
+from nano_helper.settings import WebexSettings  # noqa: E402
+from nano_helper.snapshots import SnapshotStore  # noqa: E402
+from nano_helper.tests import PostTestAction, PreTestAction  # noqa: E402
+from nano_helper.webex import SendMsgAction, webex_settings  # noqa: E402
+from schema import SCHEMA  # noqa: E402
+
+CAPTURE = path.join(HERE, "..", "captures", "show-version-csr1000v.txt")
+CONFIG_COMPONENT = ("nano:cfg-com-type", "config")
+SPM_TRIGGER_NAME = "nano-spm-{}"
+DELIVERY_TIMEOUT = 120
+
+
+class Recorder:
+    """Callback durations and errors."""
+
+    def __init__(self) -> None:
+        self.times: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def call(self, name: str, func: Callable[[], Any], output: Any = None) -> None:
+        """Call a callback, record its duration and outcome.
+
+        Parameters
+        ----------
+        name : str
+            callback name
+        func : Callable[[], Any]
+            callback
+        output : Any
+            action output, a callback fails if its `result` is False
+        """
+        start = perf_counter()
+        try:
+            failed = func() == ncs.CONFD_ERR or (output is not None and not output.result)
+        except Exception:  # pylint:disable=broad-except
+            failed = True
+        elapsed = perf_counter() - start
+        with self._lock:
+            self.times.setdefault(name, []).append(elapsed)
+            self.errors[name] = self.errors.get(name, 0) + failed
+
+    def results(self, wall: float) -> dict[str, dict[str, float]]:
+        """Return per-callback statistics.
+
+        Parameters
+        ----------
+        wall : float
+            run duration in seconds
+
+        Returns
+        -------
+        dict[str, dict[str, float]]
+            calls, errors, throughput and latency in ms by callback name
+        """
+        results = {}
+        for name, times in self.times.items():
+            times = sorted(times)
+            results[name] = {
+                "calls": len(times),
+                "errors": self.errors[name],
+                "per_sec": len(times) / wall,
+                "p50_ms": statistics.median(times) * 1000,
+                "p99_ms": times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+                "max_ms": times[-1] * 1000,
+            }
+        return results
+
+
+def seed(root: Any, devices: int, network: FakeNetwork) -> None:
+    """Fill the datastore with devices and settings.
+
+    Parameters
+    ----------
+    root : ncs.maagic.Root
+        root node
+    devices : int
+        number of devices
+    network : FakeNetwork
+        fake devices
+    """
+    for num in range(devices):
+        root.devices.device.create(f"r{num}")
+    ncs.maagic.ACTION_HANDLERS["show"] = network.show
+    webex = root.nano__nano.sla.webex
+    webex.bot_token = "bench-token"
+    webex.room_id = "bench-room"
+
+
+class Lifecycle:
+    """Callbacks of the package and a service lifecycle.
+
+    Parameters
+    ----------
+    log : ncs.log.Log
+        application logger
+    recorder : Recorder
+        callback statistics
+    devices : int
+        number of devices
+    services : dict[str, Any]
+        application services, `init_args` of actions
+    """
+
+    def __init__(
+        self, log: Any, recorder: Recorder, devices: int, services: dict[str, Any]
+    ) -> None:
+        self.recorder = recorder
+        self.devices = devices
+        self.uinfo = ncs.UserInfo("admin", "system", 0)
+        self.nano = TemplateCfg(log=log)
+        # action points select worker pools, see `nano_helper.pools`
+        self.notify = SendMsgAction(actionpoint="send-msg-action", log=log, init_args=services)
+        self.pre_test = PreTestAction(actionpoint="pre-test-action", log=log, init_args=services)
+        self.post_test = PostTestAction(actionpoint="post-test-action", log=log, init_args=services)
+
+    def create(self, num: int) -> str:
+        """Create a service.
+
+        Parameters
+        ----------
+        num : int
+            service number
+
+        Returns
+        -------
+        str
+            service id
+        """
+        svc_id = f"svc{num}"
+        with ncs.maapi.single_write_trans("admin", "python") as t:
+            service = ncs.maagic.get_root(t).nano__nano.nano.create(svc_id)
+            service.device = f"r{num % self.devices}"
+            service.name_server = f"10.{num // 65536 % 256}.{num // 256 % 256}.{num % 256}"
+            component = service.plan.component.create(*CONFIG_COMPONENT)
+            for plan_state in ("ncs:init", BANNER_STATE, NAME_SERVER_STATE, "ncs:ready"):
+                component.state.create(plan_state).status = "not-reached"
+            trigger = service.service_progress_monitoring.trigger_status.create(
+                SPM_TRIGGER_NAME.format(svc_id)
+            )
+            now = dt.datetime.now(dt.timezone.utc)
+            trigger.jeopardy_time = (now + dt.timedelta(hours=1)).isoformat()
+            trigger.violation_time = (now + dt.timedelta(hours=2)).isoformat()
+            t.apply()
+        return svc_id
+
+    def action(self, cb: Any, name: str, svc_id: str, container: str) -> None:
+        """Invoke an action of a service.
+
+        Parameters
+        ----------
+        cb : ncs.dp.Action
+            action callback
+        name : str
+            action name
+        svc_id : str
+            service id
+        container : str
+            service container of the action, e.g. tests
+        """
+        with ncs.maapi.single_read_trans("admin", "python") as t:
+            node = getattr(ncs.maagic.get_root(t).nano__nano.nano[svc_id], container)
+            action = getattr(node, name.replace("-", "_"))
+            a_input, a_output = action.get_input(), action.get_output()
+            kp = ncs.HKeypathRef(node)
+            self.recorder.call(
+                name, lambda: cb.cb_action(self.uinfo, name, kp, a_input, a_output, t), a_output
+            )
+
+    def timeout(self, svc_id: str) -> None:
+        """Invoke the SLA timeout action.
+
+        Parameters
+        ----------
+        svc_id : str
+            service id
+        """
+        with ncs.maapi.single_read_trans("admin", "python") as t:
+            node = ncs.maagic.get_root(t).nano__nano.sla.timeouts
+            a_input, a_output = node.timeout.get_input(), node.timeout.get_output()
+            a_input.policy = "nano-sla-policy"
+            a_input.service = f"/nano:nano/nano:nano[nano:id='{svc_id}']"
+            a_input.status = ncs.maagic.Enum("not-reached")
+            a_input.timeout = ncs.maagic.Enum("jeopardy")
+            a_input.trigger = SPM_TRIGGER_NAME.format(svc_id)
+            kp = ncs.HKeypathRef(node)
+            self.recorder.call(
+                "timeout",
+                lambda: self.notify.cb_action(self.uinfo, "timeout", kp, a_input, a_output, t),
+                a_output,
+            )
+
+    def run(self, num: int) -> None:
+        """Run a service lifecycle.
+
+        Parameters
+        ----------
+        num : int
+            service number
+        """
+        svc_id = self.create(num)
+        for plan_state in (BANNER_STATE, NAME_SERVER_STATE):
+            with ncs.maapi.single_write_trans("admin", "python") as t:
+                root = ncs.maagic.get_root(t)
+                service = root.nano__nano.nano[svc_id]
+                self.recorder.call(
+                    "nano-create",
+                    lambda: self.nano.cb_nano_create(
+                        None, root, service, service.plan, CONFIG_COMPONENT, plan_state, [], []
+                    ),
+                )
+                t.apply()
+        self.action(self.notify, "notify-approver", svc_id, "notify")
+        self.action(self.pre_test, "pre-test", svc_id, "tests")
+        self.action(self.post_test, "post-test", svc_id, "tests")
+        self.timeout(svc_id)
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Compare results with a baseline.
+
+    Parameters
+    ----------
+    results : dict[str, Any]
+        results of this run
+    baseline : dict[str, Any]
+        saved results
+    tolerance : float
+        allowed degradation, e.g. 0.2
+
+    Returns
+    -------
+    list[str]
+        regressions
+    """
+    regressions = []
+    for name, base in baseline["callbacks"].items():
+        current = results["callbacks"].get(name)
+        if current is None:
+            regressions.append(f"{name}: not run")
+            continue
+        if current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {base['p99_ms']:.1f} -> {current['p99_ms']:.1f} ms")
+        if current["per_sec"] < base["per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {base['per_sec']:.1f} -> {current['per_sec']:.1f}/s"
+            )
+    return regressions
+
+
+def main() -> int:
+    """Run the benchmark."""
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--services", type=int, default=1000, help="service lifecycles")
+    args.add_argument("--devices", type=int, default=10, help="fake devices")
+    args.add_argument("--workers", type=int, default=8, help="concurrent lifecycles")
+    args.add_argument("--device-latency", type=float, default=5, help="ms per show command")
+    args.add_argument("--webex-latency", type=float, default=20, help="ms per Webex request")
+    args.add_argument("--webex-429-every", type=int, default=0, help="rate limit every N-th")
+    args.add_argument("--maapi-latency", type=float, default=0, help="ms per transaction")
+    args.add_argument("--log-level", default="INFO", help="callback log level")
+    args.add_argument("--save", help="save results as JSON")
+    args.add_argument("--baseline", help="compare with saved results")
+    args.add_argument("--tolerance", type=float, default=20, help="allowed degradation, %%")
+    opts = args.parse_args()
+
+    workdir = tempfile.TemporaryDirectory(prefix="nano-bench-")
+    state.STATE_DIR = path.join(workdir.name, "state", "nano")
+    ncs.template.TEMPLATES_DIR = path.join(PACKAGE, "templates")
+    ncs.maapi.LATENCY = opts.maapi_latency / 1000
+    logger = logging.getLogger("nano-bench")
+    logger.setLevel(opts.log_level)
+    logger.addHandler(logging.FileHandler(path.join(workdir.name, "ncs-python-vm-nano.log")))
+    log = ncs.log.Log(logger)
+
+    with open(CAPTURE, encoding="utf-8") as cap:
+        network = FakeNetwork(cap.read(), opts.device_latency / 1000)
+    seed(ncs.maapi.setup(SCHEMA), opts.devices, network)
+    webex = MockWebex(opts.webex_latency / 1000, opts.webex_429_every)
+    webex.start()
+
+    templates = TemplateRegistry()
+    templates.load()
+    outbox = Outbox()
+    sender = WebexSender(log, WebexSettings(webex_settings), outbox, base_url=webex.url)
+    sender.start()
+    services = {
+        "sender": sender,
+        "settings": sender.settings,
+        "templates": templates,
+        "digest": TimeoutDigest(log, templates.render, sender),
+        "snapshots": SnapshotStore(),
+        "health": DeviceHealth(log),
+    }
+    recorder = Recorder()
+    lifecycle = Lifecycle(log, recorder, opts.devices, services)
+
+    print(
+        f"{opts.services} lifecycles, {opts.devices} devices, {opts.workers} workers, "
+        f"work directory {workdir.name}"
+    )
+    start = monotonic()
+    with ThreadPoolExecutor(max_workers=opts.workers, thread_name_prefix="bench") as pool:
+        list(pool.map(lifecycle.run, range(opts.services)))
+    wall = monotonic() - start
+    sent = sum(
+        len(recorder.times[name]) - recorder.errors[name] for name in ("notify-approver", "timeout")
+    )
+    delivered = webex.wait(sent, DELIVERY_TIMEOUT)
+    delivery = webex.last_message - start
+
+    results = {
+        "params": vars(opts),
+        "lifecycles_per_sec": opts.services / wall,
+        "callbacks": recorder.results(wall),
+        "webex": {"messages": webex.messages, "requests": webex.requests, "seconds": delivery},
+        "pools": {
+            pool.name: {
+                "rejected": pool.rejected,
+                "p99_wait_ms": pool.wait.quantile(0.99) * 1000,
+            }
+            for pool in POOLS.snapshot()
+        },
+    }
+    print(
+        f"{'callback':<18} {'calls':>7} {'errors':>7} {'per sec':>9} "
+        f"{'p50, ms':>9} {'p99, ms':>9} {'max, ms':>9}"
+    )
+    for name, res in results["callbacks"].items():
+        print(
+            f"{name:<18} {res['calls']:>7} {res['errors']:>7} {res['per_sec']:>9.1f} "
+            f"{res['p50_ms']:>9.2f} {res['p99_ms']:>9.2f} {res['max_ms']:>9.2f}"
+        )
+    for name, res in results["pools"].items():
+        print(f"pool {name}: {res['rejected']} rejected, p99 wait {res['p99_wait_ms']:.2f}ms")
+    print(
+        f"{opts.services} lifecycles in {wall:.2f}s, {results['lifecycles_per_sec']:.1f}/s; "
+        f"{webex.messages}/{sent} Webex messages delivered in {delivery:.2f}s, "
+        f"{webex.requests} requests, {network.commands} device commands"
+    )
+
+    sender.stop()
+    services["health"].stop()
+    services["snapshots"].close()
+    outbox.close()
+    webex.stop()
+    workdir.cleanup()
+
+    if opts.save:
+        with open(opts.save, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2)
+    status = 0 if delivered else 1
+    if opts.baseline:
+        with open(opts.baseline, encoding="utf-8") as fp:
+            regressions = compare(results, json.load(fp), opts.tolerance / 100)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        status = status or int(bool(regressions))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
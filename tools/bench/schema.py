@@ -0,0 +1,105 @@
+"""Schema of the stand-in datastore.
+
+Only nodes read or written by `nano_helper` callbacks are described, see
+`packages/nano/src/yang/example-nano.yang`.
+"""
+# pylint:disable=import-error
+from ncs.maagic import ActionSchema, Leaf, LeafListSchema, ListSchema  # type: ignore
+
+ACTION_OUTPUT = {"result": Leaf(), "msg": Leaf()}
+TEST_OUTPUT = {**ACTION_OUTPUT, "check": ListSchema(("name",), ACTION_OUTPUT)}
+
+SERVICE = {
+    "device": Leaf(),
+    "devices": LeafListSchema(),
+    "device-group": Leaf(),
+    "name-server": Leaf(),
+    "merged-push": Leaf(False),
+    "commit-queue": Leaf(),
+    "approved": Leaf(False),
+    "notify": {"notify-approver": ActionSchema(output=ACTION_OUTPUT)},
+    "tests": {
+        "pre-test": ActionSchema(input={"refresh": Leaf(False)}, output=TEST_OUTPUT),
+        "post-test": ActionSchema(
+            output={
+                **TEST_OUTPUT,
+                "diff": ListSchema(("command", "item"), {"pre": Leaf(), "post": Leaf()}),
+            }
+        ),
+    },
+    "plan": {
+        "component": ListSchema(
+            ("type", "name"),
+            {
+                "state": ListSchema(
+                    ("name",),
+                    {"status": Leaf(), "when": Leaf(), "post-action-status": Leaf()},
+                )
+            },
+        )
+    },
+    "service-progress-monitoring": {
+        "trigger-status": ListSchema(
+            ("name",), {"jeopardy-time": Leaf(), "violation-time": Leaf()}
+        )
+    },
+}
+
+SCHEMA = {
+    "nano": {
+        "nano": ListSchema(("id",), SERVICE),
+        "device-health": {
+            "call-timeout": Leaf(60),
+            "failure-threshold": Leaf(3),
+            "reset-timeout": Leaf(60),
+            "device": ListSchema(
+                ("name",),
+                {"state": Leaf(), "failures": Leaf(), "last-error": Leaf(), "changed": Leaf()},
+            ),
+        },
+        "sla": {
+            "commit-queue": Leaf(False),
+            "engine": Leaf("spm"),
+            "deadline": ListSchema(
+                ("id",),
+                {"start": Leaf(), "jeopardy": Leaf(), "violation": Leaf(), "status": Leaf()},
+            ),
+            "timeouts": {
+                "jeopardy": Leaf(),
+                "violation": Leaf(),
+                "timeout": ActionSchema(
+                    input={
+                        "policy": Leaf(),
+                        "service": Leaf(),
+                        "status": Leaf(),
+                        "timeout": Leaf(),
+                        "trigger": Leaf(),
+                    },
+                    output=ACTION_OUTPUT,
+                ),
+            },
+            "webex": {
+                "room-id": Leaf(),
+                "bot-token": Leaf(),
+                "wait-for-delivery": Leaf(False),
+                "digest-window": Leaf(0),
+                "send-test-msg": ActionSchema(output=ACTION_OUTPUT),
+            },
+        },
+    },
+    "devices": {
+        "device": ListSchema(
+            ("name",),
+            {
+                # rendered service templates, see `ncs.template`
+                "config": Leaf(),
+                "live-status": {
+                    "exec": {
+                        "show": ActionSchema(input={"args": Leaf()}, output={"result": Leaf()})
+                    }
+                },
+            },
+        ),
+        "device-group": ListSchema(("name",), {"member": LeafListSchema()}),
+    },
+}
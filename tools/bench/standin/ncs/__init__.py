@@ -0,0 +1,56 @@
+"""In-process stand-in of the NSO Python API for benchmarks.
+
+Only the parts used by `nano_helper` are implemented: a schema-driven
+maagic tree in memory, MAAPI transactions, service templates and
+callback base classes. There is no validation, no rollback and no
+transaction isolation, see `tools/bench/run.py`.
+"""
+from dataclasses import dataclass
+from typing import Any
+
+CONFD_OK = 0
+CONFD_ERR = -1
+ITER_STOP = 1
+ITER_RECURSE = 2
+ITER_CONTINUE = 3
+RUNNING = 2
+OPERATIONAL = 4
+MOP_CREATED = 1
+MOP_DELETED = 2
+MOP_MODIFIED = 3
+MOP_VALUE_SET = 4
+
+
+@dataclass
+class UserInfo:
+    """User session of a callback."""
+
+    username: str = "admin"
+    context: str = "system"
+    usid: int = 0
+
+
+class TransCtxRef:
+    """Transaction context of a service callback."""
+
+
+class HKeypathRef:
+    """Keypath of a node, refers to the node itself.
+
+    Parameters
+    ----------
+    node : Any
+        a maagic node
+    """
+
+    def __init__(self, node: Any) -> None:
+        self.node = node
+
+    def __str__(self) -> str:
+        return self.node._path  # pylint:disable=protected-access
+
+
+# pylint:disable=wrong-import-position
+from . import application, cdb, dp, log, maagic, maapi, template  # noqa: E402
+
+__all__ = ["application", "cdb", "dp", "log", "maagic", "maapi", "template"]
@@ -0,0 +1,44 @@
+"""Application and service callback base classes."""
+from collections.abc import Callable
+from typing import Any, Optional
+
+
+class Application:
+    """An application, components are registered but never started."""
+
+    def __init__(self, log: Any = None) -> None:
+        self.log = log
+
+    def register_action(self, actionpoint: str, action_cls: type, init_args: Any = None) -> None:
+        """Register an action."""
+
+    def register_service(self, servicepoint: str, service_cls: type, init_args: Any = None) -> None:
+        """Register a service."""
+
+    def register_nano_service(self, *args: Any) -> None:
+        """Register a nano service."""
+
+
+class NanoService:
+    """A nano service callback."""
+
+    def __init__(
+        self,
+        daemon: Any = None,
+        servicepoint: Optional[str] = None,
+        log: Any = None,
+        init_args: Any = None,
+    ) -> None:
+        self.daemon = daemon
+        self.servicepoint = servicepoint
+        self.log = log
+
+    @staticmethod
+    def create(func: Callable) -> Callable:
+        """Mark a create callback."""
+        return func
+
+    @staticmethod
+    def delete(func: Callable) -> Callable:
+        """Mark a delete callback."""
+        return func
@@ -0,0 +1,29 @@
+"""CDB subscribers, never started."""
+from typing import Any
+
+
+class Subscriber:
+    """A CDB subscriber."""
+
+    def __init__(
+        self, app: Any = None, log: Any = None, host: Any = None, port: Any = None
+    ) -> None:
+        self.app = app
+        self.log = log if log is not None else getattr(app, "log", None)
+        self.init()
+
+    def init(self) -> None:
+        """Register subscriptions."""
+
+    def register(self, path: str, iter_obj: Any = None, priority: int = 0) -> None:
+        """Register a subscription."""
+
+    def start(self) -> None:
+        """Start the subscriber."""
+
+    def stop(self) -> None:
+        """Stop the subscriber."""
+
+
+class OperSubscriber(Subscriber):
+    """An operational data subscriber."""
@@ -0,0 +1,27 @@
+"""Action callback base class."""
+from collections.abc import Callable
+from typing import Any, Optional
+
+
+class Action:
+    """An action callback, `init_args` are passed to `init`."""
+
+    def __init__(
+        self,
+        daemon: Any = None,
+        actionpoint: Optional[str] = None,
+        log: Any = None,
+        init_args: Any = None,
+    ) -> None:
+        self.daemon = daemon
+        self.actionpoint = actionpoint
+        self.log = log
+        self.init(init_args)
+
+    def init(self, init_args: Any) -> None:
+        """Initialize an action."""
+
+    @staticmethod
+    def action(func: Callable) -> Callable:
+        """Mark an action callback."""
+        return func
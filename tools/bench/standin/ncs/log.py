@@ -0,0 +1,19 @@
+"""Application logger."""
+import logging
+from typing import Any
+
+
+class Log:
+    """A wrapper of `logging.Logger`.
+
+    Parameters
+    ----------
+    logobject : logging.Logger
+        a logger
+    """
+
+    def __init__(self, logobject: logging.Logger, *args: Any) -> None:
+        self._logobject = logobject
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._logobject, name)
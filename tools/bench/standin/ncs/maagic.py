@@ -0,0 +1,271 @@
+"""A schema-driven in-memory maagic tree.
+
+A schema is a dict of YANG names: `Leaf` for leaves, a nested dict for
+containers, `ListSchema`, `LeafListSchema` and `ActionSchema`. Python
+names are mapped as in maagic: `nano__nano` is `nano`, `device_health` is
+`device-health`. Unknown names raise `AttributeError`, like maagic does.
+"""
+import threading
+from collections.abc import Callable, Iterator
+from typing import Any, Optional
+
+# pylint:disable=protected-access
+
+# action handlers by action name, `handler(node, input) -> output values`
+ACTION_HANDLERS: dict[str, Callable[["Node", "ActionParams"], dict[str, Any]]] = {}
+
+_lock = threading.Lock()
+
+
+class Leaf:
+    """A leaf schema.
+
+    Parameters
+    ----------
+    default : Any
+        default value
+    """
+
+    def __init__(self, default: Any = None) -> None:
+        self.default = default
+
+
+class ListSchema:
+    """A list schema.
+
+    Parameters
+    ----------
+    keys : tuple[str, ...]
+        key leaves
+    children : dict[str, Any]
+        entry schema, key leaves are added
+    """
+
+    def __init__(self, keys: tuple[str, ...], children: dict[str, Any]) -> None:
+        self.keys = keys
+        self.children = {**{key: Leaf() for key in keys}, **children}
+
+
+class LeafListSchema:
+    """A leaf-list schema."""
+
+
+class ActionSchema:
+    """An action schema.
+
+    Parameters
+    ----------
+    input : dict[str, Any]
+        input schema
+    output : dict[str, Any]
+        output schema
+    """
+
+    def __init__(
+        self, input: Optional[dict[str, Any]] = None, output: Optional[dict[str, Any]] = None
+    ) -> None:  # pylint:disable=redefined-builtin
+        self.input = input or {}
+        self.output = output or {}
+
+
+def yang_name(attr: str) -> str:
+    """Convert a Python name to a YANG name without a prefix."""
+    return attr.rsplit("__", 1)[-1].replace("_", "-")
+
+
+class Enum:
+    """An enumeration value."""
+
+    def __init__(self, string: str) -> None:
+        self.string = string
+
+    def __str__(self) -> str:
+        return self.string
+
+    def __eq__(self, other: object) -> bool:
+        return str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(self.string)
+
+
+class Node:
+    """A container-like node: containers, list entries, action params."""
+
+    def __init__(self, schema: dict[str, Any], path: str, parent: Optional["Node"] = None) -> None:
+        self.__dict__.update(_schema=schema, _path=path, _parent=parent, _values={})
+
+    @property
+    def _root(self) -> "Node":
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    def _spec(self, attr: str) -> tuple[str, Any]:
+        name = yang_name(attr)
+        if name not in self._schema:
+            raise AttributeError(f"{self._path} has no child {name}")
+        return name, self._schema[name]
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        name, spec = self._spec(attr)
+        values = self._values
+        if name in values:
+            return values[name]
+        path = f"{self._path}/{name}"
+        if isinstance(spec, Leaf):
+            return spec.default
+        if isinstance(spec, ActionSchema):
+            return BoundAction(self, name, spec)
+        with _lock:
+            if name not in values:
+                if isinstance(spec, dict):
+                    values[name] = Container(spec, path, self)
+                elif isinstance(spec, ListSchema):
+                    values[name] = List(spec, path, self)
+                else:
+                    values[name] = LeafList()
+            return values[name]
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        name, spec = self._spec(attr)
+        if not isinstance(spec, Leaf):
+            raise AttributeError(f"{self._path}/{name} is not a leaf")
+        self._values[name] = value
+
+    def __str__(self) -> str:
+        return self._path
+
+
+class Container(Node):
+    """A container."""
+
+
+class Root(Container):
+    """A root node.
+
+    Parameters
+    ----------
+    schema : dict[str, Any]
+        top-level schema
+    """
+
+    def __init__(self, schema: dict[str, Any]) -> None:
+        super().__init__(schema, "")
+
+
+class ListElement(Node):
+    """A list entry."""
+
+
+class ActionParams(Node):
+    """Action input or output, iterates over names of set values."""
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(f"nano:{name}" for name in self._values)
+
+    def __getitem__(self, elem: str) -> Any:
+        return self._values[elem.split(":")[-1]]
+
+
+class List:
+    """A keyed list.
+
+    Parameters
+    ----------
+    schema : ListSchema
+        list schema
+    path : str
+        list path
+    parent : Node
+        parent node
+    """
+
+    def __init__(self, schema: ListSchema, path: str, parent: Node) -> None:
+        self._schema = schema
+        self._path = path
+        self._parent = parent
+        self._entries: dict[tuple[str, ...], ListElement] = {}
+
+    @staticmethod
+    def _key(key: Any) -> tuple[str, ...]:
+        return tuple(map(str, key)) if isinstance(key, (tuple, list)) else (str(key),)
+
+    def create(self, *keys: Any) -> ListElement:
+        """Create an entry, return an existing one if it exists."""
+        key = self._key(keys)
+        with _lock:
+            if key not in self._entries:
+                entry = ListElement(self._schema.children, f"{self._path}{{{' '.join(key)}}}")
+                entry.__dict__["_parent"] = self._parent
+                for leaf, value in zip(self._schema.keys, key):
+                    entry._values[leaf] = value
+                self._entries[key] = entry
+            return self._entries[key]
+
+    def delete(self) -> None:
+        """Delete all entries."""
+        with _lock:
+            self._entries.clear()
+
+    def __getitem__(self, key: Any) -> ListElement:
+        return self._entries[self._key(key)]
+
+    def __delitem__(self, key: Any) -> None:
+        with _lock:
+            del self._entries[self._key(key)]
+
+    def __contains__(self, key: Any) -> bool:
+        return self._key(key) in self._entries
+
+    def __iter__(self) -> Iterator[ListElement]:
+        return iter(list(self._entries.values()))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LeafList(list):
+    """A leaf-list."""
+
+    def create(self, value: Any) -> None:
+        """Add a value."""
+        if value not in self:
+            self.append(value)
+
+
+class BoundAction:
+    """An action of a node, calls a handler from `ACTION_HANDLERS`."""
+
+    def __init__(self, node: Node, name: str, schema: ActionSchema) -> None:
+        self.node = node
+        self.name = name
+        self.schema = schema
+
+    def get_input(self) -> ActionParams:
+        """Return an empty input."""
+        return ActionParams(self.schema.input, f"{self.node._path}/{self.name}/input")
+
+    def get_output(self) -> ActionParams:
+        """Return an empty output, NSO passes one to action callbacks."""
+        return ActionParams(self.schema.output, f"{self.node._path}/{self.name}/output")
+
+    def __call__(self, params: Optional[ActionParams] = None) -> ActionParams:
+        output = self.get_output()
+        handler = ACTION_HANDLERS[self.name]
+        for name, value in handler(self.node, params or self.get_input()).items():
+            setattr(output, name, value)
+        return output
+
+
+def get_root(trans: Any) -> Root:
+    """Return the root node of a transaction."""
+    return trans.root
+
+
+def get_node(trans: Any, kp: Any) -> Node:
+    """Return a node by a keypath, see `ncs.HKeypathRef`."""
+    return kp.node
@@ -0,0 +1,90 @@
+"""MAAPI transactions on one shared in-memory tree.
+
+All transactions, running and operational, see the same tree and write
+through immediately. `LATENCY` emulates the round trip of opening a
+transaction and applying it.
+"""
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from . import RUNNING, maagic
+
+# seconds per transaction open and apply
+LATENCY = 0.0
+
+_root: Optional[maagic.Root] = None
+
+
+def setup(schema: dict[str, Any]) -> maagic.Root:
+    """Create an empty datastore.
+
+    Parameters
+    ----------
+    schema : dict[str, Any]
+        top-level schema, see `maagic`
+
+    Returns
+    -------
+    maagic.Root
+        root node of the datastore
+    """
+    global _root  # pylint:disable=global-statement
+    _root = maagic.Root(schema)
+    return _root
+
+
+class Transaction:
+    """A transaction on the shared tree."""
+
+    def __init__(self, db: int = RUNNING) -> None:
+        if _root is None:
+            raise RuntimeError("ncs.maapi.setup() is not called")
+        self.root = _root
+        self.db = db
+
+    def apply(self) -> None:
+        """Apply a transaction, changes are already written."""
+        if LATENCY:
+            time.sleep(LATENCY)
+
+    def xpath_eval(self, *args: Any) -> None:
+        """XPath is not supported."""
+        raise NotImplementedError("XPath is not supported by the stand-in")
+
+
+@contextmanager
+def single_read_trans(
+    user: str, context: str, groups: Any = (), db: int = RUNNING, **kwargs: Any
+) -> Iterator[Transaction]:
+    """Open a read transaction."""
+    if LATENCY:
+        time.sleep(LATENCY)
+    yield Transaction(db)
+
+
+@contextmanager
+def single_write_trans(
+    user: str, context: str, groups: Any = (), db: int = RUNNING, **kwargs: Any
+) -> Iterator[Transaction]:
+    """Open a write transaction."""
+    if LATENCY:
+        time.sleep(LATENCY)
+    yield Transaction(db)
+
+
+class Maapi:
+    """A MAAPI session, CLI output is discarded."""
+
+    def cli_write(self, usid: int, msg: str) -> None:
+        """Write to a CLI session."""
+
+    def close(self) -> None:
+        """Close the session."""
+
+    def __enter__(self) -> "Maapi":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,78 @@
+"""Service templates rendered into device config.
+
+Templates are read from `TEMPLATES_DIR`, `{$VAR}` variables are
+substituted and leaves of every `devices/device` element are merged into
+the `config` leaf of the device entry, a dict of values by slash-separated
+paths, e.g. `config/ip/name-server/name-server-list/address`. Values of a
+path are kept as a list, list entries of many services don't replace each
+other.
+"""
+import re
+import threading
+import xml.etree.ElementTree as ET  # nosec
+from functools import lru_cache
+from os import path
+from typing import Any
+
+TEMPLATES_DIR = "."
+VAR_RE = re.compile(r"\{\$(?P<name>[a-zA-Z0-9_-]+)\}")
+
+_lock = threading.Lock()
+
+
+class Variables(dict):
+    """Template variables."""
+
+    def add(self, name: str, value: Any) -> None:
+        """Add a variable."""
+        self[name] = value
+
+
+@lru_cache(maxsize=None)
+def _load(name: str) -> str:
+    with open(path.join(TEMPLATES_DIR, f"{name}.xml"), encoding="utf-8") as fp:
+        return fp.read()
+
+
+def _tag(elem: ET.Element) -> str:
+    return elem.tag.rsplit("}", 1)[-1]
+
+
+def _leaves(elem: ET.Element, prefix: str) -> dict[str, str]:
+    children = list(elem)
+    if not children:
+        return {prefix: (elem.text or "").strip()}
+    leaves: dict[str, str] = {}
+    for child in children:
+        leaves.update(_leaves(child, f"{prefix}/{_tag(child)}" if prefix else _tag(child)))
+    return leaves
+
+
+class Template:
+    """A service template.
+
+    Parameters
+    ----------
+    node : ncs.maagic.Node
+        service node
+    """
+
+    def __init__(self, node: Any) -> None:
+        self.node = node
+
+    def apply(self, name: str, variables: Any = None) -> None:
+        """Render a template and merge it into device config."""
+        variables = variables or {}
+        text = VAR_RE.sub(lambda m: str(variables.get(m.group("name"), "")), _load(name))
+        devices = self.node._root.devices.device  # pylint:disable=protected-access
+        for elem in ET.fromstring(text).iter():  # nosec
+            if _tag(elem) != "device":
+                continue
+            leaves = _leaves(elem, "")
+            device = devices[leaves.pop("name")]
+            with _lock:
+                config = device.config or {}
+                for leaf, value in leaves.items():
+                    if value not in config.setdefault(leaf, []):
+                        config[leaf].append(value)
+                device.config = config
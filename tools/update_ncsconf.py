@@ -1,38 +1,305 @@
-"""Change default NCS/NSO settings."""
+"""Tune `ncs.conf` settings the nano package depends on.
+
+Usage: python3 tools/update_ncsconf.py [--profile NAME] [--file FILE]
+       [--output FILE] [--dry-run | --check]
+
+Profiles:
+
+- `default` turns off PAM authentication and sets the Cisco-style CLI,
+  `make ncs-setup` applies it.
+- `high-throughput` adds Python VM, commit queue, rollback, CDB, API
+  timeout and log settings for many services in flight.
+
+Old and new values of changed settings are printed, then settings which
+conflict with the nano workload are reported. `--check` changes nothing
+and fails if the file differs from the profile or has conflicts, so
+nodes can be checked against a reviewed profile. Without `--check`
+conflicts are warnings, e.g. the NSO default action timeout of the
+`default` profile doesn't stop `make ncs-setup`.
+"""
+import argparse
+import math
+import re
+import sys
 import xml.etree.ElementTree as ET
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Optional
+
+NS = "http://tail-f.com/yang/tailf-ncs-config"
+DURATION_RE = re.compile(
+    r"^P(?:(?P<d>\d+)D)?(?:T(?:(?P<h>\d+)H)?(?:(?P<m>\d+)M)?(?:(?P<s>\d+(?:\.\d+)?)S)?)?$"
+)
+# the nano workload, see packages/nano/python/nano_helper
+TEST_QUEUE_TIMEOUT = 600  # pre-test and post-test pools, pools.DEFAULT_POOLS
+CALL_TIMEOUT = 60  # a live-status call, health.CALL_TIMEOUT
+
+
+@dataclass(frozen=True)
+class Setting:
+    """A value of a profile."""
+
+    path: str
+    value: str
+    reason: str
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A workload check of a setting."""
+
+    path: str
+    default: str
+    check: Callable[[str], Optional[str]]
+
+
+DEFAULT = (
+    Setting("aaa/pam/enabled", "false", "local users only"),
+    Setting("cli/style", "c", "Cisco-style CLI"),
+)
+PROFILES = {
+    "default": DEFAULT,
+    "high-throughput": DEFAULT
+    + (
+        Setting(
+            "python-vm/start-timeout",
+            "PT120S",
+            "the package subscribes and warms up caches before it reports started",
+        ),
+        Setting(
+            "python-vm/logging/level",
+            "level-info",
+            "debug logs of ncs-python-vm slow down every callback",
+        ),
+        Setting(
+            "api/action-timeout",
+            "PT900S",
+            "tests wait for a worker up to 600s, then run live-status calls",
+        ),
+        Setting(
+            "commit-queue/enabled-by-default",
+            "false",
+            "services use commit queues per /nano/sla/commit-queue, bulk chunks don't",
+        ),
+        Setting("rollback/enabled", "true", "rollback files of bulk chunks stay available"),
+        Setting(
+            "rollback/history-size",
+            "100",
+            "bulk jobs commit a transaction per chunk, old rollback files are dropped",
+        ),
+        Setting(
+            "cdb/client-timeout",
+            "PT300S",
+            "a stuck subscriber doesn't block commits forever",
+        ),
+        Setting("logs/developer-log-level", "info", "no trace output under load"),
+    ),
+}
+
+
+def seconds(duration: str) -> float:
+    """Convert an xs:duration or `infinity` to seconds.
+
+    Parameters
+    ----------
+    duration : str
+        e.g. PT15M
+
+    Returns
+    -------
+    float
+        seconds, math.inf for infinity
+
+    Raises
+    ------
+    ValueError
+        If the value is not a duration
+    """
+    if duration == "infinity":
+        return math.inf
+    match = DURATION_RE.fullmatch(duration)
+    if match is None or duration in ("P", "PT") or duration.endswith("T"):
+        raise ValueError(f"'{duration}' is not a duration")
+    parts = {key: float(value or 0) for key, value in match.groupdict().items()}
+    return parts["d"] * 86400 + parts["h"] * 3600 + parts["m"] * 60 + parts["s"]
+
+
+def _check_action_timeout(value: str) -> Optional[str]:
+    if seconds(value) < TEST_QUEUE_TIMEOUT + CALL_TIMEOUT:
+        return (
+            f"pre-test and post-test may wait {TEST_QUEUE_TIMEOUT}s for a worker and then "
+            f"run {CALL_TIMEOUT}s live-status calls, use at least "
+            f"PT{TEST_QUEUE_TIMEOUT + CALL_TIMEOUT}S"
+        )
+    return None
+
+
+def _check_client_timeout(value: str) -> Optional[str]:
+    if seconds(value) < 60:
+        return "plan subscribers of the package read changed plans, use at least PT60S"
+    return None
+
 
-print("⚙️⚙️⚙️ Tunning 'ncs.conf'")
-
-ns = {"xmlns": "http://tail-f.com/yang/tailf-ncs-config"}
-
-parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
-tree = ET.parse("ncs.conf", parser=parser)
-root = tree.getroot()
-ET.register_namespace("xmlns", "http://tail-f.com/yang/tailf-ncs-config")
-
-# turn off PAM authentication
-pam_enabled = root.find("./xmlns:aaa/xmlns:pam/xmlns:enabled", ns)
-if pam_enabled is not None:
-    print(f"Old settings: {pam_enabled.text.lower()=}")
-pam_enabled.text = "false"
-
-# change CLI to cisco style
-style = root.find("./xmlns:cli/xmlns:style", ns)
-if style is not None:
-    print(f"Old settings: {style.text.lower()=}")
-else:
-    print("'./xmlns:cli/xmlns:style' node doesn't exist, adding...")
-    cli = root.find("./xmlns:cli", ns)
-    style = ET.SubElement(cli, "xmlns:style")
-style.text = "c"
-
-print(f"New settings: {pam_enabled.text=}")
-print(f"New settings: {style.text=}")
-
-tree.write(
-    file_or_filename="ncs.conf",
-    xml_declaration=None,
-    method="xml",
-    short_empty_elements=False,
-    default_namespace=None,
+RULES = (
+    Rule(
+        "python-vm/logging/level",
+        "level-info",
+        lambda value: "debug logs of every callback slow down the Python VM"
+        if value in ("level-debug", "level-trace")
+        else None,
+    ),
+    Rule("api/action-timeout", "PT240S", _check_action_timeout),
+    Rule("cdb/client-timeout", "infinity", _check_client_timeout),
+    Rule(
+        "commit-queue/enabled-by-default",
+        "false",
+        lambda value: "every commit is queued, including bulk chunks and SPM policy updates"
+        if value == "true"
+        else None,
+    ),
+    Rule(
+        "rollback/history-size",
+        "500",
+        lambda value: "a rollback file per bulk chunk, thousands of files are kept"
+        if int(value) > 1000
+        else None,
+    ),
 )
+
+
+def _qname(path: str) -> str:
+    return "/".join(f"{{{NS}}}{name}" for name in path.split("/"))
+
+
+def get_value(root: ET.Element, path: str) -> Optional[str]:
+    """Return a setting value.
+
+    Parameters
+    ----------
+    root : ET.Element
+        ncs-config element
+    path : str
+        setting path, e.g. cli/style
+
+    Returns
+    -------
+    Optional[str]
+        stripped text, None if the element is missing
+    """
+    node = root.find(_qname(path))
+    return (node.text or "").strip() if node is not None else None
+
+
+def set_value(root: ET.Element, path: str, value: str) -> None:
+    """Set a setting value, missing elements are added.
+
+    Parameters
+    ----------
+    root : ET.Element
+        ncs-config element
+    path : str
+        setting path
+    value : str
+        new value
+    """
+    node = root
+    for name in path.split("/"):
+        child = node.find(_qname(name))
+        node = child if child is not None else ET.SubElement(node, f"{{{NS}}}{name}")
+    node.text = value
+
+
+def apply_profile(
+    root: ET.Element, settings: tuple[Setting, ...]
+) -> list[tuple[Setting, Optional[str]]]:
+    """Apply settings.
+
+    Parameters
+    ----------
+    root : ET.Element
+        ncs-config element
+    settings : tuple[Setting, ...]
+        profile settings
+
+    Returns
+    -------
+    list[tuple[Setting, Optional[str]]]
+        changed settings and their old values, None if missing
+    """
+    changes = []
+    for setting in settings:
+        old = get_value(root, setting.path)
+        if old != setting.value:
+            set_value(root, setting.path, setting.value)
+            changes.append((setting, old))
+    return changes
+
+
+def find_conflicts(root: ET.Element) -> list[str]:
+    """Check settings against the nano workload.
+
+    Parameters
+    ----------
+    root : ET.Element
+        ncs-config element
+
+    Returns
+    -------
+    list[str]
+        conflicts, `path = value: reason`
+    """
+    conflicts = []
+    for rule in RULES:
+        value = get_value(root, rule.path)
+        value = rule.default if value is None else value
+        try:
+            reason = rule.check(value)
+        except ValueError as err:
+            reason = f"invalid value, {err}"
+        if reason is not None:
+            conflicts.append(f"{rule.path} = {value}: {reason}")
+    return conflicts
+
+
+def main() -> int:
+    """Tune ncs.conf."""
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--profile", choices=sorted(PROFILES), default="default")
+    args.add_argument("--file", default="ncs.conf", help="ncs.conf to read")
+    args.add_argument("--output", help="file to write, --file by default")
+    mode = args.add_mutually_exclusive_group()
+    mode.add_argument("--dry-run", action="store_true", help="print changes only")
+    mode.add_argument("--check", action="store_true", help="fail if changes are needed")
+    opts = args.parse_args()
+
+    print(f"⚙️⚙️⚙️ Tuning '{opts.file}', profile '{opts.profile}'")
+    ET.register_namespace("", NS)
+    parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    tree = ET.parse(opts.file, parser=parser)
+    root = tree.getroot()
+
+    changes = apply_profile(root, PROFILES[opts.profile])
+    for setting, old in changes:
+        print(f"  {setting.path}: {old if old is not None else '(not set)'} -> {setting.value}")
+        print(f"      {setting.reason}")
+    if not changes:
+        print("  no changes")
+    conflicts = find_conflicts(root)
+    for conflict in conflicts:
+        print(f"{'Conflict' if opts.check else 'Warning'}: {conflict}")
+
+    if opts.check:
+        return int(bool(changes or conflicts))
+    if changes and not opts.dry_run:
+        tree.write(
+            opts.output or opts.file,
+            xml_declaration=None,
+            method="xml",
+            short_empty_elements=False,
+        )
+        print(f"Saved '{opts.output or opts.file}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())